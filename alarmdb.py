@@ -0,0 +1,180 @@
+# Optional SQLite storage for alarms, used instead of the "Alarms" list in
+# config.json when configs["Storage"] is "sqlite". Every alarm is a row, so
+# adding or removing one writes only that row, and startup reads only the
+# alarms that ring soon.
+import json, sqlite3, time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from scheduler import ENABLED, AlarmRecord, compile_rule
+from metrics import Metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alarms (
+    id INTEGER PRIMARY KEY,
+    minute INTEGER NOT NULL,   -- minute of the day of the first ring
+    flags INTEGER NOT NULL,
+    rule TEXT,                 -- rule spec as JSON, NULL for a daily alarm
+    next_fire INTEGER          -- for alarms with a rule: minute since the epoch of the next ring
+);
+-- A daily alarm always next rings at its minute of the day; the others at next_fire.
+CREATE INDEX IF NOT EXISTS alarms_daily ON alarms (minute) WHERE rule IS NULL AND flags & 1;
+CREATE INDEX IF NOT EXISTS alarms_next_fire ON alarms (next_fire) WHERE next_fire IS NOT NULL;
+"""
+
+
+def from_row(row):
+    alarm_id, minute, flags, rule = row
+    return AlarmRecord(alarm_id, minute, flags, compile_rule(minute, json.loads(rule) if rule else None))
+
+
+class AlarmDatabase:
+    # An alarm store backed by an SQLite file. It has the same interface as
+    # scheduler.AlarmStore, but keeps only recently used records in memory;
+    # the id list for row lookups is only read once something asks for it.
+    # How long each commit takes goes into 'metrics' as "commit".
+    def __init__(self, path, cache_size=4096, metrics=None):
+        self.path = path
+        self.metrics = Metrics() if metrics is None else metrics
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.count = self.db.execute("SELECT COUNT(*) FROM alarms").fetchone()[0]
+        self.cache = OrderedDict() # alarm id -> AlarmRecord, least recently used first
+        self.cache_size = cache_size
+        self._ids = None
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        start = time.perf_counter()
+        self.db.commit()
+        self.metrics.since("commit", start)
+
+    def rollback(self):
+        # Undo everything since the last commit.
+        self.db.rollback()
+        self.count = self.db.execute("SELECT COUNT(*) FROM alarms").fetchone()[0]
+        self.cache.clear()
+        self._ids = None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for row in self.db.execute("SELECT id, minute, flags, rule FROM alarms ORDER BY id"):
+            yield from_row(row)
+
+    def __contains__(self, alarm_id):
+        return self.get(alarm_id) is not None
+
+    def __getitem__(self, alarm_id):
+        record = self.get(alarm_id)
+        if record is None:
+            raise KeyError(alarm_id)
+        return record
+
+    def get(self, alarm_id):
+        record = self.cache.get(alarm_id)
+        if record is not None:
+            self.cache.move_to_end(alarm_id)
+            return record
+        row = self.db.execute("SELECT id, minute, flags, rule FROM alarms WHERE id = ?", (alarm_id,)).fetchone()
+        return None if row is None else self.remember(from_row(row))
+
+    def remember(self, record):
+        self.cache[record.id] = record
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    @property
+    def ids(self):
+        # Every id in row order, read on first use.
+        if self._ids is None:
+            self._ids = array("q", (row[0] for row in self.db.execute("SELECT id FROM alarms ORDER BY id")))
+        return self._ids
+
+    def max_id(self):
+        return self.db.execute("SELECT MAX(id) FROM alarms").fetchone()[0] or 0
+
+    def extend(self, records):
+        # Insert AlarmRecords, keyed by their ids, which must be newer than
+        # any stored so far. Call commit() to make the change durable.
+        self.db.executemany("INSERT INTO alarms (id, minute, flags, rule) VALUES (?, ?, ?, ?)",
+                            ((r.id, r.minute, r.flags, json.dumps(r.rule.spec) if r.rule.spec else None)
+                             for r in records))
+        self.count += len(records)
+        if self._ids is not None:
+            self._ids.extend(r.id for r in records)
+        for record in records[-self.cache_size:]:
+            self.remember(record)
+
+    def clear(self):
+        self.db.execute("DELETE FROM alarms")
+        self.count = 0
+        self.cache.clear()
+        self._ids = None
+
+    def updated(self, alarm_id):
+        # Write back the flags of a cached record that was changed in place.
+        record = self[alarm_id]
+        self.db.execute("UPDATE alarms SET flags = ?, next_fire = CASE WHEN ? THEN next_fire END WHERE id = ?",
+                        (record.flags, record.flags & ENABLED, alarm_id))
+
+    def row(self, alarm_id):
+        ids = self.ids
+        row = bisect_left(ids, alarm_id)
+        if row < len(ids) and ids[row] == alarm_id:
+            return row
+        return -1
+
+    def remove(self, alarm_id):
+        # Delete 'alarm_id' and return the row it occupied (or -1 if the id
+        # list hasn't been read).
+        if self.db.execute("DELETE FROM alarms WHERE id = ?", (alarm_id,)).rowcount == 0:
+            raise KeyError(alarm_id)
+        self.count -= 1
+        self.cache.pop(alarm_id, None)
+        row = -1
+        if self._ids is not None:
+            row = self.row(alarm_id)
+            del self._ids[row]
+        return row
+
+    def disable(self, alarm_ids):
+        self.db.executemany("UPDATE alarms SET flags = flags & ?, next_fire = NULL WHERE id = ?",
+                            ((~ENABLED, alarm_id) for alarm_id in alarm_ids))
+        for alarm_id in alarm_ids:
+            self.cache.pop(alarm_id, None)
+
+    def set_next(self, pairs):
+        # Store (next ring timestamp or None, alarm id) pairs for alarms
+        # with a rule; daily alarms are looked up by minute instead.
+        self.db.executemany("UPDATE alarms SET next_fire = ? WHERE id = ? AND rule IS NOT NULL",
+                            ((None if t is None else int(t // 60), alarm_id) for t, alarm_id in pairs))
+
+    def daily_between(self, first, last):
+        # Enabled daily alarms ringing at minutes of the day 'first' to
+        # 'last' inclusive, wrapping past midnight if 'last' < 'first'.
+        query = "SELECT id, minute, flags, rule FROM alarms WHERE rule IS NULL AND flags & 1 AND minute BETWEEN ? AND ?"
+        ranges = [(first, last)] if first <= last else [(first, 1439), (0, last)]
+        for low, high in ranges:
+            for row in self.db.execute(query, (low, high)):
+                yield from_row(row)
+
+    def rules_before(self, end):
+        # Alarms with a rule whose stored next ring is before timestamp 'end'.
+        query = "SELECT id, minute, flags, rule FROM alarms WHERE next_fire IS NOT NULL AND next_fire < ?"
+        for row in self.db.execute(query, (int(end // 60) + 1,)):
+            yield from_row(row)
+
+    def unscheduled_rules(self):
+        # Enabled alarms with a rule but no stored next ring, e.g. just imported.
+        query = "SELECT id, minute, flags, rule FROM alarms WHERE rule IS NOT NULL AND flags & 1 AND next_fire IS NULL"
+        for row in self.db.execute(query):
+            yield from_row(row)
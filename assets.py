@@ -0,0 +1,40 @@
+# The clock app's bundled files: its icons and default alarm sound in
+# data/ next to this module. Every name is resolved against that folder
+# once, never against the working directory, and icons are loaded once and
+# shared by every widget that shows them.
+import functools, os
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# The default alarm sound. The config keeps bundled sounds by name, so the
+# app can be moved or reinstalled elsewhere without losing its sound.
+DEFAULT_SOUND = "sound.wav"
+
+
+@functools.lru_cache(maxsize=None)
+def path(name):
+    # Absolute path of the bundled file 'name'. Absolute paths, such as a
+    # sound the user picked, are returned as they are.
+    return os.path.normpath(os.path.join(DATA, name))
+
+
+def sound_name(chosen):
+    # What the config keeps for the sound file at 'chosen': its name if it
+    # is one of the bundled files, otherwise the path itself.
+    chosen = os.path.normpath(os.path.abspath(chosen))
+    if os.path.dirname(chosen) == DATA:
+        return os.path.basename(chosen)
+    return chosen
+
+
+# Loaded QIcons by name. Qt is only imported by the first icon() call, so
+# the daemon and the engine never load QtGui.
+icons = {}
+
+
+def icon(name):
+    cached = icons.get(name)
+    if cached is None:
+        from PyQt5.QtGui import QIcon
+        cached = icons[name] = QIcon(path(name))
+    return cached
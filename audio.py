@@ -0,0 +1,517 @@
+# Sound loading and playback for alarms and timers.
+import atexit, collections, itertools, os, queue, threading, time
+from collections import OrderedDict
+
+# pygame is slow to import, so it is only imported once audio is first needed.
+pygame = None
+
+
+class AudioError(Exception):
+    # Raised by Player when there is no usable audio device or the file can't be played.
+    pass
+
+
+def load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame
+    return pygame
+
+
+class SoundCache:
+    # Decoded sounds keyed by (path, mtime), evicting the least recently used
+    # ones once their decoded size passes 'budget' bytes. Files are decoded
+    # ahead of time with warm(), so firing an alarm never has to read the disk.
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.used = 0
+        self.entries = OrderedDict() # (path, mtime) -> (sound, size)
+        self.latest = {} # path -> key of its newest decoded version
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sound_size(self, sound):
+        # Bytes of decoded sample data held by 'sound'.
+        frequency, size, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency) * channels * abs(size) // 8
+
+    def load(self, path):
+        # Return the decoded sound for the current contents of 'path',
+        # decoding it again only if the file has changed since last time.
+        load_pygame()
+        key = (path, os.stat(path).st_mtime_ns)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        sound = pygame.mixer.Sound(path)
+        size = self.sound_size(sound)
+        old = self.latest.get(path)
+        if old is not None:
+            self.drop(old)
+        self.entries[key] = (sound, size)
+        self.latest[path] = key
+        self.used += size
+        # Keep at least the newest sound, even if it alone is over budget.
+        while self.used > self.budget and len(self.entries) > 1:
+            self.drop(next(iter(self.entries)))
+        return sound
+
+    def get(self, path):
+        # Memory-only lookup used when a sound has to start right now; falls
+        # back to load() if 'path' was never warmed or has been evicted.
+        key = self.latest.get(path)
+        if key is not None and key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        return self.load(path)
+
+    def warm(self, path):
+        # Decode 'path' ahead of time, ignoring files that can't be loaded yet.
+        try:
+            load_pygame()
+        except ImportError:
+            return
+        try:
+            self.load(path)
+        except (OSError, pygame.error):
+            pass
+
+    def drop(self, key):
+        sound, size = self.entries.pop(key, (None, 0))
+        self.used -= size
+        if self.latest.get(key[0]) == key:
+            del self.latest[key[0]]
+
+
+# Files larger than this are streamed instead of decoded into memory.
+STREAM_THRESHOLD = 4 * 1024 * 1024
+
+
+class Player:
+    # Plays alarm and timer sounds. Short clips come decoded from the cache;
+    # files above 'threshold' bytes are streamed in chunks by pygame.mixer.music,
+    # so a long track never sits fully decoded in RAM.
+    #
+    # Each sound started by play() is a voice under a caller-chosen key, so
+    # several can play at once on separate mixer channels and be stopped or
+    # checked one at a time. There is only one stream, though.
+    def __init__(self, cache, threshold=STREAM_THRESHOLD, channels=8):
+        self.cache = cache
+        self.threshold = threshold
+        self.channels = channels
+        self.streamed = set() # Paths known to be over the threshold.
+        self.loaded = None # Path currently opened by pygame.mixer.music.
+        self.voices = {} # key -> pygame Channel playing it, or None for the stream
+
+    def streams(self, path):
+        if path in self.streamed:
+            return True
+        if os.path.getsize(path) > self.threshold:
+            self.streamed.add(path)
+            return True
+        return False
+
+    def ensure(self):
+        # Open the audio device on first use, or again if suspend() closed it.
+        try:
+            load_pygame()
+        except ImportError as error:
+            raise AudioError(str(error)) from error
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+                pygame.mixer.set_num_channels(self.channels)
+        except pygame.error as error:
+            raise AudioError(str(error)) from error
+
+    def suspend(self):
+        # Close the audio device while nothing is playing; its mixing thread
+        # otherwise keeps waking up to output silence. Decoded sounds survive
+        # this, but the stream has to be opened again.
+        if pygame is not None and pygame.mixer.get_init() and not self.busy():
+            pygame.mixer.quit()
+            self.loaded = None
+            self.voices.clear()
+
+    def warm(self, path):
+        # Get 'path' ready to start instantly: decode it, or open the stream.
+        self.streamed.discard(path)
+        try:
+            self.ensure()
+        except AudioError:
+            return
+        # pygame is loaded from here on.
+        try:
+            if self.streams(path):
+                self.open(path)
+            else:
+                self.cache.load(path)
+        except (OSError, pygame.error):
+            pass
+
+    def open(self, path):
+        if self.loaded != path:
+            pygame.mixer.music.load(path)
+            self.loaded = path
+
+    def can_play(self, path):
+        # Whether play() could start 'path' right now without cutting off
+        # another voice: a mixer channel is free, or for a long file, the stream.
+        self.ensure()
+        if path in self.streamed or path not in self.cache.latest and self.streams(path):
+            return not pygame.mixer.music.get_busy()
+        return pygame.mixer.find_channel() is not None
+
+    def play(self, path, key=None):
+        # Start 'path' as the voice 'key'. Raises FileNotFoundError if 'path'
+        # is missing and AudioError for anything else that stops it playing.
+        self.ensure()
+        try:
+            if path in self.streamed or path not in self.cache.latest and self.streams(path):
+                self.open(path)
+                pygame.mixer.music.play()
+                channel = None
+                # Whatever voice had the stream has just been cut off.
+                for other in [k for k, c in self.voices.items() if c is None]:
+                    del self.voices[other]
+            else:
+                channel = self.cache.get(path).play()
+                if channel is None:
+                    raise AudioError("all mixer channels are in use")
+        except pygame.error as error:
+            raise AudioError(str(error)) from error
+        self.voices[key] = channel
+
+    def playing(self, key):
+        # Whether the voice 'key' is still sounding; finished ones are forgotten.
+        if key not in self.voices:
+            return False
+        channel = self.voices[key]
+        if pygame.mixer.get_init() and (pygame.mixer.music.get_busy() if channel is None else channel.get_busy()):
+            return True
+        del self.voices[key]
+        return False
+
+    def stop(self, key=None):
+        # Stop the voice 'key', or everything if no key is given.
+        if pygame is None or not pygame.mixer.get_init():
+            self.voices.clear()
+        elif key is None:
+            pygame.mixer.stop()
+            pygame.mixer.music.stop()
+            self.voices.clear()
+        elif key in self.voices:
+            channel = self.voices.pop(key)
+            if channel is None:
+                pygame.mixer.music.stop()
+            else:
+                channel.stop()
+
+    def busy(self):
+        return pygame is not None and bool(pygame.mixer.get_init()) and (pygame.mixer.get_busy() or pygame.mixer.music.get_busy())
+
+    def close(self):
+        # Stop everything and close the audio device.
+        self.stop()
+        if pygame is not None and pygame.mixer.get_init():
+            pygame.mixer.quit()
+        self.loaded = None
+
+    def set_volume(self, key, volume):
+        # Set the voice 'key' to 'volume', from 0 to 1, if it is still sounding.
+        if key in self.voices and pygame.mixer.get_init():
+            channel = self.voices[key]
+            if channel is None:
+                pygame.mixer.music.set_volume(volume)
+            else:
+                channel.set_volume(volume)
+
+
+# Seconds between the audio worker's checks on what is still sounding, and
+# between the steps of a volume ramp.
+CHECK = 0.1
+RAMP_STEP = 0.05
+
+# A cued sound's file is decoded this many seconds before it is due.
+PRELOAD = 10
+
+# A cue is skipped if the wall clock is this many seconds away from its
+# deadline when it comes due: the clock was changed or the machine slept,
+# so the engine decides what rings when it next polls.
+CUE_SLACK = 2
+
+# Seconds a cued voice is remembered after it started, so the engine's own
+# play() of that occurrence doesn't start it a second time.
+CUE_MEMORY = 300
+
+
+class AudioWorker:
+    # Runs a Player on its own thread, so neither decoding nor playing a
+    # sound ever waits on the GUI thread, and the GUI never waits on audio.
+    # It has the Player's methods, but they only queue a command and return:
+    # play(), stop(), warm() (preload), suspend() and ramp() (volume).
+    #
+    # Errors surface later, as ("missing", path) or ("failed", message)
+    # reports collected by reports(); 'on_report', if set, is called from
+    # the worker's thread each time there is a new one, to wake the loop
+    # that should collect them.
+    #
+    # cue() hands over the next rings ahead of time with their deadlines.
+    # The worker starts a cued sound on its own clock, so it rings on time
+    # even while the engine's event loop is stalled; the engine's play() of
+    # that occurrence then finds it already sounding. Every play goes into
+    # 'metrics' as "sound start": milliseconds from the play() call, or
+    # from the cue's deadline, to the sound starting. 'now' and 'monotonic'
+    # are the clocks cues are given in, as for the Engine.
+    def __init__(self, player, metrics=None, fade=0, now=time.time, monotonic=time.monotonic):
+        self.player = player
+        self.metrics = metrics
+        self.now = now
+        self.monotonic = monotonic
+        self.fade = fade # seconds each sound fades in over, or 0
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        self.voices = {} # key -> generation, for each voice sounding or about to
+        self.stream = None # (key, generation) of the voice on the Player's stream
+        self.generations = itertools.count()
+        self.report_queue = collections.deque()
+        self.on_report = None
+        # Only used on the worker's thread:
+        self.started = {} # key -> generation, voices the Player has started
+        self.cues = {} # key -> (path, monotonic deadline, wall deadline or None)
+        self.fired = {} # key -> monotonic time, cued voices started early
+        self.ramps = {} # key -> (start time, seconds, from volume, to volume)
+        self.volumes = {} # key -> volume, for voices not at full volume
+        self.thread = threading.Thread(target=self.run, name="audio", daemon=True)
+        self.thread.start()
+
+    # The Player's interface, as seen by the Dispatcher and the engine.
+
+    def can_play(self, path):
+        # Like the Player: a channel is free, and for a long file, the stream.
+        streams = self.streams(path)
+        with self.lock:
+            return len(self.voices) < self.player.channels and (not streams or self.stream_free())
+
+    def play(self, path, key=None):
+        streams = self.streams(path)
+        with self.lock:
+            generation = self.voices[key] = next(self.generations)
+            if streams:
+                self.stream = (key, generation)
+        self.commands.put(("play", path, key, generation, self.monotonic()))
+
+    def playing(self, key):
+        with self.lock:
+            return key in self.voices
+
+    def busy(self):
+        with self.lock:
+            return bool(self.voices)
+
+    def stop(self, key=None):
+        with self.lock:
+            if key is None:
+                self.voices.clear()
+            else:
+                self.voices.pop(key, None)
+        self.commands.put(("stop", key))
+
+    def warm(self, path):
+        self.commands.put(("preload", path))
+
+    def suspend(self):
+        self.commands.put(("suspend",))
+
+    def ramp(self, key, volume, seconds):
+        # Move the voice 'key' to 'volume' (0 to 1) over 'seconds'.
+        self.commands.put(("ramp", key, volume, seconds))
+
+    def cue(self, cues):
+        # Replace the pending cues with 'cues', (key, path, monotonic
+        # deadline, wall clock deadline or None) tuples.
+        self.commands.put(("cue", cues))
+
+    def reports(self):
+        # Take the ("missing" or "failed", detail) pairs reported so far.
+        reports = []
+        while self.report_queue:
+            reports.append(self.report_queue.popleft())
+        return reports
+
+    def close(self):
+        if self.thread.is_alive():
+            self.commands.put(("close",))
+            self.thread.join()
+
+    def streams(self, path):
+        # Whether 'path' plays on the Player's one stream. A missing file
+        # counts as not, and is reported when the worker tries to play it.
+        try:
+            return self.player.streams(path)
+        except OSError:
+            return False
+
+    def stream_free(self):
+        # With the lock held: whether no voice has the stream.
+        if self.stream is not None and self.voices.get(self.stream[0]) != self.stream[1]:
+            self.stream = None
+        return self.stream is None
+
+    # The worker's thread.
+
+    def report(self, event, detail):
+        self.report_queue.append((event, detail))
+        if self.on_report is not None:
+            self.on_report()
+
+    def timeout(self, now):
+        # Seconds until the worker next has something to do by itself.
+        times = [at - PRELOAD if not warmed else at for _, at, _, warmed in self.cues.values()]
+        if self.ramps:
+            times.append(now + RAMP_STEP)
+        elif self.started:
+            times.append(now + CHECK)
+        if self.fired:
+            times.append(min(self.fired.values()) + CUE_MEMORY)
+        return max(0.0, min(times) - now) if times else None
+
+    def run(self):
+        hooked = False
+        while True:
+            try:
+                command = self.commands.get(timeout=self.timeout(self.monotonic()))
+            except queue.Empty:
+                command = None
+            if command is not None:
+                if command[0] == "close":
+                    self.player.close()
+                    return
+                try:
+                    getattr(self, "do_" + command[0])(*command[1:])
+                except Exception as error:
+                    # Report it and keep going, so later sounds still play;
+                    # a play that failed frees its voice.
+                    if command[0] == "play":
+                        self.forget(command[2], command[3])
+                    self.report("failed", f"{type(error).__name__}: {error}")
+            if pygame is not None and not hooked:
+                # pygame.quit() hangs at exit if the device is still open on
+                # this thread, so close it here first. Registered after
+                # pygame's own exit hook, this one runs before it.
+                atexit.register(self.close)
+                hooked = True
+            now = self.monotonic()
+            try:
+                self.fire_cues(now)
+                self.step_ramps(now)
+                self.check_voices(now)
+            except Exception as error:
+                self.report("failed", f"{type(error).__name__}: {error}")
+
+    def start(self, path, key, generation, requested):
+        # Start 'path' on the Player as the voice 'key'.
+        try:
+            self.player.play(path, key)
+        except FileNotFoundError:
+            self.forget(key, generation)
+            self.report("missing", path)
+            return
+        except AudioError as error:
+            self.forget(key, generation)
+            self.report("failed", str(error))
+            return
+        self.started[key] = generation
+        if self.metrics is not None:
+            self.metrics.record("sound start", (self.monotonic() - requested) * 1000)
+        if self.fade:
+            self.player.set_volume(key, 0)
+            self.volumes[key] = 0.0
+            self.do_ramp(key, 1.0, self.fade)
+
+    def forget(self, key, generation):
+        # The voice 'key' has ended, unless it has since been played again.
+        with self.lock:
+            if self.voices.get(key) == generation:
+                del self.voices[key]
+
+    def do_play(self, path, key, generation, requested):
+        if self.fired.pop(key, None) is not None:
+            # Already started from its cue; keep it under the new generation.
+            if key in self.started:
+                self.started[key] = generation
+            else:
+                self.forget(key, generation)
+            return
+        self.cues.pop(key, None)
+        self.start(path, key, generation, requested)
+
+    def do_stop(self, key):
+        if key is None:
+            self.player.stop()
+            self.started.clear()
+            self.cues.clear()
+            self.fired.clear()
+            self.ramps.clear()
+            self.volumes.clear()
+        else:
+            self.player.stop(key)
+            for pending in (self.started, self.cues, self.fired, self.ramps, self.volumes):
+                pending.pop(key, None)
+
+    def do_preload(self, path):
+        self.player.warm(path)
+
+    def do_suspend(self):
+        if not self.started:
+            self.player.suspend()
+
+    def do_ramp(self, key, volume, seconds):
+        if key in self.started:
+            self.ramps[key] = (self.monotonic(), max(seconds, RAMP_STEP), self.volumes.get(key, 1.0), volume)
+
+    def do_cue(self, cues):
+        self.cues = {key: (path, at, wall, False) for key, path, at, wall in cues}
+
+    def fire_cues(self, now):
+        for key, (path, at, wall, warmed) in list(self.cues.items()):
+            if now >= at:
+                del self.cues[key]
+                if wall is not None and abs(self.now() - wall) > CUE_SLACK:
+                    continue
+                streams = self.streams(path)
+                with self.lock:
+                    if key in self.voices:
+                        continue # Still sounding from before; the engine decides.
+                    if streams and not self.stream_free():
+                        continue # Another voice has the stream; it waits in the engine.
+                    generation = self.voices[key] = next(self.generations)
+                    if streams:
+                        self.stream = (key, generation)
+                self.fired[key] = now
+                self.start(path, key, generation, at)
+            elif not warmed and now >= at - PRELOAD:
+                self.player.warm(path)
+                self.cues[key] = (path, at, wall, True)
+        for key in [key for key, at in self.fired.items() if now - at > CUE_MEMORY]:
+            del self.fired[key]
+
+    def step_ramps(self, now):
+        for key, (start, seconds, first, last) in list(self.ramps.items()):
+            progress = min(1.0, (now - start) / seconds)
+            volume = self.volumes[key] = first + (last - first) * progress
+            self.player.set_volume(key, volume)
+            if progress >= 1:
+                del self.ramps[key]
+                if volume >= 1:
+                    del self.volumes[key]
+
+    def check_voices(self, now):
+        for key, generation in list(self.started.items()):
+            if not self.player.playing(key):
+                del self.started[key]
+                self.ramps.pop(key, None)
+                self.volumes.pop(key, None)
+                self.forget(key, generation)
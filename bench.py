@@ -0,0 +1,859 @@
+# Benchmarks for the clock app's hot paths.
+# Run with: python bench.py <name> [options]   (python bench.py -h lists them)
+import argparse, datetime, json, os, random, subprocess, sys, tempfile, time
+
+import scheduler
+from scheduler import ENABLED, AlarmRecord, AlarmSchedule, Countdowns, compile_rule
+
+
+def random_alarms(n, seed=0):
+    # Alarms in the version 1 config format: (["HH", "MM"], "AM"/"PM").
+    rng = random.Random(seed)
+    return [([f"{rng.randint(1, 12):02}", f"{rng.randint(0, 59):02}"], rng.choice(["AM", "PM"])) for _ in range(n)]
+
+
+def random_records(n, seed=0):
+    rng = random.Random(seed)
+    return [AlarmRecord(i, rng.randrange(1440)) for i in range(1, n + 1)]
+
+
+def random_rule_records(n, seed=0, today=None):
+    # AlarmRecords with an even mix of daily alarms, weekday masks,
+    # every-N-minute repeats, date ranges and one-shot dates around 'today'.
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    day = lambda low, high: (today + datetime.timedelta(rng.randrange(low, high))).isoformat()
+    records = []
+    for i in range(1, n + 1):
+        minute = rng.randrange(1440)
+        kind = i % 5
+        if kind == 0:
+            spec = {}
+        elif kind == 1:
+            spec = {"days": rng.randrange(1, 128)}
+        elif kind == 2:
+            spec = {"every": rng.choice([5, 10, 15, 30, 60]), "until": rng.randrange(minute, min(1440, minute + 240))}
+        elif kind == 3:
+            spec = {"from": day(-3, 2), "to": day(2, 10)}
+        else:
+            spec = {"on": day(0, 5)}
+        records.append(AlarmRecord(i, minute, ENABLED, compile_rule(minute, spec)))
+    return records
+
+
+def legacy_tick(times):
+    # The old per-second Alarm.count loop, minus the actual playback.
+    fired = 0
+    for alarm_time, meridiem in times:
+        current_hour = int(time.strftime("%I"))
+        current_minute = int(time.strftime("%M"))
+        current_meridiem = time.strftime("%p")
+        if current_meridiem == meridiem and current_hour == int(alarm_time[0]) and current_minute == int(alarm_time[1]):
+            fired += 1
+    return fired
+
+
+def schedule_tick(schedule):
+    # What a tick costs now: look at the earliest deadline and pop what is due.
+    schedule.pop_due()
+    return schedule.next_deadline()
+
+
+def per_call(func, arg, budget=0.2):
+    # Average seconds per call, repeating until 'budget' seconds have passed.
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func(arg)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / calls
+
+
+def summary(values, unit=1e3, suffix="ms"):
+    # p50/p99/max of a list of seconds, formatted in 'suffix' units.
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"p50 {pick(0.5) * unit:.2f}{suffix}  p99 {pick(0.99) * unit:.2f}{suffix}  max {values[-1] * unit:.2f}{suffix}"
+
+
+def bench_alarms(args):
+    print(f"{'alarms':>8} {'legacy tick':>14} {'heap tick':>12} {'heap add':>12}")
+    for n in args.sizes:
+        times = random_alarms(n)
+        records = random_records(n)
+        schedule = AlarmSchedule()
+        start = time.perf_counter()
+        for record in records:
+            schedule.add(record.id, record.minute)
+        add = (time.perf_counter() - start) / n
+        legacy = per_call(legacy_tick, times) if n <= args.legacy_limit else float("nan")
+        heap = per_call(schedule_tick, schedule)
+        print(f"{n:>8} {legacy * 1e6:>12.1f}us {heap * 1e6:>10.2f}us {add * 1e6:>10.2f}us")
+
+
+def bench_countdown(args):
+    # Runs real countdowns on a Qt event loop that is stalled at random, and
+    # compares finishing lateness of the deadline engine with the old
+    # decrement-per-tick countdown.
+    from PyQt5.QtCore import QCoreApplication, QTimer, Qt
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    rng = random.Random(0)
+    countdowns = Countdowns()
+    deadlines = {}
+    late = []
+    legacy = {"left": int(args.seconds), "end": time.monotonic() + args.seconds, "late": None}
+
+    expiry = QTimer()
+    expiry.setSingleShot(True)
+    expiry.setTimerType(Qt.PreciseTimer)
+
+    def arm():
+        deadline = countdowns.next_deadline()
+        if deadline is not None:
+            expiry.start(max(0, int((deadline - time.monotonic()) * 1000)))
+        elif legacy["late"] is not None:
+            app.quit()
+
+    def expire():
+        now = time.monotonic()
+        for name in countdowns.pop_expired(now):
+            late.append(now - deadlines[name])
+        arm()
+
+    def legacy_tick():
+        # The old Timer.update_label: count down once per timeout.
+        if legacy["left"] > 0:
+            legacy["left"] -= 1
+        else:
+            tick.stop()
+            legacy["late"] = time.monotonic() - legacy["end"]
+            if not countdowns:
+                app.quit()
+
+    def stall():
+        time.sleep(rng.uniform(0, args.stall_ms) / 1000)
+
+    for i in range(args.timers):
+        name = f"t{i}"
+        deadlines[name] = countdowns.start(name, args.seconds * (i + 1) / args.timers)
+    expiry.timeout.connect(expire)
+    tick = QTimer()
+    tick.timeout.connect(legacy_tick)
+    stalls = QTimer()
+    stalls.timeout.connect(stall)
+    arm()
+    tick.start(1000)
+    stalls.start(int(args.stall_every * 1000))
+    app.exec_()
+
+    print(f"{args.timers} countdowns over {args.seconds:.0f}s, stalls up to {args.stall_ms}ms every {args.stall_every}s")
+    print(f"deadline engine lateness: {summary(late)}")
+    print(f"legacy tick countdown lateness: {legacy['late'] * 1e3:.2f}ms")
+
+
+def bench_sound(args):
+    # Trigger-to-play latency: decoding the file on every trigger, as the app
+    # used to, against fetching the pre-decoded sound from the cache.
+    import pygame
+    from audio import SoundCache
+
+    pygame.mixer.init()
+    cold, cached = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        pygame.mixer.Sound(args.path).play()
+        cold.append(time.perf_counter() - start)
+        pygame.mixer.stop()
+    cache = SoundCache()
+    cache.warm(args.path)
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        cache.get(args.path).play()
+        cached.append(time.perf_counter() - start)
+        pygame.mixer.stop()
+    print(f"decode on trigger: {summary(cold)}")
+    print(f"cached sound:      {summary(cached)}")
+
+
+def bench_audio(args):
+    # Countdown-to-sound latency while the engine's loop is blocked across
+    # the deadline, for a Player called on the loop's own thread against the
+    # audio worker with its cues. Each trial cues a countdown as a driver
+    # re-arming would, blocks for the lead time plus a random stall, then
+    # polls. Latency is from the deadline to the Player starting the sound.
+    from audio import AudioWorker, Player, SoundCache
+    from engine import Engine
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    class TimedPlayer(Player):
+        def play(self, path, key=None):
+            super().play(path, key)
+            started.append(time.monotonic())
+
+    rng = random.Random(0)
+    for label, threaded in (("loop thread", False), ("audio worker", True)):
+        player = TimedPlayer(SoundCache())
+        if threaded:
+            player = AudioWorker(player)
+        with tempfile.TemporaryDirectory() as folder:
+            engine = Engine(folder, player=player)
+            engine.load()
+            player.warm(engine.sound())
+            for stall_ms in (0, args.stall_ms):
+                late = []
+                for _ in range(args.repeat):
+                    started = []
+                    engine.start_timer("bench", args.lead)
+                    deadline = engine.countdowns.deadlines["bench"]
+                    engine.cue()
+                    time.sleep(args.lead + rng.uniform(0.5, 1) * stall_ms / 1000)
+                    engine.poll()
+                    while not started and time.monotonic() < deadline + 5:
+                        time.sleep(0.001)
+                    late.append(started[0] - deadline)
+                    engine.stop()
+                print(f"{label:>12}, {stall_ms:>4}ms stalls: {summary(late)}")
+            engine.close()
+
+
+def write_long_wav(path, seconds):
+    # A 44.1kHz stereo 16-bit tone, large enough to cross the streaming threshold.
+    import array, math, wave
+
+    rate = 44100
+    period = array.array("h")
+    for i in range(rate // 441):
+        sample = int(8000 * math.sin(2 * math.pi * i / (rate // 441)))
+        period.extend((sample, sample))
+    second = period * 441
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        for _ in range(int(seconds)):
+            f.writeframes(second.tobytes())
+
+
+def bench_stream(args):
+    # Peak RSS of playing a long file decoded in memory against streaming it.
+    # Each path runs in a fresh interpreter so the numbers don't mix.
+    import resource
+
+    if args.child:
+        import pygame
+        from audio import Player, SoundCache
+
+        pygame.mixer.init()
+        player = Player(SoundCache(budget=1 << 40), threshold=0 if args.child == "stream" else 1 << 40)
+        start = time.perf_counter()
+        player.warm(args.path)
+        player.play(args.path)
+        ready = time.perf_counter() - start
+        time.sleep(0.5)
+        player.stop()
+        # ru_maxrss is in kilobytes on Linux.
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ready)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "long.wav")
+        write_long_wav(path, args.seconds)
+        print(f"{args.seconds:.0f}s track, {os.path.getsize(path) / 2**20:.1f} MB on disk")
+        for mode in ("memory", "stream"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "stream", "--child", mode, "--path", path],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            print(f"{mode:>7}: peak RSS {int(out[-2]) / 1024:.1f} MB, ready to play in {float(out[-1]) * 1e3:.1f}ms")
+
+
+def bench_persist(args):
+    # GUI-thread time spent per alarm add: the old synchronous json.dump
+    # against handing the change to the background ConfigWriter.
+    from storage import ConfigWriter
+
+    print(f"{'alarms':>8} {'sync dump':>12} {'writer.save':>12} {'writes':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "config.json")
+        for n in args.sizes:
+            configs = {"Alarms": random_records(n), "Sound": "sound.wav", "Theme": "dark"}
+            extra = random_records(args.mutations, seed=1)
+
+            start = time.perf_counter()
+            for alarm in extra[:max(1, args.mutations // 10)]:
+                configs["Alarms"].append(alarm)
+                with open(path, "w") as f:
+                    json.dump(configs, f, indent=2, default=AlarmRecord.to_config)
+            sync = (time.perf_counter() - start) / max(1, args.mutations // 10)
+
+            writer = ConfigWriter(path)
+            start = time.perf_counter()
+            for alarm in extra:
+                configs["Alarms"].append(alarm)
+                writer.save(configs)
+            background = (time.perf_counter() - start) / args.mutations
+            writer.close()
+            print(f"{n:>8} {sync * 1e3:>10.2f}ms {background * 1e6:>10.2f}us {writer.writes:>8}")
+
+
+def bench_alarmlist(args):
+    # Cost of loading and deleting alarms in the old clear-and-repopulate
+    # QListWidget against the AlarmModel-backed QListView.
+    from PyQt5.QtWidgets import QApplication, QListView, QListWidget
+    from index import AlarmModel
+    from scheduler import AlarmStore
+
+    app = QApplication.instance() or QApplication([])
+    times = random_alarms(args.alarms)
+    label = lambda alarm: f"{':'.join(alarm[0])} {alarm[1]}"
+
+    widget = QListWidget()
+    widget.show()
+    start = time.perf_counter()
+    for alarm in times:
+        widget.addItem(label(alarm))
+    app.processEvents()
+    legacy_load = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.deletes):
+        del times[len(times) // 2]
+        widget.clear()
+        for alarm in times:
+            widget.addItem(label(alarm))
+        app.processEvents()
+    legacy_delete = (time.perf_counter() - start) / args.deletes
+
+    model = AlarmModel(AlarmStore())
+    view = QListView()
+    view.setUniformItemSizes(True)
+    view.setLayoutMode(QListView.Batched)
+    view.setModel(model)
+    view.show()
+    start = time.perf_counter()
+    model.extend(random_records(args.alarms))
+    app.processEvents()
+    model_load = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.deletes):
+        model.remove(model.store.ids[len(model.store) // 2])
+        app.processEvents()
+    model_delete = (time.perf_counter() - start) / args.deletes
+
+    print(f"{args.alarms} alarms")
+    print(f"QListWidget: load {legacy_load * 1e3:.1f}ms, delete {legacy_delete * 1e3:.2f}ms")
+    print(f"AlarmModel:  load {model_load * 1e3:.1f}ms, delete {model_delete * 1e3:.2f}ms")
+
+
+def bench_memory(args):
+    # Bytes held per alarm: the old (["HH", "MM"], "AM") tuples against
+    # AlarmRecords, measured with tracemalloc.
+    import tracemalloc
+
+    def held(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del kept
+        return used / args.alarms
+
+    # Rebuild the strings so the tuples don't share interned objects, as
+    # they wouldn't when loaded from JSON.
+    legacy = held(lambda: [([str(int(h)).zfill(2), str(int(m)).zfill(2)], "".join(p)) for (h, m), p in random_alarms(args.alarms)])
+    records = held(lambda: random_records(args.alarms))
+    print(f"{args.alarms} alarms")
+    print(f"legacy tuples: {legacy:.1f} bytes/alarm")
+    print(f"AlarmRecord:   {records:.1f} bytes/alarm")
+
+
+def bench_ticks(args):
+    # Runs the app for a while, visiting each page, and reports how often the
+    # shared tick service woke up and how close to the second edge it fired.
+    # The old design woke three 1s timers at arbitrary phases: 180 per minute.
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    import index
+
+    app = QApplication.instance() or QApplication([])
+    window = index.App()
+    window.show()
+    phases = []
+    window.ticks.timer.timeout.connect(lambda: phases.append(time.time() % 1))
+    pages = QTimer()
+    pages.timeout.connect(window.next)
+    pages.start(int(args.seconds * 1000 / 3))
+    QTimer.singleShot(int(args.seconds * 1000), app.quit)
+    start = time.monotonic()
+    app.exec_()
+    minutes = (time.monotonic() - start) / 60
+    print(f"{len(phases) / minutes:.1f} wakeups/minute over {args.seconds:.0f}s "
+          f"(last minute: {window.ticks.wakeups_per_minute()})")
+    print(f"tick offset after the second edge: {summary(phases)}")
+
+
+def bench_tray(args):
+    # CPU time and event-loop wakeups of the app while shown on the clock
+    # page and while hidden in the tray, with a countdown running throughout.
+    # Wakeups are counted from the event dispatcher, so they include every
+    # timer in the process, not just the tick service.
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QAbstractEventDispatcher, QTimer
+    import index
+
+    app = QApplication.instance() or QApplication([])
+    window = index.App()
+    window.show()
+    index.engine.start_timer("bench", 2 * args.seconds + 60)
+    wakeups = [0]
+    QAbstractEventDispatcher.instance().awake.connect(lambda: wakeups.__setitem__(0, wakeups[0] + 1))
+
+    def measure(label):
+        wakeups[0] = 0
+        cpu = time.process_time()
+        QTimer.singleShot(int(args.seconds * 1000), app.quit)
+        app.exec_()
+        cpu = time.process_time() - cpu
+        print(f"{label:>7}: {wakeups[0] / args.seconds * 60:.1f} wakeups/minute, "
+              f"{cpu / args.seconds * 3600:.2f}s CPU per hour")
+
+    app.processEvents()
+    measure("shown")
+    window.close()
+    app.processEvents()
+    measure("tray")
+    index.engine.cancel_timer("bench")
+
+
+def bench_themes(args):
+    # Cost of switching between the dark and light themes on the alarm page
+    # with a long alarm list, swapping the application palette against
+    # setting a window-wide stylesheet as the app used to. Each switch is
+    # timed up to a repainted window.
+    from PyQt5.QtWidgets import QApplication
+    import index, themes
+
+    app = QApplication.instance() or QApplication([])
+    window = index.App()
+    window.show()
+    window.show_page(2)
+    index.engine.add_alarms(random_records(args.alarms))
+    app.processEvents()
+
+    def stylesheet(name):
+        colors = themes.BUILTIN[name]
+        window.setStyleSheet(f"""
+            QWidget {{ background-color: {colors['window']}; color: {colors['text']}; font-family: Consolas; }}
+            QPushButton {{ background-color: {colors['button']}; color: {colors['button_text']};
+                           border-radius: 10px; padding: 5px; min-width: 40px; min-height: 20px; font-size: 18px; }}
+            QPushButton:hover {{ background-color: {colors['hover']}; }}
+            QLabel {{ font-size: 20px; }}
+            QListView, QLineEdit, QComboBox {{ font-size: 15px; }}""")
+
+    def measure(label, switch):
+        times = []
+        for i in range(args.switches):
+            start = time.perf_counter()
+            switch("light" if i % 2 == 0 else "dark")
+            app.processEvents()
+            window.repaint()
+            times.append(time.perf_counter() - start)
+        print(f"{label:>10}: {summary(times)}")
+
+    print(f"{args.alarms} alarms")
+    # The palette first: once a stylesheet is set it pins the palettes.
+    measure("palette", window.apply_theme)
+    measure("stylesheet", stylesheet)
+
+
+def bench_zones(args):
+    # Per-tick cost of the world clock with many zones: a zoneinfo
+    # conversion and strftime per zone against the cached offset tables,
+    # then on screen, a QLabel per zone against the one painted grid. Each
+    # screen tick is timed up to a repainted page.
+    from zoneinfo import ZoneInfo, available_timezones
+    from PyQt5.QtWidgets import QApplication, QLabel, QScrollArea, QVBoxLayout, QWidget
+    import index, zones
+
+    keys = sorted(available_timezones())
+    keys = [keys[i * len(keys) // args.zones] for i in range(args.zones)]
+    print(f"{len(keys)} zones")
+    start = time.perf_counter()
+    clocks, _ = zones.clocks(keys)
+    now = int(time.time())
+    for clock in clocks:
+        clock.local(now)
+    print(f"offset tables: {(time.perf_counter() - start) * 1e3:.1f}ms to build")
+
+    infos = [ZoneInfo(key) for key in keys]
+    legacy = lambda infos: [datetime.datetime.now(info).strftime("%I:%M:%S %p") for info in infos]
+    def cached(clocks):
+        now = int(time.time())
+        return [zones.format_local(clock.local(now)) for clock in clocks]
+    print(f"{'zoneinfo':>8}: {per_call(legacy, infos) * 1e3:.3f}ms per tick")
+    print(f"{'cached':>8}: {per_call(cached, clocks) * 1e3:.3f}ms per tick "
+          f"({per_call(lambda clocks: [clock.local(now) for clock in clocks], clocks) * 1e3:.3f}ms of it offsets)")
+
+    app = QApplication.instance() or QApplication([])
+    window = index.App()
+    window.show()
+    index.configs["Zones"] = keys
+    window.show_page(4)
+    app.processEvents()
+    labels = [QLabel() for _ in keys]
+    page = QWidget()
+    vbox = QVBoxLayout(page)
+    for label in labels:
+        vbox.addWidget(label)
+    scroll = QScrollArea()
+    scroll.setWidgetResizable(True)
+    scroll.setWidget(page)
+    scroll.resize(window.world.size())
+    scroll.show()
+    app.processEvents()
+
+    def label_tick(i):
+        for label, info in zip(labels, infos):
+            label.setText(datetime.datetime.now(info).strftime("%I:%M:%S %p") + f" {i % 2}")
+        scroll.repaint()
+
+    def grid_tick(i):
+        window.world.update_time()
+        window.world.grid.now += i # a new second on every tick
+        window.repaint()
+
+    def measure(label, tick):
+        times = []
+        for i in range(args.ticks):
+            start = time.perf_counter()
+            tick(i)
+            app.processEvents()
+            times.append(time.perf_counter() - start)
+        print(f"{label:>8}: {summary(times)}")
+
+    measure("labels", label_tick)
+    measure("grid", grid_tick)
+
+
+def bench_stopwatch(args):
+    # Memory of 100k laps, an array of nanoseconds against a list of float
+    # seconds; CSV export streamed row by row against built as one string;
+    # and the CPU cost of the running display, redrawn per screen frame on
+    # the page, not at all on another page, and on a 1ms timer for
+    # comparison.
+    import tracemalloc
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    import index, stopwatch
+
+    ticks = iter(range(0, 10 ** 18, 1234567))
+    watch = stopwatch.Stopwatch(clock=lambda: next(ticks))
+    watch.start()
+    for _ in range(args.laps):
+        watch.lap()
+    floats = [total / 1e9 for total in watch.laps]
+    print(f"{args.laps} laps: array {sys.getsizeof(watch.laps) / 1024:.0f}KB, "
+          f"float list {(sys.getsizeof(floats) + sum(map(sys.getsizeof, floats))) / 1024:.0f}KB")
+    del floats
+
+    def joined(path):
+        text = ",".join(stopwatch.FIELDS) + "\n" + "".join(",".join(map(str, row)) + "\n" for row in list(watch.rows()))
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.write(text)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "laps.csv")
+        for label, export in (("streamed", watch.export), ("joined", joined)):
+            start = time.perf_counter()
+            export(path)
+            elapsed = time.perf_counter() - start
+            # Memory is traced on a second run, as tracing slows it down.
+            tracemalloc.start()
+            export(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label:>9} export: {elapsed * 1e3:.0f}ms, peak {peak / 1024:.0f}KB")
+
+    app = QApplication.instance() or QApplication([])
+    window = index.App()
+    window.show()
+    window.show_page(5)
+    page = window.stopwatch
+    page.toggle()
+    frames = [0]
+    page.frames.timeout.connect(lambda: frames.__setitem__(0, frames[0] + 1))
+
+    def measure(label):
+        frames[0] = 0
+        cpu = time.process_time()
+        QTimer.singleShot(int(args.seconds * 1000), app.quit)
+        app.exec_()
+        cpu = time.process_time() - cpu
+        print(f"{label:>9}: {frames[0] / args.seconds:.0f} redraws/s, {cpu / args.seconds * 100:.1f}% CPU")
+
+    measure("frames")
+    page.frames.setInterval(1)
+    measure("1ms timer")
+    page.frames.stop()
+    window.show_page(0)
+    measure("hidden")
+
+
+def bench_startup(args):
+    # Time from interpreter start to the first painted frame, split into
+    # importing the app, building QApplication and App, and the first paint.
+    # Each run is a fresh interpreter.
+    if args.child:
+        start = time.perf_counter()
+        import index
+        from PyQt5.QtWidgets import QApplication
+
+        imported = time.perf_counter()
+        index.engine.load()
+        app = QApplication([])
+        window = index.App()
+        built = time.perf_counter()
+        painted = []
+        window.after_first_paint = lambda: (painted.append(time.perf_counter()), app.quit())
+        window.show()
+        app.exec_()
+        print(imported - start, built - imported, painted[0] - built)
+        return
+
+    # The children load the config from a scratch home folder, so the
+    # user's own config and alarms are never touched.
+    runs = []
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "startup", "--child"],
+                                 capture_output=True, text=True, check=True, env=env).stdout.split()
+            runs.append([float(x) for x in out[-3:]])
+    for i, label in enumerate(["import", "construct", "first paint"]):
+        print(f"{label:>12}: {summary([run[i] for run in runs])}")
+    print(f"{'total':>12}: {summary([sum(run) for run in runs])}")
+
+
+def bench_engine(args):
+    # The headless engine on its own: loading a config of N alarms, adding
+    # and removing alarms, and the cost of a driver wakeup.
+    from engine import Engine
+    from storage import write_atomic
+
+    # Alarms due during the run ring through the dummy driver, not the speakers.
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    print(f"{'alarms':>8} {'load':>10} {'add':>10} {'remove':>10} {'wakeup':>10}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            records = random_records(n)
+            write_atomic(os.path.join(folder, "config.json"), json.dumps(
+                {"Version": 2, "Alarms": [r.to_config() for r in records], "Sound": "", "Theme": "dark"}))
+            engine = Engine(folder)
+            start = time.perf_counter()
+            engine.load()
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            added = [engine.add_alarm(i % 1440) for i in range(args.changes)]
+            add = (time.perf_counter() - start) / args.changes
+            start = time.perf_counter()
+            for record in added:
+                engine.remove_alarm(record.id)
+            remove = (time.perf_counter() - start) / args.changes
+            wakeup = per_call(lambda e: (e.poll(), e.next_wakeup()), engine)
+            engine.close()
+        print(f"{n:>8} {load * 1e3:>8.1f}ms {add * 1e6:>8.1f}us {remove * 1e6:>8.1f}us {wakeup * 1e6:>8.2f}us")
+
+
+def bench_rules(args):
+    # Compiled alarm rules: compiling them from the config, the cost of one
+    # next-occurrence lookup, rescheduling through a day of firings, and
+    # the next 24 hours as one batch against asking each rule in turn.
+    print(f"{'rules':>8} {'compile':>10} {'next':>10} {'day of pops':>12} {'24h batch':>10} {'24h by next':>12} {'rings':>8}")
+    for n in args.sizes:
+        configs = [record.to_config() for record in random_rule_records(n)]
+        scheduler.rules.clear()
+        start = time.perf_counter()
+        records = [AlarmRecord.from_config(i, data) for i, data in enumerate(configs, 1)]
+        compile_time = (time.perf_counter() - start) / n
+        rng = random.Random(1)
+        now = time.time()
+        probes = [(rng.choice(records).rule, now + rng.uniform(0, 7 * 86400)) for _ in range(10000)]
+        start = time.perf_counter()
+        for rule, after in probes:
+            rule.next(after)
+        next_time = (time.perf_counter() - start) / len(probes)
+        schedule = AlarmSchedule(lambda: now)
+        for record in records:
+            schedule.add(record.id, record.rule)
+        start = time.perf_counter()
+        batch = sum(len(ids) for _, ids in schedule.upcoming(86400))
+        batch_time = time.perf_counter() - start
+        # The same answer by stepping every alarm's rule to the end of the window.
+        start = time.perf_counter()
+        stepped = 0
+        for rule, deadline in schedule.alarms.values():
+            while deadline is not None and deadline < now + 86400:
+                stepped += 1
+                deadline = rule.next(deadline + 60)
+        step_time = time.perf_counter() - start
+        assert stepped == batch, (stepped, batch)
+        start = time.perf_counter()
+        rings = len(schedule.pop_occurrences(now + 86400))
+        pop_time = time.perf_counter() - start
+        print(f"{n:>8} {compile_time * 1e6:>8.2f}us {next_time * 1e6:>8.2f}us {pop_time * 1e3:>10.1f}ms "
+              f"{batch_time * 1e3:>8.1f}ms {step_time * 1e3:>10.1f}ms {rings:>8}")
+
+
+def bench_storage(args):
+    # Alarms in config.json against alarms.db: writing them all out (the
+    # JSON save, or the one-off import), starting up, and one add or
+    # delete as the GUI does it, including making it durable.
+    from engine import Engine
+
+    print(f"{'alarms':>8} {'storage':>8} {'save/import':>12} {'load':>10} {'add':>10} {'delete':>10} {'list ids':>10}")
+    for n in args.sizes:
+        records = random_records(n)
+        with tempfile.TemporaryDirectory() as folder:
+            engine = Engine(folder)
+            engine.load()
+            engine.add_alarms(records)
+            engine.writer.close()
+            start = time.perf_counter()
+            engine.writer.write(engine.configs)
+            save = time.perf_counter() - start
+            loaded = Engine(folder)
+            start = time.perf_counter()
+            loaded.load()
+            load = time.perf_counter() - start
+            # A change rewrites the whole file.
+            start = time.perf_counter()
+            loaded.add_alarm(600)
+            loaded.writer.write(loaded.configs)
+            add = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded.remove_alarm(1)
+            loaded.writer.write(loaded.configs)
+            delete = time.perf_counter() - start
+            loaded.close()
+            print(f"{n:>8} {'json':>8} {save * 1e3:>10.1f}ms {load * 1e3:>8.1f}ms {add * 1e3:>8.2f}ms {delete * 1e3:>8.2f}ms {'-':>10}")
+
+            start = time.perf_counter()
+            loaded.set_storage("sqlite")
+            save = time.perf_counter() - start
+            loaded.close()
+            loaded = Engine(folder)
+            start = time.perf_counter()
+            loaded.load()
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded.add_alarm(600)
+            add = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded.remove_alarm(2)
+            delete = time.perf_counter() - start
+            # What opening the alarm page costs the first time.
+            start = time.perf_counter()
+            loaded.store.ids
+            ids = time.perf_counter() - start
+            loaded.close()
+            print(f"{n:>8} {'sqlite':>8} {save * 1e3:>10.1f}ms {load * 1e3:>8.1f}ms {add * 1e3:>8.2f}ms {delete * 1e3:>8.2f}ms {ids * 1e3:>8.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clock app benchmarks")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("alarms", help="per-tick alarm checking cost against alarm count")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    p.add_argument("--legacy-limit", type=int, default=100000, help="skip the legacy loop above this size")
+    p.set_defaults(func=bench_alarms)
+
+    p = sub.add_parser("countdown", help="countdown finish lateness under a stalled event loop")
+    p.add_argument("--seconds", type=float, default=3600, help="length of the run")
+    p.add_argument("--timers", type=int, default=100, help="concurrent countdowns, finishing evenly over the run")
+    p.add_argument("--stall-ms", type=float, default=400, help="longest injected event-loop stall")
+    p.add_argument("--stall-every", type=float, default=0.7, help="seconds between stalls")
+    p.set_defaults(func=bench_countdown)
+
+    p = sub.add_parser("sound", help="alarm trigger-to-play latency with and without the sound cache")
+    p.add_argument("--path", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sound.wav"))
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_sound)
+
+    p = sub.add_parser("audio", help="countdown-to-sound latency with the loop blocked, loop thread against audio worker")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--lead", type=float, default=0.1, help="seconds from cueing a countdown to its deadline")
+    p.add_argument("--stall-ms", type=float, default=400, help="longest block past the deadline")
+    p.set_defaults(func=bench_audio)
+
+    p = sub.add_parser("stream", help="peak RSS of in-memory against streamed playback of a long track")
+    p.add_argument("--seconds", type=float, default=600, help="length of the generated track")
+    p.add_argument("--child", choices=["memory", "stream"], help=argparse.SUPPRESS)
+    p.add_argument("--path", help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("persist", help="GUI-thread cost of saving the config after each alarm change")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    p.add_argument("--mutations", type=int, default=200, help="alarm adds per size")
+    p.set_defaults(func=bench_persist)
+
+    p = sub.add_parser("alarmlist", help="alarm list load and delete cost, list widget against model/view")
+    p.add_argument("--alarms", type=int, default=50000)
+    p.add_argument("--deletes", type=int, default=5)
+    p.set_defaults(func=bench_alarmlist)
+
+    p = sub.add_parser("memory", help="bytes per alarm, legacy tuples against AlarmRecord")
+    p.add_argument("--alarms", type=int, default=100000)
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser("ticks", help="wakeups per minute and second-edge alignment of the tick service")
+    p.add_argument("--seconds", type=float, default=60)
+    p.set_defaults(func=bench_ticks)
+
+    p = sub.add_parser("tray", help="CPU time and wakeups while shown against hidden in the tray")
+    p.add_argument("--seconds", type=float, default=3600, help="length of each phase")
+    p.set_defaults(func=bench_tray)
+
+    p = sub.add_parser("themes", help="theme switch cost, application palette against window stylesheet")
+    p.add_argument("--alarms", type=int, default=10000)
+    p.add_argument("--switches", type=int, default=20)
+    p.set_defaults(func=bench_themes)
+
+    p = sub.add_parser("zones", help="world clock tick cost, zoneinfo and labels against cached offsets and one grid")
+    p.add_argument("--zones", type=int, default=200)
+    p.add_argument("--ticks", type=int, default=50)
+    p.set_defaults(func=bench_zones)
+
+    p = sub.add_parser("stopwatch", help="lap memory, CSV export and display cost of the stopwatch")
+    p.add_argument("--laps", type=int, default=100000)
+    p.add_argument("--seconds", type=float, default=5, help="length of each display phase")
+    p.set_defaults(func=bench_stopwatch)
+
+    p = sub.add_parser("startup", help="import, construction and first-paint timings")
+    p.add_argument("--repeat", type=int, default=10)
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("rules", help="compiled alarm rules: compile, next occurrence and 24h batch cost")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    p.set_defaults(func=bench_rules)
+
+    p = sub.add_parser("storage", help="alarms in config.json against alarms.db: save, load, add and delete")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    p.set_defaults(func=bench_storage)
+
+    p = sub.add_parser("engine", help="headless engine load, add/remove and wakeup cost")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    p.add_argument("--changes", type=int, default=1000, help="alarms added then removed per size")
+    p.set_defaults(func=bench_engine)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
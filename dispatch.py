@@ -0,0 +1,186 @@
+# Fire-once dispatch of due alarms and timers onto the mixer's channels.
+# It only talks to a Player, so it runs the same under Qt, the daemon and
+# the simulation.
+import collections, heapq, itertools, time
+
+from audio import AudioError
+from metrics import Metrics
+
+# Ring priorities: when channels run short, lower numbers get one first.
+ALARM_PRIORITY = 0
+TIMER_PRIORITY = 1
+
+# Seconds between checks for a free channel while rings are waiting.
+RECHECK = 0.25
+
+
+class Ring:
+    # One occurrence of an alarm or countdown. 'source' is (kind, alarm id or
+    # countdown name); 'key' tells this occurrence apart from the others of
+    # the same source, e.g. its deadline. 'due' is when it should have
+    # started, on the same clock as 'queued'. 'late' marks a missed
+    # occurrence being caught up on.
+    __slots__ = ("source", "key", "path", "priority", "queued", "due", "late")
+
+    def __init__(self, source, key, path, priority, queued, due, late=False):
+        self.source = source
+        self.key = key
+        self.path = path
+        self.priority = priority
+        self.queued = queued
+        self.due = due
+        self.late = late
+
+
+class Dispatcher:
+    # Plays each occurrence at most once. A ring starts straight away on its
+    # own channel while fewer than 'channels' are in use, so simultaneous
+    # alarms overlap; the rest wait in priority order, oldest first, and are
+    # dropped if they would start more than 'max_wait' seconds late. A new
+    # occurrence of something that is already ringing or waiting, or one that
+    # was already submitted, is coalesced into it instead of restarting it;
+    # missed occurrences being caught up on are kept instead, and each one
+    # queues once the source's previous ring has finished.
+    #
+    # submit(), pump() and stop() return (event, detail) pairs for the engine
+    # to pass on to its listeners. The time from each ring's due time until
+    # its sound was started goes into 'metrics' as "ring latency".
+    def __init__(self, player, channels=4, max_wait=60, now=time.monotonic, metrics=None):
+        self.player = player
+        self.metrics = Metrics() if metrics is None else metrics
+        self.channels = channels
+        self.max_wait = max_wait
+        self.now = now
+        self.heap = [] # (priority, queued at, sequence, ring)
+        self.sequence = itertools.count()
+        self.waiting = {} # source -> ring
+        self.playing = {} # source -> ring
+        self.last = {} # source -> key of its latest submitted occurrence
+        self.backlog = {} # source -> deque of late rings behind its current one
+        self.delivered = 0
+        self.caught_up = 0 # late rings delivered
+        self.coalesced = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {"delivered": self.delivered, "coalesced": self.coalesced, "dropped": self.dropped,
+                "playing": len(self.playing), "waiting": len(self.waiting)}
+
+    def submit(self, kind, name, key, path, priority, due=None, late=False):
+        # Queue an occurrence that came due at 'due' (by default now). With
+        # 'late', it is a missed occurrence being caught up on.
+        source = (kind, name)
+        self.refresh()
+        if self.last.get(source) == key or (source in self and not late):
+            self.coalesced += 1
+            return []
+        self.last[source] = key
+        now = self.now()
+        ring = Ring(source, key, path, priority, now, now if due is None else due, late)
+        if source in self or source in self.backlog:
+            self.backlog.setdefault(source, collections.deque()).append(ring)
+            return []
+        self.queue(ring)
+        return self.pump()
+
+    def queue(self, ring):
+        self.waiting[ring.source] = ring
+        heapq.heappush(self.heap, (ring.priority, ring.queued, next(self.sequence), ring))
+
+    def __contains__(self, source):
+        return source in self.playing or source in self.waiting
+
+    def refresh(self):
+        # Forget rings whose sound has finished, freeing their channels.
+        for source in [s for s in self.playing if not self.player.playing(s)]:
+            del self.playing[source]
+
+    def promote(self):
+        # Queue the next late ring of each source that has finished ringing.
+        # Its wait counts from now, not from when it was submitted.
+        now = self.now()
+        for source in [s for s in self.backlog if s not in self]:
+            rings = self.backlog[source]
+            ring = rings.popleft()
+            if not rings:
+                del self.backlog[source]
+            ring.queued = now
+            self.queue(ring)
+
+    def pump(self):
+        # Start waiting rings on free channels, best priority first.
+        events = []
+        if not self.waiting and not self.backlog:
+            return events
+        self.refresh()
+        self.promote()
+        now = self.now()
+        heap = self.heap
+        while heap and len(self.playing) < self.channels:
+            ring = heap[0][3]
+            if self.waiting.get(ring.source) is not ring:
+                heapq.heappop(heap) # Stopped or forgotten while waiting.
+                continue
+            if now - ring.queued > self.max_wait:
+                self.drop(ring)
+                events.append(("dropped", ring.source[0]))
+                continue
+            try:
+                if not self.player.can_play(ring.path):
+                    break # Only the stream is taken; wait for it.
+                heapq.heappop(heap)
+                del self.waiting[ring.source]
+                self.player.play(ring.path, ring.source)
+            except FileNotFoundError:
+                self.drop(ring)
+                events.append(("missing", ring.path))
+            except AudioError as error:
+                self.drop(ring)
+                events.append(("failed", str(error)))
+            else:
+                self.playing[ring.source] = ring
+                self.delivered += 1
+                self.caught_up += ring.late
+                self.metrics.record("ring latency", (self.now() - ring.due) * 1000)
+                events.append(("ring", ring.source[0]))
+        return events
+
+    def drop(self, ring):
+        # Take 'ring' out of the queue unplayed, whichever step it failed at.
+        if self.waiting.get(ring.source) is ring:
+            heapq.heappop(self.heap)
+            del self.waiting[ring.source]
+        self.dropped += 1
+
+    def next_check(self):
+        # Seconds until pump() should run again, or None if nothing is waiting.
+        if self.backlog and not self.waiting:
+            return RECHECK
+        if not self.waiting:
+            return None
+        oldest = min(ring.queued for ring in self.waiting.values())
+        return max(0.0, min(RECHECK, oldest + self.max_wait - self.now()))
+
+    def sources(self, kind=None):
+        # Sources of every ring playing or waiting, optionally of one kind.
+        sources = dict.fromkeys((*self.playing, *self.waiting, *self.backlog))
+        return [s for s in sources if kind is None or s[0] == kind]
+
+    def stop(self, kind=None):
+        # Silence and forget the rings of 'kind' (or all of them). The user
+        # dismissed them, so waiting ones don't count as dropped.
+        for source in self.sources(kind):
+            self.forget(source)
+        return self.pump()
+
+    def forget(self, source):
+        # Stop 'source' if it is ringing and take it out of the queue.
+        if self.playing.pop(source, None) is not None:
+            self.player.stop(source)
+        self.waiting.pop(source, None)
+        self.backlog.pop(source, None)
+
+    def discard(self, source):
+        # 'source' no longer exists: forget it and its last occurrence.
+        self.forget(source)
+        self.last.pop(source, None)
@@ -0,0 +1,567 @@
+# The clock app's alarm and timer engine: scheduling, persistence and
+# sound triggering with no GUI. The Qt window is one client of it, and
+# serve() runs it headless on asyncio.
+import asyncio, itertools, json, os, shutil, signal, sys, time
+
+import assets
+from scheduler import ENABLED, AlarmRecord, AlarmSchedule, AlarmStore, Countdowns, compile_rule
+from storage import CONFIG_VERSION, ConfigWriter, migrate, upgrade_alarm
+from alarmdb import AlarmDatabase
+from audio import AudioWorker, Player, SoundCache
+from dispatch import ALARM_PRIORITY, TIMER_PRIORITY, Dispatcher
+from metrics import Metrics
+from watchdog import PERIOD, Watchdog
+
+# Define the save folder path for configuration files.
+# This uses a cross-platform approach for application data.
+save_folder = os.path.join(os.path.expanduser("~"), "AppData", "Roaming", "CCU Software", "Clock")
+
+
+# With the alarms in a database, only those ringing in the next this many
+# seconds are read into the schedule at a time.
+WINDOW = 600
+
+# An alarm occurrence reached more than this many seconds after its deadline
+# was missed, e.g. while the machine slept, and is rung by the catch-up policy.
+GRACE = 60
+
+
+def default_configs():
+    return {
+        "Version": CONFIG_VERSION,
+        "Alarms": [],
+        "Sound": assets.DEFAULT_SOUND, # a bundled sound's name, or a path
+        "Snooze": 5, # minutes
+        # Alarms missed while the machine slept, the app stalled or the clock
+        # jumped: "once" rings each such alarm once, for its latest missed
+        # occurrence; "all" rings every missed occurrence.
+        "Catch up": "once",
+        "Catch up limit": 0, # minutes; older missed alarms are skipped, 0 for no limit
+        "Fade": 0, # seconds the sound fades in over, or 0 to start at full volume
+        "Storage": "json", # or "sqlite" to keep the alarms in alarms.db
+        # Time zones on the world clock page, as zoneinfo names.
+        "Zones": ["America/Los_Angeles", "America/New_York", "Europe/London", "Asia/Tokyo"],
+        "Theme": "dark",
+        # User themes by name, e.g. {"night": {"base": "dark", "hover": "#800000"}};
+        # see themes.COLORS for the colours a theme may set.
+        "Themes": {}
+    }
+
+
+class Engine:
+    # Owns the configuration, the alarms and the named countdowns, and rings
+    # the sound when they come due, each occurrence once, through its
+    # Dispatcher. It never sleeps or polls on its own: a driver asks
+    # next_wakeup() how long it may wait and then calls poll().
+    #
+    # Listeners are called as listener(event, detail) with:
+    #   "changed"  None     alarms or countdowns changed; re-arm the driver
+    #   "alarm"    ids      these alarms came due, or their snooze ran out
+    #   "timer"    name     this countdown finished
+    #   "ring"     kind     the sound started for an "Alarm" or a "Timer"
+    #   "missing"  path     the sound file doesn't exist
+    #   "failed"   message  the sound couldn't be played for another reason
+    # With the default audio worker, "missing" and "failed" arrive after the
+    # ring, once the worker has tried to play it: from poll(), or sooner
+    # from audio_reports() if the driver sets 'worker.on_report' to call it.
+    #   "dropped"  kind     a ring waited too long for a free channel
+    #   "missed"   ids      these alarms were missed for longer than the
+    #                       catch-up limit and were not rung
+    #   "gap"      (kind, seconds)  the watchdog found a stall or clock jump
+    #
+    # 'now' and 'monotonic' are the clock sources; pass virtual ones to run
+    # the engine faster than real time (see simulate.py).
+    #
+    # 'metrics' collects timings, in milliseconds: "poll" (each poll()),
+    # "fire lateness" (alarm deadline to poll()), "stall" and "clock jump"
+    # (see watchdog.py), "ring latency" (due time to handing the sound to
+    # the player), "sound start" (the worker's play request or cue deadline
+    # to the sound starting), "save" (queueing a config write), "persist"
+    # (the write itself), "commit" (database commits), plus whatever the
+    # driver adds. See diagnostics().
+    def __init__(self, folder=save_folder, store=None, player=None, now=time.time, monotonic=time.monotonic):
+        self.folder = folder
+        self.path = os.path.join(folder, "config.json")
+        self.configs = default_configs()
+        self.now = now
+        self.monotonic = monotonic
+        self.schedule = AlarmSchedule(now)
+        self.countdowns = Countdowns(monotonic)
+        self.snoozes = Countdowns(monotonic) # alarm id -> when it rings again
+        self.store = AlarmStore() if store is None else store
+        self.ids = itertools.count(1)
+        self.metrics = Metrics()
+        self.player = AudioWorker(Player(SoundCache()), self.metrics, now=now, monotonic=monotonic) if player is None else player
+        # The player's own thread, if it has one; see cue().
+        self.worker = self.player if isinstance(self.player, AudioWorker) else None
+        self.dispatcher = Dispatcher(self.player, now=monotonic, metrics=self.metrics)
+        self.watchdog = Watchdog(now, monotonic, self.metrics)
+        self.missed = 0 # missed alarm occurrences not rung
+        self.writer = None
+        self.listeners = []
+        # With configs["Storage"] == "sqlite": the AlarmDatabase, and the end
+        # of the stretch of time whose alarms are in the schedule.
+        self.database = None
+        self.window = None
+
+    def notify(self, event, detail=None):
+        for listener in list(self.listeners):
+            listener(event, detail)
+
+    def emit(self, events):
+        # Pass the Dispatcher's (event, detail) pairs on to the listeners.
+        for event, detail in events:
+            self.notify(event, detail)
+
+    def load(self):
+        # Read the config file (creating or resetting it if needed), load
+        # its alarms and start the background writer.
+        os.makedirs(self.folder, exist_ok=True)
+        version = CONFIG_VERSION
+        try:
+            with open(self.path, "r") as f:
+                loaded = json.load(f)
+            # Upgrade configs saved by older versions of the app; the alarms
+            # are upgraded in read_alarms().
+            version = loaded.get("Version", 1)
+            self.configs.update(migrate(loaded))
+        # If the file is not found, create a new one with default settings.
+        except FileNotFoundError:
+            with open(self.path, "w") as f:
+                json.dump(self.configs, f, indent=2)
+        # If the file is corrupted or empty, keep a copy of it and reset to the default configuration.
+        except json.decoder.JSONDecodeError:
+            os.replace(self.path, self.path + ".bak")
+            with open(self.path, "w") as f:
+                json.dump(self.configs, f, indent=2)
+        records, skipped = self.read_alarms(self.configs["Alarms"], version)
+        if self.configs["Storage"] == "sqlite":
+            # Alarms still listed in config.json, e.g. from before switching
+            # to the database or added by hand, are moved into it.
+            self.open_database(records or None, append=True)
+            self.configs["Alarms"] = []
+        else:
+            self.add_alarms(records)
+            # The store's records are turned into plain lists when the config is written.
+            self.configs["Alarms"] = self.store
+        self.writer = ConfigWriter(self.path, metrics=self.metrics)
+        if self.worker is not None:
+            self.worker.fade = self.configs["Fade"]
+        if skipped or records and self.database is not None:
+            self.save()
+
+    def read_alarms(self, entries, version=CONFIG_VERSION):
+        # Records for the config's alarm entries, saved at config 'version',
+        # and how many were skipped. Entries that aren't valid alarms, e.g.
+        # from a typo in a hand-edited rule, are reported on stderr and
+        # skipped, so the other alarms still load. load() then rewrites the
+        # config without them, so it is first copied to config.json.bak.
+        records, bad = [], 0
+        if not isinstance(entries, list):
+            print(f"Skipped Alarms in {self.path}: {json.dumps(entries)} is not a list", file=sys.stderr)
+            entries, bad = [], 1
+        for entry in entries:
+            try:
+                records.append(AlarmRecord.from_config(next(self.ids), upgrade_alarm(entry, version)))
+            except (ValueError, TypeError, LookupError, AttributeError) as error:
+                print(f"Skipped alarm {json.dumps(entry)} in {self.path}: {error}", file=sys.stderr)
+                bad += 1
+        if bad:
+            shutil.copyfile(self.path, self.path + ".bak")
+        return records, bad
+
+    def use_store(self, store):
+        # Put 'store' in place of the current one, behind a proxy such as
+        # the Qt model if there is one.
+        if hasattr(self.store, "replace"):
+            self.store.replace(store)
+        else:
+            self.store = store
+
+    def open_database(self, records=None, append=False):
+        # Keep the alarms in alarms.db from now on. 'records', if given,
+        # replace whatever the database held, or with 'append', are added
+        # after its alarms under new ids.
+        database = AlarmDatabase(os.path.join(self.folder, "alarms.db"), metrics=self.metrics)
+        if records is not None:
+            if append:
+                ids = itertools.count(database.max_id() + 1)
+                for record in records:
+                    record.id = next(ids)
+            else:
+                database.clear()
+            database.extend(records)
+            database.commit()
+            self.configs["Alarms"] = []
+        self.database = database
+        self.ids = itertools.count(database.max_id() + 1)
+        self.use_store(database)
+        # Work out when imported alarms with rules ring first.
+        now = self.now()
+        pairs = [(record.rule.next(now), record.id) for record in database.unscheduled_rules()]
+        database.set_next(pairs)
+        database.disable([alarm_id for deadline, alarm_id in pairs if deadline is None])
+        database.commit()
+        self.schedule.clear()
+        self.window = now // 60 * 60
+        self.fill()
+
+    def fill(self):
+        # Move the end of the window on to WINDOW seconds from now, adding
+        # the database's alarms that ring before it to the schedule.
+        database, schedule = self.database, self.schedule
+        start = self.window
+        end = max(start, self.now() // 60 * 60) + WINDOW
+        # Daily alarms by their minute of the day, with an hour to spare
+        # either side if there is a DST change within an hour of the window.
+        first, last = time.localtime(start), time.localtime(end - 60)
+        slack = 60 if time.localtime(start - 3600).tm_gmtoff != time.localtime(end + 3600).tm_gmtoff else 0
+        if (end - start) // 60 + 2 * slack >= 1440:
+            minutes = (0, 1439)
+        else:
+            minutes = ((first.tm_hour * 60 + first.tm_min - slack) % 1440, (last.tm_hour * 60 + last.tm_min + slack) % 1440)
+        for record in database.daily_between(*minutes):
+            if record.id not in schedule.alarms:
+                deadline = record.rule.next(start)
+                if deadline < end:
+                    schedule.add(record.id, record.rule, deadline)
+        # The others by their stored next ring, which is moved on too.
+        pairs = []
+        for record in database.rules_before(end):
+            if record.id not in schedule.alarms:
+                deadline = record.rule.next(start)
+                pairs.append((deadline, record.id))
+                if deadline is not None and deadline < end:
+                    schedule.add(record.id, record.rule, deadline)
+        database.set_next(pairs)
+        database.commit()
+        self.window = end
+
+    def set_storage(self, kind):
+        # Move the alarms to "sqlite" (alarms.db) or "json" (config.json).
+        if kind == self.configs["Storage"]:
+            return
+        records = list(self.store)
+        self.configs["Storage"] = kind
+        if kind == "sqlite":
+            self.open_database(records)
+        else:
+            self.database.close()
+            self.database = self.window = None
+            self.schedule.clear()
+            self.use_store(AlarmStore())
+            self.configs["Alarms"] = self.store
+            self.add_alarms(records)
+        self.save()
+        self.notify("changed")
+
+    def save(self):
+        # Queue the config for writing; the writer's thread does the work.
+        if self.writer is not None:
+            start = time.perf_counter()
+            self.writer.save(self.configs)
+            self.metrics.since("save", start)
+
+    def sound(self):
+        # Absolute path of the alarm and timer sound.
+        return assets.path(self.configs["Sound"])
+
+    def set_sound(self, chosen):
+        # Use the file at 'chosen' from now on and decode it ahead of time.
+        self.configs["Sound"] = assets.sound_name(chosen)
+        self.player.warm(self.sound())
+        self.save()
+
+    def close(self):
+        # Write out anything pending. Call before exiting.
+        if self.writer is not None:
+            self.writer.close()
+        if self.database is not None:
+            self.database.close()
+        if self.worker is not None:
+            self.worker.close()
+
+    def add_alarms(self, records):
+        # Schedule the enabled AlarmRecords and store them all in one batch.
+        # Alarms whose rule has no occurrence left are switched off.
+        if self.database is None:
+            for record in records:
+                if record.flags & ENABLED and self.schedule.add(record.id, record.rule) is None:
+                    record.flags &= ~ENABLED
+            self.store.extend(records)
+        else:
+            for alarm in self.place(self.store, records, self.now()):
+                self.schedule.add(*alarm)
+            self.database.commit()
+        self.notify("changed")
+
+    def place(self, store, records, now):
+        # Add 'records' to 'store', the database or a proxy for it, working
+        # out their next rings without committing. Returns (id, rule,
+        # deadline) for those ringing within the window, to be scheduled now.
+        soon = []
+        pairs = []
+        for record in records:
+            deadline = record.rule.next(now) if record.flags & ENABLED else None
+            if deadline is None:
+                record.flags &= ~ENABLED
+            elif deadline < self.window:
+                soon.append((record.id, record.rule, deadline))
+            pairs.append((deadline, record.id))
+        store.extend(records)
+        self.database.set_next(pairs)
+        return soon
+
+    def import_alarms(self, records, batch=10000):
+        # Add AlarmRecords from an iterable, e.g. transfer.read(), as one
+        # change with one save, and return how many there were. If reading
+        # them raises, nothing is added. With a database they are written in
+        # batches inside one transaction, so only a batch is held at a time.
+        if self.database is None:
+            records = list(records)
+            self.add_alarms(records)
+            self.save()
+            return len(records)
+        database, now = self.database, self.now()
+        # Each batch below carries on where the last one stopped, so a list
+        # has to be read through an iterator too.
+        records = iter(records)
+        count = 0
+        soon = []
+        try:
+            for chunk in iter(lambda: list(itertools.islice(records, batch)), []):
+                soon.extend(self.place(database, chunk, now))
+                count += len(chunk)
+        except BaseException:
+            database.rollback()
+            raise
+        finally:
+            # The rows went in behind the back of any proxy; let it catch up.
+            self.use_store(database)
+        database.commit()
+        for alarm in soon:
+            self.schedule.add(*alarm)
+        self.notify("changed")
+        return count
+
+    def add_alarm(self, minute, flags=ENABLED, rule=None):
+        # Add a new alarm at minute-of-day 'minute' and return its record.
+        # 'rule' is a rule spec (see scheduler.Rule); without one the alarm
+        # rings daily. Raises ValueError if the rule is invalid.
+        record = AlarmRecord(next(self.ids), minute, flags, compile_rule(minute, rule))
+        self.add_alarms([record])
+        return record
+
+    def remove_alarm(self, alarm_id):
+        self.store.remove(alarm_id)
+        if self.database is not None:
+            self.database.commit()
+        self.schedule.remove(alarm_id)
+        self.snoozes.cancel(alarm_id)
+        self.dispatcher.discard(("Alarm", alarm_id))
+        self.notify("changed")
+
+    def start_timer(self, name, seconds):
+        self.countdowns.start(name, seconds)
+        self.notify("changed")
+
+    def cancel_timer(self, name):
+        self.countdowns.cancel(name)
+        self.dispatcher.discard(("Timer", name))
+        self.notify("changed")
+
+    def snooze(self):
+        # Silence the alarms that are ringing or waiting to ring, and ring
+        # them again in configs["Snooze"] minutes.
+        for source in self.dispatcher.sources("Alarm"):
+            self.dispatcher.forget(source)
+            self.snoozes.start(source[1], self.configs["Snooze"] * 60)
+        self.emit(self.dispatcher.pump())
+        self.notify("changed")
+
+    def stop(self, kind=None):
+        # Dismiss what is ringing or waiting to ring: "Alarm"s, including
+        # snoozed ones, "Timer"s, or everything.
+        if kind in (None, "Alarm"):
+            for alarm_id in list(self.snoozes.deadlines):
+                self.snoozes.cancel(alarm_id)
+        self.emit(self.dispatcher.stop(kind))
+        self.notify("changed")
+
+    def next_wakeup(self):
+        # Seconds until the earliest alarm or countdown is due, or None if
+        # nothing is pending; at most watchdog.PERIOD, so a suspend or clock
+        # change is caught up on soon after.
+        delays = []
+        deadline = self.schedule.next_deadline()
+        if deadline is not None:
+            delays.append(deadline - self.schedule.now())
+        for countdowns in (self.countdowns, self.snoozes):
+            deadline = countdowns.next_deadline()
+            if deadline is not None:
+                delays.append(deadline - self.monotonic())
+        # Rings waiting for a channel need checking on too.
+        delay = self.dispatcher.next_check()
+        if delay is not None:
+            delays.append(delay)
+        if self.window is not None:
+            delays.append(self.window - self.now())
+        delay = max(0.0, min(delays + [PERIOD])) if delays else None
+        self.watchdog.expect(delay)
+        return delay
+
+    def cue(self):
+        # Hand the audio worker the next alarm and countdown rings, so they
+        # start on time even if the driver's loop is stalled when they come
+        # due. Drivers call this whenever they re-arm; without a worker it
+        # does nothing. Rings are only cued while a channel is free for them.
+        if self.worker is None:
+            return
+        self.dispatcher.refresh()
+        cues = []
+        sound, now, monotonic = self.sound(), self.now(), self.monotonic()
+        if not self.dispatcher.waiting and len(self.dispatcher.playing) < self.dispatcher.channels:
+            first = self.schedule.peek()
+            if first is not None:
+                deadline, alarm_id = first
+                cues.append((("Alarm", alarm_id), sound, monotonic + deadline - now, deadline))
+            for kind, countdowns in (("Timer", self.countdowns), ("Alarm", self.snoozes)):
+                first = countdowns.peek()
+                if first is not None:
+                    cues.append(((kind, first[1]), sound, first[0], None))
+        self.worker.cue(cues)
+
+    def audio_reports(self):
+        # Pass on the errors the audio worker has reported since last time.
+        if self.worker is not None:
+            self.emit(self.worker.reports())
+
+    def catch_up(self, due, now):
+        # Split the (alarm id, deadline) occurrences in 'due' into those to
+        # ring and the ids of missed alarms to skip, by configs["Catch up"]
+        # and configs["Catch up limit"]. Occurrences on time always ring;
+        # with "once", an alarm's missed occurrences are left out if a later
+        # one rings.
+        limit = self.configs["Catch up limit"] * 60
+        ring, missed, latest = [], [], {}
+        for alarm_id, deadline in due:
+            late = now - deadline
+            if late <= GRACE:
+                ring.append((alarm_id, deadline))
+            elif limit and late > limit:
+                missed.append(alarm_id)
+            else:
+                ring.append((alarm_id, deadline))
+                latest[alarm_id] = deadline
+        if latest and self.configs["Catch up"] == "once":
+            # 'due' is in deadline order, so the last occurrence of each alarm wins.
+            last = {alarm_id: deadline for alarm_id, deadline in ring}
+            ring = [(alarm_id, deadline) for alarm_id, deadline in ring
+                    if alarm_id not in latest or last[alarm_id] == deadline]
+        self.missed += len(missed)
+        return ring, list(dict.fromkeys(missed))
+
+    def poll(self):
+        # Fire whatever has come due. Each alarm moves on to its next day.
+        start = time.perf_counter()
+        self.audio_reports()
+        for gap in self.watchdog.check():
+            self.notify("gap", gap)
+        dispatcher, sound = self.dispatcher, self.sound()
+        if self.window is not None and self.now() >= self.window:
+            self.fill()
+        due = self.schedule.pop_occurrences()
+        if due:
+            now, monotonic = self.now(), self.monotonic()
+            ring, missed = self.catch_up(due, now)
+            if missed:
+                self.notify("missed", missed)
+            if ring:
+                self.notify("alarm", [alarm_id for alarm_id, _ in ring])
+            for alarm_id, deadline in ring:
+                self.metrics.record("fire lateness", (now - deadline) * 1000)
+                # Missed occurrences ring one after another rather than
+                # being coalesced into the alarm's ring already under way.
+                self.emit(dispatcher.submit("Alarm", alarm_id, deadline, sound, ALARM_PRIORITY,
+                                            monotonic - (now - deadline), late=now - deadline > GRACE))
+            # One-shot alarms, and those past their last date, are done.
+            finished = [alarm_id for alarm_id, _ in due if alarm_id not in self.schedule.alarms]
+            for alarm_id in finished:
+                self.store[alarm_id].flags &= ~ENABLED
+                self.store.updated(alarm_id)
+            if self.database is not None:
+                # Alarms next ringing after the window leave the schedule
+                # until a later fill() finds them again.
+                schedule = self.schedule
+                pairs = [(schedule.alarms[i][1] if i in schedule.alarms else None, i) for i, _ in due]
+                for deadline, alarm_id in pairs:
+                    if deadline is not None and deadline >= self.window:
+                        schedule.remove(alarm_id)
+                self.database.set_next(pairs)
+                self.database.commit()
+            elif finished:
+                self.save()
+        now = self.monotonic()
+        for alarm_id in self.snoozes.pop_expired():
+            self.notify("alarm", [alarm_id])
+            self.emit(dispatcher.submit("Alarm", alarm_id, ("snooze", now), sound, ALARM_PRIORITY))
+        for name in self.countdowns.pop_expired():
+            self.notify("timer", name)
+            self.emit(dispatcher.submit("Timer", name, now, sound, TIMER_PRIORITY))
+        self.emit(dispatcher.pump())
+        self.metrics.since("poll", start)
+
+    def diagnostics(self):
+        # Timings and counters as a JSON-ready dict, for the diagnostics
+        # page and for monitoring.
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "uptime": round(time.time() - self.metrics.started),
+            "timings_ms": self.metrics.snapshot(),
+            "dispatcher": self.dispatcher.stats(),
+            "alarms": len(self.store),
+            "scheduled": len(self.schedule),
+            "countdowns": len(self.countdowns),
+            "watchdog": {**self.watchdog.stats(), "caught_up": self.dispatcher.caught_up, "missed": self.missed},
+            "storage": self.configs["Storage"],
+            "config_writes": self.writer.writes if self.writer is not None else 0,
+        }
+
+
+async def serve(engine):
+    # Drive 'engine' on the running asyncio loop until SIGINT or SIGTERM.
+    # Sleeps until the next deadline, waking early whenever it changes.
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    stop = asyncio.Event()
+    engine.listeners.append(lambda event, detail: changed.set() if event == "changed" else None)
+    if engine.worker is not None:
+        # Errors from the audio worker's thread wake the loop to pass them on.
+        engine.worker.on_report = lambda: loop.call_soon_threadsafe(changed.set)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass # Not supported on this platform; Ctrl+C still ends asyncio.run.
+    try:
+        while not stop.is_set():
+            changed.clear()
+            waiters = [asyncio.ensure_future(changed.wait()), asyncio.ensure_future(stop.wait())]
+            engine.cue()
+            delay = engine.next_wakeup()
+            expected = None if delay is None else engine.monotonic() + delay
+            done, _ = await asyncio.wait(waiters, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            if not done:
+                # Woken by the timeout: how far past the deadline it was.
+                engine.metrics.record("wakeup lateness", (engine.monotonic() - expected) * 1000)
+            engine.poll()
+    finally:
+        engine.close()
+
+
+def log(event, detail):
+    # Listener used by the daemon: report what happened on stdout.
+    if event != "changed":
+        print(time.strftime("%Y-%m-%d %H:%M:%S"), event, detail, flush=True)
@@ -1,48 +1,38 @@
+import sys
+import ipc
+
+# A second launch hands its command line to the instance already running
+# and exits here, before Qt widgets or audio are loaded.
+if __name__ == "__main__":
+    args = ipc.parse_args()
+    ipc.forward(args)
+
 # Import necessary modules from PyQt5, along with other standard Python libraries.
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QPushButton, QVBoxLayout, 
-                             QHBoxLayout, QDialog, QFormLayout, QLineEdit, QMessageBox, QListWidget, 
-                             QStackedLayout, QComboBox, QSystemTrayIcon, QFileDialog, QMenu, QAction)
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QIntValidator, QIcon
-import sys, time, os, json, pygame
-
-# Initialize the pygame mixer for sound playback.
-pygame.mixer.init()
-
-# Get the absolute path of the directory containing the script.
-file_path = os.path.split(__file__)[0]
-
-# Define the save folder path for configuration files. 
-# This uses a cross-platform approach for application data.
-save_folder = os.path.join(os.path.expanduser("~"), "AppData", "Roaming", "CCU Software", "Clock")
-
-# Create the save folder if it doesn't already exist.
-if not os.path.exists(save_folder):
-    os.makedirs(save_folder, exist_ok=True)
-
-# Define the default configuration.
-configs = {
-    "Alarms": [],
-    "Sound": os.path.join(file_path, "data", "sound.wav"),
-    "Theme": "dark"
-}
-
-# Try to load the configuration from the file.
-try:
-    with open(os.path.join(save_folder, "config.json"), "r") as f:
-        configs = json.load(f)
-# If the file is not found, create a new one with default settings.
-except FileNotFoundError:
-    with open(os.path.join(save_folder, "config.json"), "w") as f:
-        json.dump(configs, f, indent=2)
-# If the file is corrupted or empty, reset to the default configuration.
-except json.decoder.JSONDecodeError:
-      with open(os.path.join(save_folder, "config.json"), "w") as f:
-        json.dump(configs, f, indent=2)
+                             QHBoxLayout, QDialog, QFormLayout, QLineEdit, QMessageBox, QListView, 
+                             QStackedLayout, QComboBox, QSystemTrayIcon, QFileDialog, QMenu, QAction,
+                             QCheckBox, QTimeEdit, QDateEdit, QScrollArea, QFrame)
+from PyQt5.QtCore import QTimer, Qt, QAbstractListModel, QModelIndex, QObject, QTime, QDate, QRect, pyqtSignal
+from PyQt5.QtGui import QIntValidator, QPainter, QPalette
+from PyQt5.QtNetwork import QLocalServer
+import time, os, math, collections, asyncio
+from scheduler import DAY_NAMES, EVERY_DAY, AlarmStore, alarm_minute
+from engine import Engine, log, serve
+from metrics import Metrics
+from themes import ThemeStyle, compile_theme, dialog_fonts, heading, install_fonts, theme_names
+from storage import write_atomic
+from zones import DAY, clocks, format_local
+import assets, stopwatch, transfer, json
+
+# File dialog filter for alarm import and export.
+ALARM_FILES = "Alarm Files (*.csv *.ics);;CSV (*.csv);;iCalendar (*.ics)"
+
+# Screen refresh rate to assume when the screen doesn't report one.
+REFRESH_RATE = 60
 
 # A generic dialog class for getting user input.
 class Dialog(QDialog):
-    def __init__(dialog, parent, title, label, num_of_line_edits, combo, func):
+    def __init__(dialog, parent, title, label, num_of_line_edits, combo, func, extra=None):
         super().__init__(parent)
         dialog.resize(200, 100)
         dialog.setWindowTitle(title)
@@ -63,9 +53,12 @@ class Dialog(QDialog):
             combo = QComboBox()
             combo.addItems(["AM", "PM"])
             hbox.addWidget(combo)
-            combo.setStyleSheet("font-size: 15px")
         
         form.addRow(hbox)
+        # Optional widget with more fields, which 'func' reads as dialog.extra.
+        dialog.extra = extra
+        if extra is not None:
+            form.addRow(extra)
         btn = QPushButton("Submit")
         
         # Connect the submit button to the provided function.
@@ -75,20 +68,143 @@ class Dialog(QDialog):
             btn.clicked.connect(lambda: func(dialog, line_edits))
         
         form.addRow(btn)
+        dialog_fonts(dialog)
         # Show the dialog as a modal window.
         dialog.exec_()
 
-# Widget for displaying the current time.
-class Clock(QWidget):
+# Extra fields of the add-alarm dialog for alarms that don't just ring
+# daily. spec() returns the rule in its config form (see scheduler.Rule).
+class RuleForm(QWidget):
     def __init__(self):
         super().__init__()
+        form = QFormLayout(self)
+        form.setContentsMargins(0, 0, 0, 0)
+
+        days = QHBoxLayout()
+        self.days = []
+        for name in DAY_NAMES:
+            box = QCheckBox(name)
+            box.setChecked(True)
+            days.addWidget(box)
+            self.days.append(box)
+        form.addRow("Days", days)
+
+        # Leave "every" empty to ring once a day.
+        repeat = QHBoxLayout()
+        self.every = QLineEdit()
+        self.every.setValidator(QIntValidator(1, 1439))
+        self.every.setPlaceholderText("minutes")
+        self.until = QTimeEdit(QTime(23, 59))
+        self.until.setDisplayFormat("hh:mm AP")
+        repeat.addWidget(self.every)
+        repeat.addWidget(QLabel("until"))
+        repeat.addWidget(self.until)
+        form.addRow("Every", repeat)
+
+        dates = QHBoxLayout()
+        self.dates = QComboBox()
+        self.dates.addItems(["Always", "Between", "Only on"])
+        self.first = QDateEdit(QDate.currentDate())
+        self.last = QDateEdit(QDate.currentDate())
+        dates.addWidget(self.dates)
+        for edit in (self.first, self.last):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("yyyy-MM-dd")
+            dates.addWidget(edit)
+        self.dates.currentIndexChanged.connect(self.update_dates)
+        form.addRow("Dates", dates)
+        self.update_dates()
+
+    def update_dates(self):
+        mode = self.dates.currentText()
+        self.first.setEnabled(mode != "Always")
+        self.last.setEnabled(mode == "Between")
+
+    def spec(self):
+        spec = {}
+        days = sum(1 << bit for bit, box in enumerate(self.days) if box.isChecked())
+        if days != EVERY_DAY:
+            spec["days"] = days
+        if self.every.text():
+            spec["every"] = int(self.every.text())
+            until = self.until.time()
+            spec["until"] = until.hour() * 60 + until.minute()
+        mode = self.dates.currentText()
+        if mode == "Between":
+            spec["from"] = self.first.date().toString(Qt.ISODate)
+            spec["to"] = self.last.date().toString(Qt.ISODate)
+        elif mode == "Only on":
+            spec["on"] = self.first.date().toString(Qt.ISODate)
+        return spec
+
+# One timer shared by everything that refreshes once a second.
+# It fires just after each wall-clock second edge and calls the active
+# subscribers, and stops waking up altogether while none are active.
+# How far each tick lands from its edge goes into 'metrics' as "tick
+# jitter", and the time its subscribers take as "tick handlers".
+class TickService(QObject):
+    def __init__(self, metrics=None):
+        super().__init__()
+        self.metrics = Metrics() if metrics is None else metrics
+        self.target = None # Wall-clock time the armed tick is aimed at.
         self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.subscribers = {} # callback -> whether it is active
+        self.wakeups = collections.deque() # Monotonic times of recent ticks.
+
+    def subscribe(self, callback, active=True):
+        self.subscribers[callback] = False
+        self.set_active(callback, active)
+
+    def set_active(self, callback, active):
+        # Resume or pause a subscriber. A resumed one is called straight away
+        # so its display catches up without waiting for the next edge.
+        was_active = self.subscribers[callback]
+        self.subscribers[callback] = active
+        if active and not was_active:
+            callback()
+        self.arm()
+
+    def arm(self):
+        if not any(self.subscribers.values()):
+            self.timer.stop()
+        elif not self.timer.isActive():
+            # Aim 1ms past the edge so the new second is already current.
+            delay = 1001 - int(time.time() * 1000) % 1000
+            self.target = time.time() + delay / 1000
+            self.timer.start(delay)
+
+    def tick(self):
+        if self.target is not None:
+            self.metrics.record("tick jitter", (time.time() - self.target) * 1000)
+        start = time.perf_counter()
+        now = time.monotonic()
+        self.wakeups.append(now)
+        while self.wakeups[0] < now - 60:
+            self.wakeups.popleft()
+        for callback, active in list(self.subscribers.items()):
+            if active:
+                callback()
+        self.metrics.since("tick handlers", start)
+        self.arm()
+
+    def wakeups_per_minute(self):
+        # Ticks during the last 60 seconds.
+        cutoff = time.monotonic() - 60
+        return sum(1 for t in self.wakeups if t >= cutoff)
+
+# Widget for displaying the current time.
+class Clock(QWidget):
+    def __init__(self, ticks):
+        super().__init__()
         self.title = QLabel("Clock")
         self.time_label = QLabel("00:00:00 MM")
         
-        # Connect the timer to the update_time method and start it.
-        self.timer.timeout.connect(self.update_time)
-        self.timer.start(1000) # Update every second (1000 milliseconds).
+        # Update every second from the shared tick service, paused while hidden.
+        self.ticks = ticks
+        self.ticks.subscribe(self.update_time, active=False)
         self.initUI()
     
     def initUI(self):
@@ -103,16 +219,234 @@ class Clock(QWidget):
     
     def update_time(self):
         # Format and display the current time in 12-hour format with AM/PM.
-        self.time_label.setText(time.strftime("%I:%M:%S %p"))
+        # The time comes from the engine's clock source.
+        self.time_label.setText(time.strftime("%I:%M:%S %p", time.localtime(engine.now())))
+
+# The times of many zones, painted as one grid so a tick is one repaint
+# however many zones there are. Only the rows in the repainted area are
+# drawn, so zones scrolled out of view cost nothing.
+class ZoneGrid(QWidget):
+    def __init__(self, clocks):
+        super().__init__()
+        self.clocks = clocks
+        self.now = 0 # Integer UTC timestamp shown.
+        self.here = 0 # Local UTC offset, for the day markers.
+        font = self.font()
+        font.setPixelSize(15)
+        self.setFont(font)
+        metrics = self.fontMetrics()
+        self.line = metrics.height() + 4
+        self.cell = metrics.horizontalAdvance("0") * 26
+
+    def columns(self):
+        return max(1, self.width() // self.cell)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rows = -(-len(self.clocks) // self.columns())
+        self.setMinimumHeight(rows * self.line)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setPen(self.palette().color(QPalette.WindowText))
+        metrics = self.fontMetrics()
+        columns = self.columns()
+        today = (self.now + self.here) // DAY
+        area = event.rect()
+        for row in range(area.top() // self.line, area.bottom() // self.line + 1):
+            for column in range(columns):
+                i = row * columns + column
+                if i >= len(self.clocks):
+                    return
+                clock = self.clocks[i]
+                local = clock.local(self.now)
+                # Mark zones already a day ahead of, or still a day behind, this one.
+                day = {1: " +1", -1: " -1"}.get(local // DAY - today, "   ")
+                text = format_local(local) + day
+                cell = QRect(column * self.cell, row * self.line, self.cell - 8, self.line)
+                width = cell.width() - metrics.horizontalAdvance(text) - 8
+                painter.drawText(cell, Qt.AlignLeft | Qt.AlignVCenter,
+                                 metrics.elidedText(clock.label, Qt.ElideRight, width))
+                painter.drawText(cell, Qt.AlignRight | Qt.AlignVCenter, text)
+
+# Widget for the current time in the zones of configs["Zones"].
+class WorldClock(QWidget):
+    def __init__(self, ticks):
+        super().__init__()
+        self.title = QLabel("World Clock")
+        found, unknown = clocks(configs["Zones"])
+        for key in unknown:
+            print(f"Unknown time zone {key!r} in Zones", file=sys.stderr)
+        self.grid = ZoneGrid(found)
+        scroll = QScrollArea()
+        scroll.setFrameShape(QFrame.NoFrame)
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(self.grid)
+
+        # Update every second from the shared tick service, paused while hidden.
+        self.ticks = ticks
+        self.ticks.subscribe(self.update_time, active=False)
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.title)
+        vbox.addWidget(scroll)
+        self.setLayout(vbox)
+
+    def update_time(self):
+        now = int(engine.now())
+        self.grid.now = now
+        self.grid.here = time.localtime(now).tm_gmtoff
+        self.grid.update()
+
+# List model exposing an AlarmStore to a view, one row per alarm.
+# The engine uses it in place of the bare store, so adds and removes touch
+# only the affected rows instead of rebuilding the list.
+class AlarmModel(QAbstractListModel):
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __getitem__(self, alarm_id):
+        return self.store[alarm_id]
+
+    def replace(self, store):
+        # Show 'store' instead, e.g. after the alarms moved to a database.
+        self.beginResetModel()
+        self.store = store
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.store[self.store.ids[index.row()]].label()
+        return None
+
+    def alarm_id(self, index):
+        return self.store.ids[index.row()]
+
+    def extend(self, records):
+        # Append AlarmRecords as one batch of new rows.
+        if records:
+            first = len(self.store)
+            self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+            self.store.extend(records)
+            self.endInsertRows()
+
+    def updated(self, alarm_id):
+        # Let the store write the change back, e.g. to alarms.db, then redraw.
+        self.store.updated(alarm_id)
+        index = self.index(self.store.row(alarm_id))
+        self.dataChanged.emit(index, index)
+
+    def remove(self, alarm_id):
+        row = self.store.row(alarm_id)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.store.remove(alarm_id)
+        self.endRemoveRows()
+
+# Runs the engine on the Qt event loop: one single-shot timer armed for the
+# engine's next deadline, re-armed whenever alarms or countdowns change.
+# Alarms fire through it whether or not their page has been built. How late
+# the timer goes off goes into the engine's metrics as "wakeup lateness".
+# The audio worker's error reports come in through a queued signal.
+class Driver(QObject):
+    reported = pyqtSignal()
+
+    def __init__(self, window, engine):
+        super().__init__(window)
+        self.window = window
+        self.engine = engine
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.poll)
+        self.engine.listeners.append(self.on_event)
+        self.reported.connect(self.engine.audio_reports)
+        if self.engine.worker is not None:
+            self.engine.worker.on_report = self.reported.emit
+        self.expected = None # Monotonic time the timer is armed for.
+        self.arm()
+
+    def arm(self):
+        self.timer.stop()
+        self.engine.cue()
+        delay = self.engine.next_wakeup()
+        if delay is not None:
+            self.expected = self.engine.monotonic() + delay
+            self.timer.start(math.ceil(delay * 1000))
+
+    def poll(self):
+        if self.expected is not None:
+            self.engine.metrics.record("wakeup lateness", (self.engine.monotonic() - self.expected) * 1000)
+        self.engine.poll()
+        self.arm()
+
+    def on_event(self, event, detail):
+        if event == "changed":
+            self.arm()
+        elif event == "timer":
+            self.window.timer_finished(detail)
+        elif event == "ring":
+            message = "Alarm is going off!" if detail == "Alarm" else "Timer is done!"
+            self.window.tray_icon.showMessage(detail, message, QSystemTrayIcon.Warning, 3000)
+            self.window.suspend_audio()
+        elif event == "missing":
+            self.window.tray_icon.showMessage("The file is not found", f"{detail} doesn't exist", QSystemTrayIcon.Critical, 5000)
+        elif event == "failed":
+            self.window.tray_icon.showMessage("The sound can't be played", detail, QSystemTrayIcon.Critical, 5000)
+        elif event == "dropped":
+            self.window.tray_icon.showMessage(detail, f"A missed {detail.lower()} was not played", QSystemTrayIcon.Warning, 3000)
+        elif event == "missed":
+            count = f"{len(detail)} alarms were" if len(detail) > 1 else "An alarm was"
+            self.window.tray_icon.showMessage("Alarm", f"{count} missed too long ago to ring", QSystemTrayIcon.Warning, 3000)
+
+# Listens for the command lines of later launches (see ipc.py) and has the
+# window carry them out.
+class Instance(QObject):
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.accept)
+        if not self.server.listen(ipc.SOCKET_NAME) and ipc.send({"command": "ping"}) is None:
+            # Left behind by an instance that didn't exit cleanly.
+            QLocalServer.removeServer(ipc.SOCKET_NAME)
+            self.server.listen(ipc.SOCKET_NAME)
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self.read(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def read(self, socket):
+        if not socket.canReadLine():
+            if socket.bytesAvailable() > ipc.MAX_MESSAGE:
+                socket.abort()
+            return
+        message = ipc.decode(bytes(socket.readLine()))
+        socket.write(ipc.encode(self.window.command(message)))
+        socket.flush()
+        socket.disconnectFromServer()
 
 # Widget for managing alarms.
 class Alarm(QWidget):
-    times = [] # Class-level list to store alarm times.
     def __init__(self):
         super().__init__()
-        self.timer = QTimer()
         self.title = QLabel("Alarm")
-        self.frame = QListWidget()
+        # The view only draws the rows that are on screen.
+        self.frame = QListView()
+        self.frame.setUniformItemSizes(True)
+        self.frame.setLayoutMode(QListView.Batched)
+        self.frame.setModel(engine.store)
         
         # Buttons for adding, removing, and stopping alarms.
         self.add = QPushButton("+")
@@ -121,11 +455,8 @@ class Alarm(QWidget):
         self.remove.setToolTip("Remove Alarm")
         self.stop = QPushButton("Stop")
         self.stop.setToolTip("Stop Sound")
-        
-        # Load alarms from the config file into the list widget.
-        for i in configs["Alarms"]:
-            self.frame.addItem(f"{':'.join(i[0])} {i[1]}")
-            self.times.append((i[0], i[1]))
+        self.snooze = QPushButton("Snooze")
+        self.snooze.setToolTip("Ring again in a few minutes")
             
         self.initUI()
     
@@ -133,6 +464,7 @@ class Alarm(QWidget):
         btn_hbox = QHBoxLayout()
         btn_hbox.addWidget(self.add)
         btn_hbox.addWidget(self.remove)
+        btn_hbox.addWidget(self.snooze)
         btn_hbox.addWidget(self.stop)
 
         vbox = QVBoxLayout()
@@ -140,91 +472,45 @@ class Alarm(QWidget):
         vbox.addStretch()
         
         # Connect button signals to their respective methods.
-        self.add.clicked.connect(lambda: Dialog(self, "Set Alarm", "Input Hour and Minute", 2, True, self.get_info))
+        self.add.clicked.connect(lambda: Dialog(self, "Set Alarm", "Input Hour and Minute", 2, True, self.get_info, RuleForm()))
         self.remove.clicked.connect(self.delete)
-        self.stop.clicked.connect(pygame.mixer.stop)
+        self.snooze.clicked.connect(lambda: engine.snooze())
+        self.stop.clicked.connect(lambda: engine.stop("Alarm"))
         
         vbox.addWidget(self.frame)
         vbox.addLayout(btn_hbox)
         self.setLayout(vbox)
 
-        # Start a timer to check for alarms every second.
-        self.timer.timeout.connect(self.count)
-        self.timer.start(1000)
-    
     def delete(self):
         # Remove the selected alarm from the list and the saved config.
-        if self.frame.currentItem():
-            time_str = self.frame.currentItem().text()
-            # Parse the time string back into a tuple for the 'times' list.
-            n_time = (time_str[0:5].split(':'), time_str[6:])
-            self.times.remove(n_time)
-            
-            # Re-populate the list widget to reflect the change.
-            self.frame.clear()
-            for i in self.times:
-                self.frame.addItem(":".join(i[0])+ " " + i[1])
+        index = self.frame.currentIndex()
+        if index.isValid():
+            engine.remove_alarm(engine.store.alarm_id(index))
             
             # Save the updated alarms to the config file.
             self.window().save()
     
     def get_info(self, parent, line_edits, meridiem):
-        input_data = []
-        problem = False
-        
-        # Validate the user's input for hours and minutes.
-        for count, i in enumerate(line_edits):
-            if i.text() == "":
-                input_data.append(f"{int('0'):02}")
-            else:
-                val = int(i.text())
-                if count == 1 and val > 59: # Minutes check.
-                    QMessageBox.warning(self, "Problem with input", "Minutes is greater than 59")
-                    problem = True
-                    break
-                elif count == 0 and val > 12: # Hours check.
-                    QMessageBox.warning(self, "Problem with input", "Hours is greater than 12")
-                    problem = True
-                    break
-                else:
-                    input_data.append(f"{val:02}")
-        
-        # If input is valid, add the new alarm and save the config.
-        if not problem:
-            parent.close()
-            self.frame.addItem(":".join(input_data) + f" {meridiem}")
-            self.times.append((input_data, meridiem))
-            self.window().save()
-
-    def play(self):
-        pygame.mixer.stop()
+        # Validate the hour, minute and rule, then add the alarm and save the config.
+        # Empty fields count as zero.
         try:
-            # Load and play the sound from the configured file.
-            music = pygame.mixer.Sound(configs["Sound"])
-            music.play()
-        except FileNotFoundError:
-            QMessageBox.warning(self, "The file is not found", "The file doesn't exist") 
-
-    def count(self):
-        # Check if any alarm time matches the current time.
-        # The check only happens if no sound is currently playing.
-        if not pygame.mixer.get_busy():
-            for alarm_time, meridiem in self.times:
-                # Get current time components.
-                current_hour = int(time.strftime("%I"))
-                current_minute = int(time.strftime("%M"))
-                current_meridiem = time.strftime("%p")
-                
-                # Check for a match.
-                if current_meridiem == meridiem and current_hour == int(alarm_time[0]) and current_minute == int(alarm_time[1]):
-                    self.play()
-                    self.window().tray_icon.showMessage("Alarm", "Alarm is going off!", QSystemTrayIcon.Warning, 3000)
+            hour, minute = (int(edit.text() or 0) for edit in line_edits)
+            engine.add_alarm(alarm_minute(hour, minute, meridiem), rule=parent.extra.spec())
+        except ValueError as error:
+            QMessageBox.warning(self, "Problem with input", str(error))
+            return
+        parent.close()
+        self.window().save()
 
 # Widget for a countdown timer.
 class Timer(QWidget):
-    def __init__(self):
+    name = ipc.TIMER_NAME # Name of this page's countdown in the engine.
+    def __init__(self, ticks):
         super().__init__()
-        self.timer = QTimer()
+        # The countdown runs on a monotonic deadline in the engine, which
+        # also fires it. The shared tick service only refreshes the display.
+        self.ticks = ticks
+        self.ticks.subscribe(self.update_label, active=False)
         self.title = QLabel("Timer")
         self.label = QLabel("00:00:00")
         
@@ -235,12 +521,8 @@ class Timer(QWidget):
         self.btn2.setToolTip("Stop sound")
         self.btn3 = QPushButton("Reset")
         self.btn3.setToolTip("Reset Timer")
-        self.remaining_seconds = 0
         
         self.initUI()
-        
-        # Connect the timer to the update_label method.
-        self.timer.timeout.connect(self.update_label)
 
     def initUI(self):
         btn_hbox = QHBoxLayout()
@@ -253,7 +535,7 @@ class Timer(QWidget):
         
         # Connect buttons to their functions.
         self.btn.clicked.connect(lambda: Dialog(self, "Set Timer", "Input Hour, Minute, Second", 3, False, self.get_info))
-        self.btn2.clicked.connect(pygame.mixer.stop)
+        self.btn2.clicked.connect(lambda: engine.stop("Timer"))
         self.btn3.clicked.connect(self.reset)
         
         vbox.addWidget(self.title)
@@ -263,9 +545,13 @@ class Timer(QWidget):
         vbox.addLayout(btn_hbox)
         self.setLayout(vbox)
     
+    def running(self):
+        return self.name in engine.countdowns
+
     def reset(self):
-        self.timer.stop()
+        engine.cancel_timer(self.name)
         self.label.setText("00:00:00")
+        self.window().update_ticks()
 
     def get_info(self, parent, line_edits):
         input_data = []
@@ -285,37 +571,195 @@ class Timer(QWidget):
                     input_data.append(val)
                     
         # Calculate total seconds and validate the timer duration.
-        self.remaining_seconds = input_data[0] * 3600 + input_data[1] * 60 + input_data[2]
-        if self.remaining_seconds == 0:
+        total_seconds = input_data[0] * 3600 + input_data[1] * 60 + input_data[2]
+        if total_seconds == 0:
             QMessageBox.warning(self, "Invalid Timer", "Timer duration must be greater than 0.")
             problem = True
             
         # If valid, start the timer.
         if not problem:
             parent.close()
+            engine.start_timer(self.name, total_seconds)
             self.update_label()
-            self.timer.start(1000)
+            self.window().update_ticks()
 
     def update_label(self):
-        # Decrement the timer and update the display.
-        if self.remaining_seconds > 0:
-            hrs = self.remaining_seconds // 3600 
-            mins = (self.remaining_seconds % 3600) // 60
-            secs = self.remaining_seconds % 60
-            self.label.setText(f"{hrs:02}:{mins:02}:{secs:02}")
-            self.remaining_seconds -= 1
+        # Show the time left, worked out from the deadline. Ticks land on wall
+        # second edges rather than the countdown's own, so round to the nearest
+        # second, but never show zero before the expiry has actually fired.
+        remaining = engine.countdowns.remaining(self.name)
+        shown = max(1, round(remaining)) if remaining > 0 else 0
+        hrs = shown // 3600
+        mins = (shown % 3600) // 60
+        secs = shown % 60
+        self.label.setText(f"{hrs:02}:{mins:02}:{secs:02}")
+
+    def finished(self):
+        # The engine has finished the countdown and rung the sound.
+        self.label.setText("00:00:00")
+        self.window().update_ticks()
+
+# List model exposing a stopwatch's laps, one row per lap. Rows are only
+# formatted when the view draws them, so long lap lists cost nothing extra.
+class LapModel(QAbstractListModel):
+    def __init__(self, watch):
+        super().__init__()
+        self.watch = watch
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.watch.laps)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            i = index.row()
+            return f"Lap {i + 1:<7}{stopwatch.format_ns(self.watch.split(i))}   {stopwatch.format_ns(self.watch.laps[i])}"
+        return None
+
+    def lap(self):
+        row = len(self.watch.laps)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.watch.lap()
+        self.endInsertRows()
+
+    def reset(self):
+        self.beginResetModel()
+        self.watch.reset()
+        self.endResetModel()
+
+# Widget for a stopwatch with laps. Its display follows the screen's
+# refresh rate on its own timer, which only runs while the stopwatch is
+# running and the page is on screen; the time itself is kept by the
+# stopwatch's clock, so nothing is lost while the display is paused.
+class Stopwatch(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.watch = stopwatch.Stopwatch()
+        self.active = False # Whether the page is on screen.
+        self.shown = None
+        self.frames = QTimer(self)
+        self.frames.setTimerType(Qt.PreciseTimer)
+        self.frames.timeout.connect(self.update_label)
+        self.title = QLabel("Stopwatch")
+        self.label = QLabel(stopwatch.format_ns(0))
+        self.model = LapModel(self.watch)
+        self.laps = QListView()
+        self.laps.setModel(self.model)
+        self.laps.setUniformItemSizes(True)
+
+        self.start_btn = QPushButton("Start")
+        self.start_btn.setToolTip("Start or stop the stopwatch")
+        self.lap_btn = QPushButton("Lap")
+        self.lap_btn.setToolTip("Record a lap, or reset when stopped")
+        self.export_btn = QPushButton("Export...")
+        self.export_btn.setToolTip("Export laps as CSV")
+        self.start_btn.clicked.connect(self.toggle)
+        self.lap_btn.clicked.connect(self.lap_or_reset)
+        self.export_btn.clicked.connect(self.export_laps)
+
+        btn_hbox = QHBoxLayout()
+        btn_hbox.addWidget(self.start_btn)
+        btn_hbox.addWidget(self.lap_btn)
+        btn_hbox.addWidget(self.export_btn)
+        vbox = QVBoxLayout()
+        self.label.setAlignment(Qt.AlignCenter)
+        vbox.addWidget(self.title)
+        vbox.addWidget(self.label)
+        vbox.addWidget(self.laps)
+        vbox.addLayout(btn_hbox)
+        self.setLayout(vbox)
+
+    def set_active(self, active):
+        self.active = active
+        self.refresh()
+
+    def refresh(self):
+        if self.active and self.watch.running():
+            if not self.frames.isActive():
+                self.frames.start(self.frame_interval())
         else:
-            # When the timer finishes, stop it, reset the label, and play the sound.
-            self.timer.stop()
-            self.label.setText("00:00:00")
-            if not pygame.mixer.get_busy():
-                try:
-                    music = pygame.mixer.Sound(configs["Sound"])
-                except FileNotFoundError:
-                    QMessageBox.warning(self, "The file is not found", "The file doesn't exist")
-                else:
-                    music.play()
-                    self.window().tray_icon.showMessage("Timer", "Timer is done!", QSystemTrayIcon.Warning, 3000)
+            self.frames.stop()
+        self.update_label()
+
+    def frame_interval(self):
+        # Milliseconds per frame of the screen the window is on.
+        handle = self.window().windowHandle()
+        screen = handle.screen() if handle is not None else QApplication.primaryScreen()
+        rate = (screen.refreshRate() if screen is not None else 0) or REFRESH_RATE
+        return max(1, round(1000 / rate))
+
+    def update_label(self):
+        # Only touch the label when the shown millisecond has changed.
+        start = time.perf_counter()
+        text = stopwatch.format_ns(self.watch.elapsed())
+        if text != self.shown:
+            self.shown = text
+            self.label.setText(text)
+        engine.metrics.since("stopwatch frame", start)
+
+    def toggle(self):
+        if self.watch.running():
+            self.watch.stop()
+            self.start_btn.setText("Start")
+            self.lap_btn.setText("Reset")
+        else:
+            self.watch.start()
+            self.start_btn.setText("Stop")
+            self.lap_btn.setText("Lap")
+        self.refresh()
+
+    def lap_or_reset(self):
+        if self.watch.running():
+            self.model.lap()
+            self.laps.scrollToBottom()
+        else:
+            self.model.reset()
+            self.lap_btn.setText("Lap")
+            self.update_label()
+
+    def export_laps(self):
+        path = QFileDialog.getSaveFileName(self, caption="Export laps", filter="CSV (*.csv)")[0]
+        if path:
+            if not os.path.splitext(path)[1]:
+                path += ".csv"
+            try:
+                self.watch.export(path)
+            except OSError as error:
+                QMessageBox.warning(self, "The laps can't be exported", str(error))
+
+# Page with the timings and counters of the engine and the window,
+# refreshed once a second while it is on screen.
+class Diagnostics(QWidget):
+    def __init__(self, ticks):
+        super().__init__()
+        self.ticks = ticks
+        self.ticks.subscribe(self.update_stats, active=False)
+        self.title = QLabel("Diagnostics")
+        self.table = QLabel()
+        font = self.table.font()
+        font.setPixelSize(11)
+        self.table.setFont(font)
+        self.table.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        self.table.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.title)
+        vbox.addWidget(self.table)
+        vbox.addStretch()
+        self.setLayout(vbox)
+
+    def update_stats(self):
+        info = self.window().collect_diagnostics()
+        lines = [f"{'ms':<16}{'p50':>9}{'p99':>9}{'max':>9}{'count':>8}"]
+        for name, stats in info["timings_ms"].items():
+            if stats["count"]:
+                lines.append(f"{name:<16}{stats['p50']:>9.2f}{stats['p99']:>9.2f}{stats['max']:>9.2f}{stats['count']:>8}")
+        rings = info["dispatcher"]
+        lines.append("")
+        lines.append(f"rings: {rings['delivered']} played, {rings['coalesced']} coalesced, {rings['dropped']} dropped")
+        lines.append(f"alarms: {info['alarms']} ({info['scheduled']} scheduled), ticks/min: {info['tick_wakeups_per_minute']}")
+        watchdog = info["watchdog"]
+        lines.append(f"gaps: {watchdog['stalls']} stalls, {watchdog['clock_jumps']} clock jumps, "
+                     f"{watchdog['caught_up']} caught up, {watchdog['missed']} missed")
+        self.table.setText("\n".join(lines))
 
 # Main application window.
 class App(QMainWindow):
@@ -324,27 +768,48 @@ class App(QMainWindow):
         self.setMaximumSize(600, 300)
         self.setMinimumSize(400, 200)
         self.setWindowTitle("Clock App")
+        self.painted = False
+        # One style and set of fonts for the whole app; themes only change
+        # the palette.
+        self.theme_style = ThemeStyle()
+        QApplication.setStyle(self.theme_style)
+        install_fonts()
         # Set the application icon.
-        self.setWindowIcon(QIcon(os.path.join(file_path, "data", "logo.png")))
+        self.setWindowIcon(assets.icon("logo.png"))
         self.windows = QWidget()
 
-        # Initialize the three main widgets.
-        self.clock = Clock()
-        self.timer = Timer()
-        self.alarm = Alarm()
+        # Initialize the main widgets, sharing one once-a-second tick.
+        # Only the clock is built now; the other pages are built the first
+        # time they are shown. Alarms live in the engine, so they fire even
+        # if their page is never opened.
+        self.ticks = TickService(engine.metrics)
+        self.driver = Driver(self, engine)
+        self.clock = Clock(self.ticks)
+        self.timer = None
+        self.alarm = None
+        self.diagnostics = None
+        self.world = None
+        self.stopwatch = None
+        self.builders = {1: self.build_timer, 2: self.build_alarm, 3: self.build_diagnostics,
+                         4: self.build_world, 5: self.build_stopwatch}
 
         # Settings button.
-        self.setting_btn = QPushButton(QIcon(os.path.join(file_path, "data", "set.png")), "", self.windows)
+        self.setting_btn = QPushButton(assets.icon("set.png"), "", self.windows)
         self.setting_btn.setToolTip("Settings")
         self.setting_btn.setGeometry(10, 13, 30, 30)
         self.setting_btn.setObjectName("set")
+        self.setting_btn.setFlat(True)
         self.setting_btn.clicked.connect(self.settings)
 
-        # QStackedLayout to manage the three main views (Clock, Timer, Alarm).
+        # QStackedLayout to manage the main views (Clock, Timer, Alarm, Diagnostics, World Clock,
+        # Stopwatch).
         self.stack = QStackedLayout()
         self.stack.addWidget(self.clock)
-        self.stack.addWidget(self.timer)
-        self.stack.addWidget(self.alarm)
+        self.stack.addWidget(QWidget()) # Placeholders until the pages are built.
+        self.stack.addWidget(QWidget())
+        self.stack.addWidget(QWidget())
+        self.stack.addWidget(QWidget())
+        self.stack.addWidget(QWidget())
         self.current_index = 0
 
         # Navigation buttons for the stacked layout.
@@ -370,16 +835,13 @@ class App(QMainWindow):
         self.windows.setLayout(hbox)
         self.setCentralWidget(self.windows)
         
-        # Load custom stylesheet based on configuration
-        if configs["Theme"] == "dark":
-            self.initDarkStyle() 
-        elif configs["Theme"] == "light":
-            self.initLightStyle()
+        # Colours come from the theme's palette (see themes.py).
+        self.apply_theme(configs["Theme"])
         self.initTray()  # Initialize system tray icon.
     
     def initTray(self):
         # Set up the system tray icon and its menu.
-        self.tray_icon = QSystemTrayIcon(QIcon(os.path.join(file_path, "data", "logo.png")), self)
+        self.tray_icon = QSystemTrayIcon(assets.icon("logo.png"), self)
         self.tray_icon.setToolTip("Clock App")
 
         tray_menu = QMenu()
@@ -387,6 +849,18 @@ class App(QMainWindow):
         restore_action.triggered.connect(self.show)
         tray_menu.addAction(restore_action)
 
+        snooze_action = QAction("Snooze", self)
+        snooze_action.triggered.connect(lambda: engine.snooze())
+        tray_menu.addAction(snooze_action)
+
+        stop_action = QAction("Stop Sound", self)
+        stop_action.triggered.connect(lambda: engine.stop())
+        tray_menu.addAction(stop_action)
+
+        dump_action = QAction("Dump Diagnostics", self)
+        dump_action.triggered.connect(self.dump_diagnostics)
+        tray_menu.addAction(dump_action)
+
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(QApplication.quit)
         tray_menu.addAction(exit_action)
@@ -417,22 +891,17 @@ class App(QMainWindow):
                     continue
                 else:
                     if file[0]: # Check if a file was selected.
-                        configs["Sound"] = file[0]
+                        engine.set_sound(file[0])
                         # Update the label with the new sound file name.
                         name = os.path.split(configs["Sound"])[1]
                         song_name.setText(f"Current Sound is {name[:10]}..." if len(name) > 10 else f"Current Sound is {name}")
-                        self.save_configs()
                     break
         
         # Function to change theme
         def theme():
-            configs["Theme"] = combo.currentText().lower()
+            configs["Theme"] = combo.currentData()
             self.save_configs()
-            # Load custom stylesheet based on configuration
-            if configs["Theme"] == "dark":
-                self.initDarkStyle() 
-            elif configs["Theme"] == "light":
-                self.initLightStyle()
+            self.apply_theme(configs["Theme"])
 
         # Create and display the settings dialog.
         app = QDialog(self)
@@ -442,7 +911,7 @@ class App(QMainWindow):
         vbox = QVBoxLayout()
         # Create sound title.
         title = QLabel("Change sound")
-        title.setStyleSheet("font-weight: 700")
+        heading(title)
         title.setAlignment(Qt.AlignCenter)
         vbox.addWidget(title)
         # Display the current sound file name.
@@ -457,145 +926,266 @@ class App(QMainWindow):
         hbox = QHBoxLayout()
         # Create Theme title
         title = QLabel("Change Theme")
-        title.setStyleSheet("font-weight: 700")
+        heading(title)
         title.setAlignment(Qt.AlignCenter)
         hbox.addWidget(title)
-        # Display available themes
+        # Display available themes, including any defined in the config.
         combo = QComboBox()
-        combo.currentTextChanged.connect(theme)
-        second_theme = "light" if configs["Theme"] == "dark" else "dark"
-        combo.addItems([configs["Theme"].capitalize(), second_theme.capitalize()])
-        combo.setStyleSheet("font-size: 15px")
+        for name in theme_names(configs.get("Themes")):
+            combo.addItem(name.capitalize(), name)
+        combo.setCurrentIndex(max(0, combo.findData(configs["Theme"])))
+        combo.currentIndexChanged.connect(theme)
 
         hbox.addWidget(combo)
         
+        vbox.addLayout(hbox)
+
+        hbox = QHBoxLayout()
+        # Where alarms are kept: config.json, or alarms.db for large lists.
+        title = QLabel("Alarm Storage")
+        heading(title)
+        title.setAlignment(Qt.AlignCenter)
+        hbox.addWidget(title)
+        storage = QComboBox()
+        storage.addItems(["JSON", "SQLite"])
+        storage.setCurrentIndex(1 if configs["Storage"] == "sqlite" else 0)
+        storage.currentTextChanged.connect(lambda kind: engine.set_storage(kind.lower()))
+        hbox.addWidget(storage)
+        vbox.addLayout(hbox)
+
+        hbox = QHBoxLayout()
+        # Bulk import and export of the alarm list.
+        title = QLabel("Alarm List")
+        heading(title)
+        title.setAlignment(Qt.AlignCenter)
+        hbox.addWidget(title)
+        import_btn = QPushButton("Import...")
+        import_btn.clicked.connect(lambda: self.import_alarms(app))
+        hbox.addWidget(import_btn)
+        export_btn = QPushButton("Export...")
+        export_btn.clicked.connect(lambda: self.export_alarms(app))
+        hbox.addWidget(export_btn)
         vbox.addLayout(hbox)
         app.setLayout(vbox)
+        dialog_fonts(app)
         app.exec_()
 
+    def apply_theme(self, name):
+        # Switch to the theme called 'name', or the dark theme if it isn't
+        # valid. Compiled themes are cached, so switching back is cheap.
+        try:
+            theme = compile_theme(name, configs.get("Themes"))
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            theme = compile_theme("dark")
+        self.theme_style.apply(theme)
+
+    def import_alarms(self, parent):
+        # Add every alarm in a CSV or .ics file, or none if any is invalid.
+        path = QFileDialog.getOpenFileName(parent, caption="Import alarms", filter=ALARM_FILES)[0]
+        if path:
+            try:
+                count = engine.import_alarms(transfer.read(path, engine.ids))
+            except (OSError, ValueError) as error:
+                QMessageBox.warning(parent, "The alarms can't be imported", f"{os.path.basename(path)}: {error}")
+            else:
+                QMessageBox.information(parent, "Alarms imported", f"Added {count} alarms")
+
+    def export_alarms(self, parent):
+        path, chosen = QFileDialog.getSaveFileName(parent, caption="Export alarms", filter=ALARM_FILES)
+        if path:
+            if os.path.splitext(path)[1].lower() not in transfer.FORMATS:
+                path += ".ics" if ".ics" in chosen else ".csv"
+            try:
+                transfer.export(path, engine.store)
+            except OSError as error:
+                QMessageBox.warning(parent, "The alarms can't be exported", str(error))
+
+    def command(self, message):
+        # Carry out a request from another launch and return the reply.
+        reply = ipc.handle(engine, message)
+        if message.get("command") == "show":
+            self.showNormal()
+            self.raise_()
+            self.activateWindow()
+        elif message.get("command") == "start-timer" and self.timer is not None:
+            self.timer.update_label()
+        self.update_ticks()
+        return reply
+
     def prev(self):
         # Switch to the previous widget in the stacked layout.
-        self.current_index = (self.current_index - 1) % self.stack.count()
-        self.stack.setCurrentIndex(self.current_index)
+        self.show_page((self.current_index - 1) % self.stack.count())
 
     def next(self):
         # Switch to the next widget in the stacked layout.
-        self.current_index = (self.current_index + 1) % self.stack.count()
+        self.show_page((self.current_index + 1) % self.stack.count())
+
+    def show_page(self, index):
+        # Build the page on its first visit, replacing its placeholder.
+        builder = self.builders.pop(index, None)
+        if builder is not None:
+            placeholder = self.stack.widget(index)
+            self.stack.insertWidget(index, builder())
+            self.stack.removeWidget(placeholder)
+            placeholder.deleteLater()
+        self.current_index = index
         self.stack.setCurrentIndex(self.current_index)
+        self.update_ticks()
+
+    def build_timer(self):
+        self.timer = Timer(self.ticks)
+        return self.timer
+
+    def build_alarm(self):
+        self.alarm = Alarm()
+        return self.alarm
+
+    def build_diagnostics(self):
+        self.diagnostics = Diagnostics(self.ticks)
+        return self.diagnostics
+
+    def build_world(self):
+        self.world = WorldClock(self.ticks)
+        return self.world
+
+    def build_stopwatch(self):
+        self.stopwatch = Stopwatch()
+        return self.stopwatch
+
+    def collect_diagnostics(self):
+        info = engine.diagnostics()
+        info["tick_wakeups_per_minute"] = self.ticks.wakeups_per_minute()
+        return info
+
+    def dump_diagnostics(self):
+        # Write diagnostics.json next to the config, for monitoring to pick up.
+        path = os.path.join(engine.folder, "diagnostics.json")
+        try:
+            write_atomic(path, json.dumps(self.collect_diagnostics(), indent=2))
+        except OSError as error:
+            self.tray_icon.showMessage("Diagnostics", str(error), QSystemTrayIcon.Warning, 3000)
+        else:
+            self.tray_icon.showMessage("Diagnostics", f"Written to {path}", QSystemTrayIcon.Information, 3000)
+
+    def timer_finished(self, name):
+        if self.timer is not None and name == self.timer.name:
+            self.timer.finished()
+
+    def update_ticks(self):
+        # Only the page on screen needs refreshing every second, and the timer
+        # page only while a countdown is running. The stopwatch page refreshes
+        # every frame, on its own timer, only while on screen and running.
+        current = self.stack.currentWidget() if self.isVisible() else None
+        self.ticks.set_active(self.clock.update_time, current is self.clock)
+        if self.timer is not None:
+            self.ticks.set_active(self.timer.update_label, current is self.timer and self.timer.running())
+        if self.diagnostics is not None:
+            self.ticks.set_active(self.diagnostics.update_stats, current is self.diagnostics)
+        if self.world is not None:
+            self.ticks.set_active(self.world.update_time, current is self.world)
+        if self.stopwatch is not None:
+            self.stopwatch.set_active(current is self.stopwatch)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_ticks()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            QTimer.singleShot(0, self.after_first_paint)
+
+    def after_first_paint(self):
+        # Work the first frame doesn't need: open the audio device and decode
+        # the alarm sound so the first alarm doesn't wait on either.
+        engine.player.warm(engine.sound())
+
+    def hideEvent(self, event):
+        # In the tray nothing is on screen: all per-second refreshes stop and
+        # only the alarm and countdown deadlines stay armed.
+        super().hideEvent(event)
+        self.update_ticks()
+        self.suspend_audio()
+
+    def suspend_audio(self):
+        # While in the tray, close the audio device once nothing is playing.
+        if not self.isVisible():
+            if engine.player.busy():
+                QTimer.singleShot(5000, self.suspend_audio)
+            else:
+                engine.player.suspend()
 
     def save(self):
-        # Update the alarm list in the global configs dictionary.
-        configs["Alarms"] = Alarm.times
-        # Save the updated configs to the file.
+        # The engine's config already holds the alarm store; save it all.
         self.save_configs()
     
     def save_configs(self):
         # A separate function for saving to prevent code duplication.
-        try:
-            with open(os.path.join(save_folder, "config.json"), "w") as f:
-                json.dump(configs, f, indent=2)
-        except FileNotFoundError:
-            # Recreate the file if it's somehow missing.
-            with open(os.path.join(save_folder, "config.json"), "w") as f:
-                json.dump(configs, f, indent=2)
+        # The actual write happens on the writer's thread, off the GUI.
+        engine.save()
 
     def closeEvent(self, event):
         self.save()
         # Intercept the close event to hide the window to the system tray instead of exiting.
         event.ignore()
         self.hide()
-        self.tray_icon.showMessage("Clock App", "App is still running in the tray.", QIcon("data/logo.png"), 3000)
-
-    def initDarkStyle(self):
-        # Apply a custom CSS stylesheet for a dark theme and consistent styling.
-        self.setStyleSheet("""
-            QWidget{
-                font-family: Consolas;
-                background-color: black;
-                color: white
-            }
-            QPushButton {
-                font-size: 18px;
-                width: 40px;
-                height: 20px;
-                background-color: grey;
-                border-radius: 10px;
-                padding: 5px;
-                color: black
-            }
-            QPushButton:hover{
-                background-color: green
-            }
-            QLabel{
-                font-size: 20px;
-            }
-            QDialog QLabel{
-                font-size: 18px;
-            }
-            QLineEdit, QListWidget{
-                font-size: 15px;
-            }
-            #set{
-                background-color: black;
-            }
-            #set:hover{
-                background-color: rgb(53, 53, 53);
-            }
-            QScrollBar{
-                background-color: white;
-                color: black
-            }
-        """)
-
-    def initLightStyle(self):
-        # Apply a custom CSS stylesheet for a light theme and consistent styling.
-        self.setStyleSheet("""
-            QWidget{
-                font-family: Consolas;
-                background-color: white;
-                color: black
-            }
-            QPushButton {
-                font-size: 18px;
-                width: 40px;
-                height: 20px;
-                background-color: grey;
-                border-radius: 10px;
-                padding: 5px;
-                color: black
-            }
-            QPushButton:hover{
-                background-color: green
-            }
-            QLabel{
-                font-size: 20px;
-            }
-            QDialog QLabel{
-                font-size: 18px;
-            }
-            QLineEdit, QListWidget{
-                font-size: 15px;
-            }
-            #set{
-                background-color: white;
-            }
-            #set:hover{
-                background-color: rgb(53, 53, 53);
-            }
-            QScrollBar{
-                background-color: white;
-                color: black
-            }
-        """)
+        self.tray_icon.showMessage("Clock App", "App is still running in the tray.", assets.icon("logo.png"), 3000)
 
 # Main function to run the application.
-def main():
+def main(args):
+    engine.load()
     app = QApplication(sys.argv)
     # Ensure the application stays running even when the main window is closed.
     app.setQuitOnLastWindowClosed(False)
+    # Write out any pending config changes before exiting.
+    app.aboutToQuit.connect(engine.close)
     window = App()
+    # Later launches forward their command lines to this one.
+    instance = Instance(window)
+    if not instance.server.isListening():
+        sys.exit(ipc.report([{"error": "The clock app is already running."}]))
+    ipc.report([window.command(message) for message in ipc.commands(args)])
     window.show()
     sys.exit(app.exec_())
 
+# Run only the engine, without any window, logging events to stdout.
+def daemon(args):
+    engine.load()
+    engine.listeners.append(log)
+    ipc.report([ipc.handle(engine, message) for message in ipc.commands(args)])
+
+    async def run():
+        server = await ipc.listen(engine)
+        try:
+            await serve(engine)
+        finally:
+            if server is not None:
+                server.close()
+                if os.path.exists(ipc.SOCKET_NAME):
+                    os.unlink(ipc.SOCKET_NAME)
+    asyncio.run(run())
+
+# Import or export alarms from the command line, without any window,
+# when the app isn't running.
+def transfer_alarms(args):
+    engine.load()
+    try:
+        status = ipc.report([ipc.handle(engine, message) for message in ipc.commands(args)])
+    finally:
+        engine.close()
+    sys.exit(status)
+
+# The engine behind the window, with the alarm list exposed as a Qt model.
+# 'configs' is the engine's configuration dictionary.
+engine = Engine(store=AlarmModel(AlarmStore()))
+configs = engine.configs
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if args.daemon:
+        daemon(args)
+    elif (args.import_path or args.export_path) and args.add_alarm is None and args.start_timer is None:
+        transfer_alarms(args)
+    else:
+        main(args)
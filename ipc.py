@@ -0,0 +1,202 @@
+# Single-instance support for the clock app. The running instance listens
+# on a local socket (QLocalServer in the window, a Unix socket in the
+# daemon); a later launch parses its command line, sends it there as one
+# JSON line, prints the reply and exits. The sending side only needs the
+# standard library, so forwarding never loads Qt widgets or audio.
+import argparse, json, os, re, socket, sys, tempfile
+
+import transfer
+
+# Where the running instance listens: a per-user socket file on Unix, a
+# per-user named pipe on Windows.
+if hasattr(os, "getuid"):
+    SOCKET_NAME = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+                               f"ccu-clock-{os.getuid()}.sock")
+else:
+    SOCKET_NAME = f"ccu-clock-{os.environ.get('USERNAME', 'user')}"
+
+# Longest request accepted, in bytes.
+MAX_MESSAGE = 65536
+
+# Seconds to wait for the running instance to answer.
+TIMEOUT = 2.0
+
+# Name of the countdown shown on the Timer page.
+TIMER_NAME = "timer"
+
+DURATION = re.compile(r"(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$")
+
+
+def alarm_time(text):
+    try:
+        return transfer.parse_time(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def duration(text):
+    # Seconds in "10m", "1h30m", "90s" or "1:30:00".
+    text = text.strip().lower()
+    match = DURATION.match(text)
+    if text and match is not None:
+        hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    else:
+        try:
+            hours, minutes, seconds = ([0, 0] + [int(part) for part in text.split(":")])[-3:]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{text!r} is not a duration like 10m or 1:30:00") from None
+    total = hours * 3600 + minutes * 60 + seconds
+    if total <= 0:
+        raise argparse.ArgumentTypeError("Timer duration must be greater than 0.")
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clock app with alarms and a timer.")
+    parser.add_argument("--daemon", action="store_true", help="run the alarms and timers without a window")
+    parser.add_argument("--add-alarm", type=alarm_time, metavar="TIME", help="add a daily alarm, e.g. 07:30AM")
+    parser.add_argument("--start-timer", type=duration, metavar="DURATION", help="start the timer, e.g. 10m")
+    parser.add_argument("--import", dest="import_path", metavar="FILE", help="add the alarms in a .csv or .ics file")
+    parser.add_argument("--export", dest="export_path", metavar="FILE", help="write all alarms to a .csv or .ics file")
+    args, _ = parser.parse_known_args(argv) # Leave Qt's own options to QApplication.
+    return args
+
+
+def commands(args):
+    # The requests the command line asks for, in the order they are carried out.
+    messages = []
+    if args.import_path:
+        messages.append({"command": "import", "path": os.path.abspath(args.import_path)})
+    if args.export_path:
+        messages.append({"command": "export", "path": os.path.abspath(args.export_path)})
+    if args.add_alarm is not None:
+        messages.append({"command": "add-alarm", "minute": args.add_alarm})
+    if args.start_timer is not None:
+        messages.append({"command": "start-timer", "seconds": args.start_timer})
+    return messages
+
+
+def encode(message):
+    return json.dumps(message).encode() + b"\n"
+
+
+def decode(line):
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return {}
+    return message if isinstance(message, dict) else {}
+
+
+def send(message, timeout=TIMEOUT):
+    # Send 'message' to the running instance and return its reply, or None
+    # if no instance is running.
+    data = encode(message)
+    if hasattr(socket, "AF_UNIX"):
+        try:
+            with socket.socket(socket.AF_UNIX) as client:
+                client.settimeout(timeout)
+                client.connect(SOCKET_NAME)
+                client.sendall(data)
+                reply = client.makefile("rb").readline(MAX_MESSAGE)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except OSError as error:
+            return {"error": f"the running instance didn't answer: {error}"}
+    else:
+        # Windows named pipe, the same as QLocalServer listens on.
+        from PyQt5.QtNetwork import QLocalSocket
+        client = QLocalSocket()
+        client.connectToServer(SOCKET_NAME)
+        if not client.waitForConnected(int(timeout * 1000)):
+            return None
+        client.write(data)
+        client.waitForBytesWritten(int(timeout * 1000))
+        reply = b""
+        while not reply.endswith(b"\n") and client.waitForReadyRead(int(timeout * 1000)):
+            reply += bytes(client.readAll())
+        client.disconnectFromServer()
+    if not reply:
+        return {"error": "the running instance didn't answer"}
+    return decode(reply)
+
+
+def forward(args):
+    # If the app is already running, hand it this command line and exit
+    # with its replies; otherwise return so this process starts up.
+    messages = commands(args) or [{"command": "ping" if args.daemon else "show"}]
+    replies = []
+    for message in messages:
+        reply = send(message)
+        if reply is None:
+            if not replies:
+                return
+            reply = {"error": "the running instance has exited"}
+        replies.append(reply)
+    if messages[0]["command"] == "ping":
+        sys.exit("The clock app is already running.")
+    sys.exit(report(replies))
+
+
+def report(replies):
+    # Print replies from handle() and return the exit status.
+    status = 0
+    for reply in replies:
+        if "error" in reply:
+            print(reply["error"], file=sys.stderr)
+            status = 1
+        elif reply.get("ok"):
+            print(reply["ok"])
+    return status
+
+
+def handle(engine, message):
+    # Carry out a forwarded request on 'engine' and return the reply:
+    # {"ok": text} or {"error": text}.
+    command = message.get("command")
+    try:
+        if command in ("show", "ping"):
+            return {"ok": ""}
+        if command == "add-alarm":
+            record = engine.add_alarm(int(message["minute"]))
+            engine.save()
+            return {"ok": f"Alarm set for {record.label()}"}
+        if command == "start-timer":
+            seconds = int(message["seconds"])
+            engine.start_timer(TIMER_NAME, seconds)
+            return {"ok": f"Timer started for {seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"}
+        if command == "import":
+            return {"ok": f"Added {engine.import_alarms(transfer.read(message['path'], engine.ids))} alarms"}
+        if command == "export":
+            transfer.export(message["path"], engine.store)
+            return {"ok": f"Exported {len(engine.store)} alarms"}
+    except (KeyError, TypeError, ValueError, OSError) as error:
+        return {"error": f"{message.get('path', command)}: {error}"}
+    return {"error": f"unknown command {command!r}"}
+
+
+async def listen(engine):
+    # Serve forwarded requests on the running asyncio loop, for the daemon.
+    # Returns the server, or None where Unix sockets aren't available.
+    import asyncio
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    async def answer(reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+            writer.write(encode(handle(engine, decode(line))))
+            await writer.drain()
+        except (asyncio.TimeoutError, ValueError, OSError):
+            pass # Too slow or too long; just hang up.
+        finally:
+            writer.close()
+
+    # forward() found nobody answering, so any socket file is left over.
+    if os.path.exists(SOCKET_NAME):
+        os.unlink(SOCKET_NAME)
+    umask = os.umask(0o077) # Only this user may connect.
+    try:
+        return await asyncio.start_unix_server(answer, SOCKET_NAME, limit=MAX_MESSAGE)
+    finally:
+        os.umask(umask)
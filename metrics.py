@@ -0,0 +1,69 @@
+# Low-overhead timing instrumentation for the clock app's hot paths.
+# Nothing in here touches Qt, so the engine, the daemon and the simulation
+# record into it the same way the window does.
+import time
+from array import array
+
+# Samples kept per measurement for the percentiles.
+WINDOW = 1024
+
+
+class Histogram:
+    # The last WINDOW samples of one measurement in a ring buffer, plus the
+    # count and the largest value since start. Adding a sample is a couple
+    # of array stores; percentiles are only worked out when asked for.
+    __slots__ = ("samples", "next", "count", "peak")
+
+    def __init__(self):
+        self.samples = array("d")
+        self.next = 0
+        self.count = 0
+        self.peak = float("-inf")
+
+    def add(self, value):
+        if len(self.samples) < WINDOW:
+            self.samples.append(value)
+        else:
+            self.samples[self.next] = value
+        self.next = (self.next + 1) % WINDOW
+        self.count += 1
+        if value > self.peak:
+            self.peak = value
+
+    def summary(self):
+        # p50, p99 and max of the recent samples, nearest rank.
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": 0}
+        n = len(ordered)
+        return {"count": self.count, "p50": round(ordered[n // 2], 3),
+                "p99": round(ordered[min(n - 1, n * 99 // 100)], 3),
+                "max": round(ordered[-1], 3), "peak": round(self.peak, 3)}
+
+
+class Metrics:
+    # Histograms by name, all in milliseconds. Durations are measured with
+    # time.perf_counter():
+    #
+    #     start = time.perf_counter()
+    #     ...
+    #     metrics.since("poll", start)
+    #
+    # Samples may come from the config writer's thread too; a sample lost to
+    # a race there only thins the histogram, so there is no lock.
+    def __init__(self):
+        self.histograms = {}
+        self.started = time.time()
+
+    def record(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(value)
+
+    def since(self, name, start):
+        # Record the milliseconds since perf_counter() time 'start'.
+        self.record(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        return {name: self.histograms[name].summary() for name in sorted(self.histograms)}
@@ -0,0 +1,466 @@
+# Scheduling helpers for the clock app.
+# Nothing in here touches Qt or pygame so it can be driven and benchmarked on its own.
+import bisect, datetime, heapq, time
+
+
+def next_occurrence(minute, after):
+    # Return the timestamp of the start of the next local minute-of-day 'minute'
+    # that has not fully passed at 'after'. An alarm set for the current
+    # minute is therefore still due straight away.
+    day = datetime.datetime.fromtimestamp(after).date()
+    at = datetime.time(minute // 60, minute % 60)
+    while True:
+        start = datetime.datetime.combine(day, at).timestamp()
+        if start + 60 > after:
+            return start
+        day += datetime.timedelta(days=1)
+
+
+def to_24h(hour, meridiem):
+    # Convert a 12-hour clock value to a 0-23 hour.
+    return int(hour) % 12 + (12 if meridiem == "PM" else 0)
+
+
+def alarm_minute(hour, minute, meridiem):
+    # Minute of the day for a 12-hour alarm time as typed in, raising
+    # ValueError with a message for the user if it isn't a valid time.
+    if minute > 59:
+        raise ValueError("Minutes is greater than 59")
+    if hour > 12:
+        raise ValueError("Hours is greater than 12")
+    return to_24h(hour, meridiem) * 60 + minute
+
+
+# AlarmRecord flag bits.
+ENABLED = 1
+
+# Weekday bits for Rule day masks, Monday first like date.weekday().
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+EVERY_DAY = 0b1111111
+WEEKDAYS = 0b0011111
+WEEKEND = 0b1100000
+
+# DAYS_AHEAD[mask][weekday]: days from 'weekday' to the next day in 'mask',
+# counting 'weekday' itself; None for the empty mask.
+DAYS_AHEAD = [[next((k for k in range(7) if mask >> (weekday + k) % 7 & 1), None) for weekday in range(7)]
+              for mask in range(128)]
+
+
+def local_start(day, minute):
+    # Timestamp of minute-of-day 'minute' on the local date with ordinal 'day'.
+    return datetime.datetime.combine(datetime.date.fromordinal(day), datetime.time(minute // 60, minute % 60)).timestamp()
+
+
+class Rule:
+    # When an alarm goes off, compiled from its config form. An alarm rings
+    # at 'minute' and, with "every", every that many minutes until "until"
+    # (a minute of the day), on the weekdays in the "days" mask, between the
+    # "from" and "to" dates if given. "on" is a single date: the alarm rings
+    # that day only and is then switched off.
+    #
+    # The ring times of one day are a sorted tuple of minutes and the days
+    # come from the DAYS_AHEAD table, so next() is a bisect plus a table
+    # lookup. Rules are interned by compile_rule(), so alarms with the same
+    # rule share one object.
+    __slots__ = ("minute", "spec", "days", "slots", "first", "last", "once")
+
+    def __init__(self, minute, spec):
+        self.minute = minute
+        self.spec = spec
+        self.days = spec.get("days", EVERY_DAY)
+        every = spec.get("every", 0)
+        self.slots = tuple(range(minute, spec.get("until", 1439) + 1, every)) if every else (minute,)
+        self.once = "on" in spec
+        self.first = self.last = None
+        if self.once:
+            self.first = self.last = datetime.date.fromisoformat(spec["on"]).toordinal()
+        if "from" in spec:
+            self.first = datetime.date.fromisoformat(spec["from"]).toordinal()
+        if "to" in spec:
+            self.last = datetime.date.fromisoformat(spec["to"]).toordinal()
+
+    def __repr__(self):
+        return f"Rule({self.minute}, {self.spec})"
+
+    def allowed(self, day):
+        # The first date ordinal from 'day' on that the rule rings, or None.
+        if self.first is not None and day < self.first:
+            day = self.first
+        ahead = DAYS_AHEAD[self.days][(day - 1) % 7]
+        if ahead is None:
+            return None
+        day += ahead
+        if self.last is not None and day > self.last:
+            return None
+        return day
+
+    def next(self, after):
+        # Start of the first ring whose minute hasn't fully passed at
+        # 'after', or None if the rule never rings again.
+        if not self.spec:
+            return next_occurrence(self.minute, after)
+        slots = self.slots
+        day = self.allowed(datetime.date.fromtimestamp(after).toordinal())
+        while day is not None:
+            base, following = local_start(day, 0), local_start(day + 1, 0)
+            if following - base == 86400:
+                i = bisect.bisect_right(slots, (after - 60 - base) / 60)
+                if i < len(slots):
+                    return base + slots[i] * 60
+            else:
+                # A DST change: slots no longer map to times in order.
+                times = sorted(t for t in (local_start(day, slot) for slot in slots) if t + 60 > after)
+                if times:
+                    return times[0]
+            day = self.allowed(day + 1)
+        return None
+
+    def dates(self, days, midnights):
+        # (ordinal, local midnight, next local midnight) of every date the
+        # rule rings on in 'days', a range of date ordinals. It only depends
+        # on the rule's calendar, so rules with the same one can share it.
+        # 'midnights' caches the local midnights between calls.
+        dates = []
+        day = self.allowed(days[0])
+        while day is not None and day <= days[1]:
+            midnight = midnights.get(day)
+            if midnight is None:
+                midnight = midnights[day] = (local_start(day, 0), local_start(day + 1, 0))
+            dates.append((day, *midnight))
+            day = self.allowed(day + 1)
+        return dates
+
+    def between(self, after, end, dates):
+        # Start times of every ring on 'dates' (from dates()) before 'end'
+        # whose minute hasn't fully passed at 'after', in order. On dates
+        # without a DST change, ring times are just offsets from midnight.
+        times = []
+        start = after - 60
+        slots = self.slots
+        for day, base, following in dates:
+            if following - base == 86400:
+                # Only the slots inside the window, found by bisecting.
+                low = bisect.bisect_right(slots, (start - base) / 60)
+                high = bisect.bisect_left(slots, (end - base) / 60)
+                times.extend([base + slot * 60 for slot in slots[low:high]])
+            else:
+                # Slots in a skipped hour land on the same instants as the
+                # ones after it, so keep each instant once.
+                times.extend(sorted({t for t in (local_start(day, slot) for slot in slots) if start < t < end}))
+        return times
+
+    def label(self):
+        # Short description of everything but the time, e.g. "Mon-Fri".
+        parts = []
+        if len(self.slots) > 1:
+            until = AlarmRecord(0, self.slots[-1]).label()
+            parts.append(f"every {self.spec['every']} min until {until}")
+        if self.days == WEEKDAYS:
+            parts.append("Mon-Fri")
+        elif self.days == WEEKEND:
+            parts.append("Sat-Sun")
+        elif self.days != EVERY_DAY:
+            parts.append(" ".join(name for bit, name in enumerate(DAY_NAMES) if self.days >> bit & 1))
+        if self.once:
+            parts.append(f"on {self.spec['on']}")
+        elif self.first is not None or self.last is not None:
+            parts.append(f"{self.spec.get('from', '')} to {self.spec.get('to', '')}".strip())
+        return ", ".join(parts)
+
+
+# Compiled rules by (minute, spec items), shared between alarms.
+rules = {}
+
+
+def compile_rule(minute, spec=None):
+    # Return the shared Rule for 'minute' and config-form 'spec' (a dict with
+    # any of "days", "every", "until", "from", "to" and "on"), raising
+    # ValueError if it is invalid. Defaults are dropped from the spec.
+    spec = {key: value for key, value in (spec or {}).items()
+            if value != {"days": EVERY_DAY, "every": 0, "until": 1439}.get(key)}
+    key = (minute, tuple(sorted(spec.items())))
+    rule = rules.get(key)
+    if rule is None:
+        unknown = set(spec) - {"days", "every", "until", "from", "to", "on"}
+        if unknown:
+            raise ValueError(f"unknown alarm rule fields: {', '.join(sorted(unknown))}")
+        if not 0 <= minute < 1440:
+            raise ValueError(f"alarm minute {minute} is out of range")
+        if not 0 < spec.get("days", EVERY_DAY) <= EVERY_DAY:
+            raise ValueError("an alarm needs at least one day")
+        if spec.get("every", 0) < 0 or not minute <= spec.get("until", 1439) < 1440:
+            raise ValueError("a repeating alarm has to stop after it starts")
+        rule = rules[key] = Rule(minute, spec)
+        if rule.first is not None and rule.last is not None and rule.first > rule.last:
+            del rules[key]
+            raise ValueError("alarm date range ends before it starts")
+    return rule
+
+
+class AlarmRecord:
+    # One alarm: a stable id, the minute of the day it goes off (0-1439),
+    # flag bits and its compiled Rule. Slots keep it to a single small
+    # object per alarm.
+    __slots__ = ("id", "minute", "flags", "rule")
+
+    def __init__(self, alarm_id, minute, flags=ENABLED, rule=None):
+        self.id = alarm_id
+        self.minute = minute
+        self.flags = flags
+        self.rule = compile_rule(minute) if rule is None else rule
+
+    def __repr__(self):
+        return f"AlarmRecord({self.id}, {self.minute}, {self.flags}, {self.rule.spec})"
+
+    @classmethod
+    def from_config(cls, alarm_id, data):
+        # Build a record from its config form, [minute, flags] for a daily
+        # alarm or [minute, flags, rule spec].
+        minute = int(data[0])
+        return cls(alarm_id, minute, int(data[1]), compile_rule(minute, data[2] if len(data) > 2 else None))
+
+    def to_config(self):
+        if self.rule.spec:
+            return [self.minute, self.flags, self.rule.spec]
+        return [self.minute, self.flags]
+
+    def label(self):
+        # The alarm as shown in the list, e.g. "07:30 AM" or "07:30 AM  Mon-Fri (off)".
+        hour, minute = divmod(self.minute, 60)
+        text = f"{hour % 12 or 12:02}:{minute:02} {'PM' if hour >= 12 else 'AM'}"
+        if self.rule.spec:
+            text += "  " + self.rule.label()
+        if not self.flags & ENABLED:
+            text += " (off)"
+        return text
+
+
+class AlarmSchedule:
+    # Keeps every alarm in a min-heap ordered by its next fire timestamp, so the
+    # earliest deadline is known without walking the whole alarm list.
+    # Removed alarms are dropped lazily when they reach the top of the heap.
+    def __init__(self, now=time.time):
+        self.now = now
+        self.heap = []
+        self.alarms = {} # alarm id -> (Rule, next deadline)
+
+    def __len__(self):
+        return len(self.alarms)
+
+    def add(self, alarm_id, rule, deadline=None):
+        # Schedule alarm 'alarm_id' by 'rule', a Rule or a minute of the day
+        # for a daily alarm, at 'deadline' if it is already known. Returns
+        # its first deadline, or None (and leaves it unscheduled) if the
+        # rule never rings again.
+        if not isinstance(rule, Rule):
+            rule = compile_rule(rule)
+        if deadline is None:
+            deadline = rule.next(self.now())
+        if deadline is None:
+            return None
+        self.alarms[alarm_id] = (rule, deadline)
+        heapq.heappush(self.heap, (deadline, alarm_id))
+        return deadline
+
+    def remove(self, alarm_id):
+        self.alarms.pop(alarm_id, None)
+        # Rebuild the heap once stale entries outnumber live ones so heavy
+        # churn can't grow it without bound.
+        if len(self.heap) > 2 * len(self.alarms) + 16:
+            self.heap = [(entry[1], i) for i, entry in self.alarms.items()]
+            heapq.heapify(self.heap)
+
+    def clear(self):
+        self.heap.clear()
+        self.alarms.clear()
+
+    def _prune(self):
+        # Discard heap entries that belong to removed or rescheduled alarms.
+        heap = self.heap
+        while heap:
+            deadline, alarm_id = heap[0]
+            entry = self.alarms.get(alarm_id)
+            if entry is not None and entry[1] == deadline:
+                return
+            heapq.heappop(heap)
+
+    def next_deadline(self):
+        # Timestamp of the earliest pending alarm, or None if there are none.
+        self._prune()
+        return self.heap[0][0] if self.heap else None
+
+    def peek(self):
+        # (deadline, alarm id) of the earliest pending alarm, or None.
+        self._prune()
+        return self.heap[0] if self.heap else None
+
+    def pop_due(self, now=None):
+        # Return the ids of every alarm whose deadline has been reached and
+        # schedule each of them for its following occurrence.
+        return [alarm_id for alarm_id, _ in self.pop_occurrences(now)]
+
+    def pop_occurrences(self, now=None):
+        # Like pop_due(), but as (alarm id, deadline) pairs, so each
+        # occurrence can be told apart from the alarm's other days. Alarms
+        # whose rule has no occurrence left are unscheduled.
+        now = self.now() if now is None else now
+        due = []
+        heap = self.heap
+        while True:
+            self._prune()
+            if not heap or heap[0][0] > now:
+                return due
+            deadline, alarm_id = heapq.heappop(heap)
+            rule = self.alarms[alarm_id][0]
+            following = rule.next(deadline + 60)
+            if following is None:
+                del self.alarms[alarm_id]
+            else:
+                self.alarms[alarm_id] = (rule, following)
+                heapq.heappush(heap, (following, alarm_id))
+            due.append((alarm_id, deadline))
+
+    def upcoming(self, seconds=86400, now=None):
+        # Every ring in the next 'seconds' as (start time, alarm ids) pairs,
+        # in time order. Ring times are worked out once per distinct rule,
+        # and the dates once per distinct calendar, then bucketed by start
+        # time, so alarms sharing a rule cost a list append each.
+        start = self.now() if now is None else now
+        end = start + seconds
+        # From the day before, for a ring still in its minute at midnight.
+        days = (datetime.date.fromtimestamp(start).toordinal() - 1, datetime.date.fromtimestamp(end).toordinal())
+        midnights = {}
+        calendars = {} # (days, first, last) -> dates
+        times = {} # rule -> ring times
+        rings = {} # ring time -> alarm ids
+        for alarm_id, (rule, _) in self.alarms.items():
+            ring_times = times.get(rule)
+            if ring_times is None:
+                calendar = (rule.days, rule.first, rule.last)
+                dates = calendars.get(calendar)
+                if dates is None:
+                    dates = calendars[calendar] = rule.dates(days, midnights)
+                ring_times = times[rule] = rule.between(start, end, dates)
+            for t in ring_times:
+                bucket = rings.get(t)
+                if bucket is None:
+                    rings[t] = [alarm_id]
+                else:
+                    bucket.append(alarm_id)
+        return sorted(rings.items())
+
+
+class Countdowns:
+    # Named countdowns measured against time.monotonic() end deadlines rather
+    # than by counting ticks, so late or skipped ticks never add drift.
+    # All of them share one heap, so a single timer can serve any number.
+    def __init__(self, now=time.monotonic):
+        self.now = now
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, name):
+        return name in self.deadlines
+
+    def start(self, name, seconds):
+        # Start (or restart) the countdown 'name' and return its deadline.
+        deadline = self.now() + seconds
+        self.deadlines[name] = deadline
+        heapq.heappush(self.heap, (deadline, name))
+        return deadline
+
+    def cancel(self, name):
+        self.deadlines.pop(name, None)
+
+    def remaining(self, name, now=None):
+        # Seconds left on 'name', or 0 if it isn't running.
+        deadline = self.deadlines.get(name)
+        if deadline is None:
+            return 0
+        now = self.now() if now is None else now
+        return max(0.0, deadline - now)
+
+    def _prune(self):
+        heap = self.heap
+        while heap and self.deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def next_deadline(self):
+        # Monotonic time of the earliest running countdown, or None.
+        self._prune()
+        return self.heap[0][0] if self.heap else None
+
+    def peek(self):
+        # (deadline, name) of the earliest running countdown, or None.
+        self._prune()
+        return self.heap[0] if self.heap else None
+
+    def pop_expired(self, now=None):
+        # Remove and return the names of every countdown that has run out.
+        now = self.now() if now is None else now
+        expired = []
+        heap = self.heap
+        while True:
+            self._prune()
+            if not heap or heap[0][0] > now:
+                return expired
+            _, name = heapq.heappop(heap)
+            del self.deadlines[name]
+            expired.append(name)
+
+
+class AlarmStore:
+    # Alarms by stable id, kept in the order they were added. Ids only ever
+    # grow, so the row of an id is found by bisecting the id list.
+    def __init__(self):
+        self.ids = []
+        self.alarms = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        # Alarms in row order; dicts keep insertion order, which is id order.
+        return iter(self.alarms.values())
+
+    def __contains__(self, alarm_id):
+        return alarm_id in self.alarms
+
+    def __getitem__(self, alarm_id):
+        return self.alarms[alarm_id]
+
+    def add(self, alarm_id, alarm):
+        # Append 'alarm' under 'alarm_id', which must be larger than any id so far.
+        if self.ids and alarm_id <= self.ids[-1]:
+            raise ValueError(f"alarm id {alarm_id} is not newer than {self.ids[-1]}")
+        self.ids.append(alarm_id)
+        self.alarms[alarm_id] = alarm
+        return len(self.ids) - 1
+
+    def extend(self, records):
+        # Append AlarmRecords, keyed by their ids.
+        for record in records:
+            self.add(record.id, record)
+
+    def updated(self, alarm_id):
+        # Called after the record of 'alarm_id' was changed in place.
+        pass
+
+    def row(self, alarm_id):
+        # Row of 'alarm_id', or -1 if it isn't stored.
+        row = bisect.bisect_left(self.ids, alarm_id)
+        if row < len(self.ids) and self.ids[row] == alarm_id:
+            return row
+        return -1
+
+    def remove(self, alarm_id):
+        # Remove 'alarm_id' and return the row it occupied.
+        row = self.row(alarm_id)
+        if row < 0:
+            raise KeyError(alarm_id)
+        del self.ids[row]
+        del self.alarms[alarm_id]
+        return row
@@ -0,0 +1,546 @@
+# Virtual-time simulation of the alarm and timer engine.
+# Drives Engine, and the Qt window on the offscreen platform, through days of
+# virtual time in seconds, and checks that every alarm and countdown fires
+# exactly once per occurrence and on time. Exits non-zero on any failure.
+# Run with: python simulate.py [scenario ...] [options]   (-h lists them)
+import os
+
+# No display or sound card needed.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse, collections, datetime, random, sys, tempfile, time
+
+from engine import Engine
+from bench import random_rule_records
+from scheduler import AlarmRecord, AlarmSchedule
+
+
+class VirtualClock:
+    # Wall and monotonic time that only move when advance() is called.
+    def __init__(self, start):
+        self.wall = start
+        self.mono = 1000.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, seconds):
+        self.wall += seconds
+        self.mono += seconds
+
+    def jump(self, seconds):
+        # Move only the wall clock, as a suspend (forward) or setting the clock does.
+        self.wall += seconds
+
+
+def set_timezone(name):
+    # Switch the process's local time zone (POSIX only).
+    os.environ["TZ"] = name
+    time.tzset()
+
+
+def local_midnight(year, month, day, days=0):
+    # Local midnight 'days' calendar days after the given date.
+    return datetime.datetime.combine(datetime.date(year, month, day) + datetime.timedelta(days), datetime.time()).timestamp()
+
+
+class VirtualPlayer:
+    # Stands in for audio.Player with sounds that last 'length' seconds of
+    # virtual time on one of 'channels' channels, and keeps the most that
+    # were ever playing at once and how often each key was played.
+    def __init__(self, clock, length, channels=8):
+        self.clock = clock
+        self.length = length
+        self.channels = channels
+        self.voices = {} # key -> virtual time the sound ends
+        self.most = 0
+        self.plays = collections.Counter() # key -> sounds started
+
+    def can_play(self, path):
+        return sum(self.playing(key) for key in list(self.voices)) < self.channels
+
+    def play(self, path, key=None):
+        self.voices[key] = self.clock.monotonic() + self.length
+        self.plays[key] += 1
+        self.most = max(self.most, len(self.voices))
+
+    def playing(self, key):
+        if self.voices.get(key, 0) > self.clock.monotonic():
+            return True
+        self.voices.pop(key, None)
+        return False
+
+    def stop(self, key=None):
+        if key is None:
+            self.voices.clear()
+        else:
+            self.voices.pop(key, None)
+
+    def busy(self):
+        return any(self.playing(key) for key in list(self.voices))
+
+
+class Run:
+    # An engine on a virtual clock in a temporary folder, recording what fired.
+    # With a real Player, sounds are stopped as soon as they start, since
+    # they would otherwise only end in real time.
+    def __init__(self, start, jitter, seed=0, store=None, player=None, storage="json"):
+        self.clock = VirtualClock(start)
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.folder = tempfile.TemporaryDirectory()
+        self.engine = Engine(self.folder.name, store=store, player=player, now=self.clock.time, monotonic=self.clock.monotonic)
+        self.virtual_audio = player is not None
+        self.engine.configs["Storage"] = storage
+        self.engine.load()
+        self.fired = collections.Counter() # alarm id -> times fired
+        self.fired_at = collections.defaultdict(list) # alarm id -> local (hour, minute) when fired
+        self.missed = collections.Counter() # alarm id -> times skipped as missed
+        self.finished = {} # countdown name -> monotonic time it finished
+        self.lateness = []
+        self.rings = [] # (monotonic time, kind) of each sound started
+        self.engine.listeners.append(self.record)
+
+    def close(self):
+        self.engine.close()
+        self.folder.cleanup()
+
+    def record(self, event, detail):
+        now = self.clock.time()
+        if event == "alarm":
+            local = time.localtime(now)
+            for alarm_id in detail:
+                self.fired[alarm_id] += 1
+                self.fired_at[alarm_id].append((local.tm_hour, local.tm_min))
+                self.lateness.append(now - self.engine.store[alarm_id].rule.next(now))
+        elif event == "missed":
+            self.missed.update(detail)
+        elif event == "timer":
+            if detail in self.finished:
+                raise AssertionError(f"countdown {detail} finished twice")
+            self.finished[detail] = self.clock.monotonic()
+        elif event == "ring":
+            self.rings.append((self.clock.monotonic(), detail))
+            if not self.virtual_audio:
+                self.engine.player.stop()
+
+    def run_until(self, end, poll=None):
+        # Advance to wall time 'end', waking at each deadline before it plus
+        # a random delay of up to 'jitter' seconds, like a busy event loop would.
+        poll = poll or self.engine.poll
+        wakeups = 0
+        while True:
+            delay = self.engine.next_wakeup()
+            if delay is None or self.clock.time() + delay >= end:
+                self.clock.advance(max(0.0, end - self.clock.time()))
+                return wakeups
+            self.clock.advance(delay + self.rng.uniform(0, self.jitter))
+            poll()
+            wakeups += 1
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def scenario_load(args):
+    # Many random alarms over several days: each fires once a day, on time.
+    set_timezone(args.tz)
+    run = Run(local_midnight(2026, 6, 1), args.jitter)
+    rng = random.Random(1)
+    records = [AlarmRecord(next(run.engine.ids), rng.randrange(1440)) for _ in range(args.alarms)]
+    run.engine.add_alarms(records)
+    start = time.perf_counter()
+    wakeups = run.run_until(local_midnight(2026, 6, 1, args.days))
+    elapsed = time.perf_counter() - start
+    wrong = [r.id for r in records if run.fired[r.id] != args.days]
+    check(not wrong, f"{len(wrong)} alarms didn't fire exactly {args.days} times, e.g. {wrong[:5]}")
+    check(max(run.lateness) <= args.jitter, f"alarm fired {max(run.lateness):.3f}s late")
+    check(run.engine.dispatcher.delivered == len(run.rings) == sum(run.fired.values()),
+          f"{sum(run.fired.values())} alarms fired but {len(run.rings)} rang")
+    run.close()
+    return (f"{args.alarms} alarms x {args.days} days: {sum(run.fired.values())} firings in {wakeups} wakeups, "
+            f"max lateness {max(run.lateness) * 1e3:.1f}ms, {elapsed / args.days:.2f}s real time per virtual day")
+
+
+def scenario_boundaries(args):
+    # Alarms around midnight and noon fire at the right local time and are
+    # labelled with the right AM/PM.
+    set_timezone(args.tz)
+    run = Run(local_midnight(2026, 6, 1), args.jitter)
+    expected = {0: "12:00 AM", 1: "12:01 AM", 59: "12:59 AM", 60: "01:00 AM", 719: "11:59 AM",
+                720: "12:00 PM", 721: "12:01 PM", 779: "12:59 PM", 780: "01:00 PM", 1439: "11:59 PM"}
+    records = {minute: run.engine.add_alarm(minute) for minute in expected}
+    run.run_until(local_midnight(2026, 6, 1, args.days))
+    for minute, label in expected.items():
+        record = records[minute]
+        check(record.label() == label, f"minute {minute} labelled {record.label()!r}, expected {label!r}")
+        check(run.fired_at[record.id] == [divmod(minute, 60)] * args.days,
+              f"{label} fired at {run.fired_at[record.id]}")
+    run.close()
+    return f"{len(expected)} midnight/noon alarms fired at the right local time on each of {args.days} days"
+
+
+def scenario_dst(args):
+    # Across both DST changes in New York, every alarm between 00:30 and
+    # 03:30 still fires exactly once per calendar day. Alarms inside the
+    # skipped spring-forward hour fire an hour later, at the same instant
+    # as the wall clock reaches them.
+    set_timezone("America/New_York")
+    minutes = range(30, 211)
+    results = []
+    for month, day in ((3, 8), (11, 1)):
+        run = Run(local_midnight(2026, month, day, -1), args.jitter)
+        records = [run.engine.add_alarm(minute) for minute in minutes]
+        run.run_until(local_midnight(2026, month, day, 2))
+        wrong = [(r.label(), run.fired[r.id]) for r in records if run.fired[r.id] != 3]
+        check(not wrong, f"DST {month}/{day}: alarms not firing once a day: {wrong[:5]}")
+        results.append(f"{month}/{day}")
+        run.close()
+    set_timezone(args.tz)
+    return f"{len(minutes)} alarms fired once per day across the DST changes on {', '.join(results)}"
+
+
+def scenario_rules(args):
+    # Alarms with repeat rules, across the spring DST change in New York:
+    # the engine, stepping each rule with next(), fires exactly the rings
+    # the batch upcoming() lists for the same days, and one-shot alarms
+    # switch themselves off.
+    set_timezone("America/New_York")
+    start = local_midnight(2026, 3, 6)
+    run = Run(start, args.jitter)
+    records = random_rule_records(args.rules, today=datetime.date(2026, 3, 8))
+    for record in records:
+        record.id = next(run.engine.ids)
+    run.engine.add_alarms(records)
+    end = local_midnight(2026, 3, 6, args.days + 2)
+    expected = collections.Counter(i for _, ids in run.engine.schedule.upcoming(end - start) for i in ids)
+    run.run_until(end)
+    wrong = [(r.id, r.rule, run.fired[r.id], expected[r.id]) for r in records if run.fired[r.id] != expected[r.id]]
+    check(not wrong, f"{len(wrong)} rules fired differently from upcoming(), e.g. {wrong[:3]}")
+    check(max(run.lateness) <= args.jitter, f"alarm fired {max(run.lateness):.3f}s late")
+    once = [r for r in records if r.rule.once]
+    check(all(not r.flags & 1 for r in once if run.fired[r.id]), "a one-shot alarm stayed on after ringing")
+    run.close()
+    set_timezone(args.tz)
+    return f"{args.rules} rules fired {sum(run.fired.values())} times over {args.days + 2} days, matching upcoming()"
+
+
+def scenario_sqlite(args):
+    # The same mix of rules kept in alarms.db, where only the next WINDOW
+    # seconds of alarms are in the schedule at a time: everything still
+    # fires exactly as an all-in-memory schedule predicts, DST included.
+    # The store is wrapped in the window's AlarmModel, as in the app, and
+    # alarms that are done are disabled in the database, not just in memory.
+    import index
+
+    set_timezone("America/New_York")
+    start = local_midnight(2026, 3, 6)
+    run = Run(start, args.jitter, store=index.AlarmModel(index.AlarmStore()), storage="sqlite")
+    records = random_rule_records(args.rules, today=datetime.date(2026, 3, 8))
+    for record in records:
+        record.id = next(run.engine.ids)
+    run.engine.add_alarms(records)
+    end = local_midnight(2026, 3, 6, args.days + 2)
+    reference = AlarmSchedule(run.clock.time)
+    for record in records:
+        if record.flags & 1:
+            reference.add(record.id, record.rule)
+    expected = collections.Counter(i for _, ids in reference.upcoming(end - start) for i in ids)
+    wall = time.perf_counter()
+    wakeups = run.run_until(end)
+    wall = time.perf_counter() - wall
+    wrong = [(r.id, r.rule, run.fired[r.id], expected[r.id]) for r in records if run.fired[r.id] != expected[r.id]]
+    check(not wrong, f"{len(wrong)} alarms fired differently from upcoming(), e.g. {wrong[:3]}")
+    check(max(run.lateness) <= args.jitter, f"alarm fired {max(run.lateness):.3f}s late")
+    done = {r.id for r in records if expected[r.id] and r.rule.next(end) is None}
+    enabled = {i for i, flags in run.engine.database.db.execute("SELECT id, flags FROM alarms") if flags & 1}
+    check(done and not done & enabled, f"{len(done & enabled)} of {len(done)} finished alarms still enabled in alarms.db")
+    run.close()
+    set_timezone(args.tz)
+    return (f"{args.rules} alarms in alarms.db fired {sum(run.fired.values())} times over {args.days + 2} days "
+            f"in {wakeups} wakeups, {wall / (args.days + 2):.2f}s real time per virtual day")
+
+
+def scenario_timers(args):
+    # Many concurrent countdowns of random length: each finishes exactly
+    # once, no earlier than its deadline and no later than the jitter.
+    run = Run(local_midnight(2026, 6, 1), args.jitter)
+    rng = random.Random(2)
+    deadlines = {}
+    for i in range(args.timers):
+        seconds = rng.uniform(1, args.days * 86400)
+        run.engine.start_timer(f"t{i}", seconds)
+        deadlines[f"t{i}"] = run.clock.monotonic() + seconds
+    run.run_until(run.clock.time() + args.days * 86400 + 1)
+    check(len(run.finished) == args.timers, f"{args.timers - len(run.finished)} countdowns never finished")
+    late = [run.finished[name] - deadline for name, deadline in deadlines.items()]
+    check(min(late) >= 0, f"countdown finished {-min(late):.3f}s early")
+    check(max(late) <= args.jitter, f"countdown finished {max(late):.3f}s late")
+    run.close()
+    return f"{args.timers} countdowns finished once each, max lateness {max(late) * 1e3:.1f}ms"
+
+
+def scenario_dispatch(args):
+    # Rings coming due together share the mixer's channels: they overlap up
+    # to the channel limit, queue alarms before timers, ring again after a
+    # snooze, and are dropped rather than played a minute late.
+    set_timezone(args.tz)
+    run = Run(local_midnight(2026, 6, 1), args.jitter, player=VirtualPlayer(None, 20))
+    engine, dispatcher = run.engine, run.engine.dispatcher
+    engine.player.clock = run.clock
+    engine.configs["Snooze"] = 5
+    # Six alarms at 07:00 and a timer finishing 2s later, on four channels.
+    alarms = [engine.add_alarm(420) for _ in range(6)]
+    engine.start_timer("tea", 7 * 3600 + 2)
+    run.run_until(local_midnight(2026, 6, 1) + 7 * 3600 + 90)
+    kinds = [kind for _, kind in run.rings]
+    check(kinds == ["Alarm"] * 6 + ["Timer"], f"rang {kinds}")
+    check(engine.player.most == dispatcher.channels, f"{engine.player.most} sounds played at once")
+    check(run.rings[4][0] - run.rings[0][0] >= 20, "a queued alarm started before a channel was free")
+    # Ringing the same occurrence again is coalesced, not replayed.
+    deadline = local_midnight(2026, 6, 1) + 7 * 3600
+    engine.emit(dispatcher.submit("Alarm", alarms[0].id, deadline, engine.sound(), 0))
+    check(dispatcher.coalesced == 1 and len(run.rings) == 7, "a delivered occurrence rang twice")
+    # The next day, snoozing silences all six and rings them 5 minutes later.
+    run.run_until(local_midnight(2026, 6, 2) + 7 * 3600 + 5)
+    engine.snooze()
+    check(not engine.player.busy() and not dispatcher.waiting, "snooze left alarms ringing")
+    run.run_until(local_midnight(2026, 6, 2) + 7 * 3600 + 5 * 60 + 90)
+    check(len(run.rings) == 7 + 4 + 6, f"{len(run.rings) - 7} rings after snoozing, expected 10")
+    # Twelve at once with sounds longer than the wait limit: eight are dropped.
+    engine.player.length = 100
+    for _ in range(12):
+        engine.add_alarm(480)
+    run.run_until(local_midnight(2026, 6, 2) + 8 * 3600 + 120)
+    stats = dispatcher.stats()
+    check(stats["dropped"] == 8, f"{stats['dropped']} dropped, expected 8")
+    run.close()
+    return ", ".join(f"{value} {name}" for name, value in stats.items())
+
+
+def scenario_catchup(args):
+    # Alarms missed while the machine slept ring when it resumes, by the
+    # catch-up policy, each one's sound played in turn; a stalled loop rings
+    # them late but still once, and setting the clock back rings nothing twice.
+    set_timezone(args.tz)
+    day = local_midnight(2026, 6, 1)
+    hour = lambda h, m=0, days=0: day + days * 86400 + h * 3600 + m * 60
+    # Every 10 minutes from 06:30 to 08:00: ten rings a day.
+    every = {"every": 10, "until": 480}
+    # Suspended from 06:45 to 09:45: the daily alarm's 07:00 and eight of
+    # the repeating one's rings fall in the gap, 105 to 175 minutes ago.
+    for policy, limit, rung in (("once", 0, (1, 1)), ("all", 0, (1, 8)), ("once", 120, (0, 1)), ("all", 120, (0, 2))):
+        run = Run(day, args.jitter, player=VirtualPlayer(None, 20))
+        engine = run.engine
+        engine.player.clock = run.clock
+        plays = engine.player.plays
+        engine.configs["Catch up"], engine.configs["Catch up limit"] = policy, limit
+        daily, repeating = engine.add_alarm(420), engine.add_alarm(390, rule=every)
+        run.run_until(hour(6, 45))
+        check(plays[("Alarm", repeating.id)] == 2, f"{plays[('Alarm', repeating.id)]} rings before the suspend")
+        run.clock.jump(3 * 3600)
+        run.run_until(hour(10))
+        got = (plays[("Alarm", daily.id)], plays[("Alarm", repeating.id)] - 2)
+        check(got == rung, f"{policy}, limit {limit}: rang {got} after resuming, expected {rung}")
+        check(len(run.rings) == 2 + sum(rung), f"{policy}, limit {limit}: {len(run.rings) - 2} ring events after resuming")
+        check(engine.dispatcher.caught_up == sum(rung), f"{policy}, limit {limit}: {engine.dispatcher.caught_up} counted as caught up")
+        check(run.missed[daily.id] == 1 - rung[0], f"{policy}, limit {limit}: daily alarm missed {run.missed[daily.id]} times")
+        check(engine.watchdog.jumps == 1, f"{engine.watchdog.jumps} clock jumps seen, expected 1")
+        if policy == "once" and not limit:
+            # The next morning the loop stalls for five minutes over 07:00,
+            # then the clock is set back half an hour at 07:10.
+            run.run_until(hour(6, 58, 1))
+            run.clock.advance(300)
+            engine.poll()
+            run.run_until(hour(7, 10, 1))
+            check(engine.watchdog.stalls == 1, f"{engine.watchdog.stalls} stalls seen, expected 1")
+            run.clock.jump(-1800)
+            run.run_until(hour(9, days=1))
+            check(engine.watchdog.jumps == 2, f"{engine.watchdog.jumps} clock jumps seen, expected 2")
+            got = (plays[("Alarm", daily.id)] - 1, plays[("Alarm", repeating.id)] - 3)
+            check(got == (1, 10), f"rang {got} the day after, expected (1, 10)")
+            stats = engine.diagnostics()["watchdog"]
+        delay = engine.next_wakeup()
+        check(delay is not None and delay <= 60, f"would sleep {delay}s, past the watchdog period")
+        run.close()
+    return f"catch-up rang each policy's alarms after a 3h suspend; {stats['stalls']} stall, {stats['clock_jumps']} clock jumps, {stats['caught_up']} caught up"
+
+
+def scenario_stopwatch(args):
+    # A stopwatch on a virtual nanosecond clock: stopped time is left out,
+    # every lap is kept exactly, and the CSV export has a row per lap whose
+    # splits add up to the total.
+    import csv, stopwatch
+
+    rng = random.Random(3)
+    now = [0]
+    watch = stopwatch.Stopwatch(clock=lambda: now[0])
+    watch.start()
+    running = 0
+    for i in range(args.laps):
+        step = rng.randrange(1, 10 ** 10)
+        now[0] += step
+        running += step
+        if i % 1000 == 999:
+            # A pause: the time stopped mustn't count.
+            watch.stop()
+            now[0] += rng.randrange(10 ** 12)
+            watch.start()
+        check(watch.lap() == running, f"lap {i + 1} at {watch.laps[-1]}ns, expected {running}ns")
+    check(watch.laps.itemsize == 8, "laps aren't stored as 8-byte integers")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "laps.csv")
+        watch.export(path)
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    check(len(rows) == args.laps, f"{len(rows)} rows exported for {args.laps} laps")
+    check(sum(int(row["split_ns"]) for row in rows) == running, "exported splits don't add up to the total")
+    check(rows[-1]["total"] == stopwatch.format_ns(running), f"last lap exported as {rows[-1]['total']}")
+    return f"{args.laps} laps over {stopwatch.format_ns(running)} with {args.laps // 1000} pauses, exported exactly"
+
+
+def scenario_transfer(args):
+    # Alarms exported to CSV and .ics and read back ring exactly as before,
+    # and malformed files are refused with a ValueError naming the line,
+    # never another exception.
+    import itertools, transfer
+
+    rng = random.Random(4)
+    records = random_rule_records(args.rules // 10)
+    for record in records:
+        if rng.random() < 0.1:
+            record.flags = 0
+    now = time.time()
+
+    def rings(record):
+        # Whether it's on, and its next 10 rings.
+        times, at = [], now
+        while len(times) < 10:
+            at = record.rule.next(at)
+            if at is None:
+                break
+            times.append(at)
+            at += 60
+        return record.flags & 1, times
+
+    expected = [rings(record) for record in records]
+    malformed = {
+        "long.csv": ("time,days\n07:00 AM,Mon\n08:00 AM,\"" + "x" * 200000 + "\"\n", "line 3"),
+        "columns.csv": ("days\nMon\n", "line 1"),
+        "time.csv": ("time\n07:00 AM\n25:99\n", "line 3"),
+        "fields.csv": ("time\n07:00 AM,Mon\n", "line 2"),
+        "monthly.ics": ("BEGIN:VCALENDAR\nBEGIN:VEVENT\nDTSTART:20260601T070000\nRRULE:FREQ=MONTHLY\n"
+                        "END:VEVENT\nEND:VCALENDAR\n", "line 2"),
+        "start.ics": ("BEGIN:VCALENDAR\nBEGIN:VEVENT\nSUMMARY:x\nEND:VEVENT\nEND:VCALENDAR\n", "line 2"),
+        "zone.ics": ("BEGIN:VCALENDAR\nBEGIN:VEVENT\nDTSTART;TZID=Nowhere/Else:20260601T070000\n"
+                     "END:VEVENT\nEND:VCALENDAR\n", "line 2"),
+        "alarms.txt": ("time\n07:00 AM\n", "not a .csv or .ics file"),
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for extension in (".csv", ".ics"):
+            path = os.path.join(folder, "alarms" + extension)
+            transfer.export(path, records)
+            check(not os.path.exists(path + ".tmp"), f"{extension} export left its temporary file")
+            imported = list(transfer.read(path, itertools.count(1)))
+            check(len(imported) == len(records), f"{len(imported)} of {len(records)} alarms read back from {extension}")
+            wrong = [r.label() for r, e in zip(imported, expected) if rings(r) != e]
+            check(not wrong, f"{len(wrong)} alarms ring differently after a {extension} round trip, e.g. {wrong[:3]}")
+        # A TZID keeps its case.
+        path = os.path.join(folder, "zone.ics")
+        with open(path, "w") as f:
+            f.write("BEGIN:VCALENDAR\nBEGIN:VEVENT\nDTSTART;tzid=America/New_York:20260601T070000\n"
+                    "RRULE:FREQ=DAILY\nEND:VEVENT\nEND:VCALENDAR\n")
+        check(len(list(transfer.read(path, itertools.count(1)))) == 1, "an event with a TZID wasn't read")
+        for name, (text, message) in malformed.items():
+            path = os.path.join(folder, name)
+            with open(path, "w") as f:
+                f.write(text)
+            try:
+                list(transfer.read(path, itertools.count(1)))
+            except ValueError as error:
+                check(message in str(error), f"{name}: {error}, expected {message!r}")
+            else:
+                raise AssertionError(f"{name} was read without an error")
+    return f"{len(records)} alarms round-tripped through CSV and .ics, {len(malformed)} malformed files refused"
+
+
+def scenario_qt(args):
+    # The real window on the offscreen platform, with its engine on virtual
+    # time and the Driver's poll path doing the firing.
+    from PyQt5.QtWidgets import QApplication
+    import index
+
+    set_timezone(args.tz)
+    app = QApplication.instance() or QApplication([])
+    run = Run(local_midnight(2026, 6, 1), args.jitter, store=index.AlarmModel(index.AlarmStore()))
+    index.engine, index.configs = run.engine, run.engine.configs
+    window = index.App()
+    window.show()
+    window.show_page(2)
+    window.show_page(1)
+    records = [run.engine.add_alarm(minute) for minute in (0, 420, 720, 1439)]
+    run.engine.start_timer(window.timer.name, 5400)
+    check(window.alarm.frame.model().rowCount() == len(records), "alarm page doesn't list every alarm")
+    run.run_until(local_midnight(2026, 6, 1, args.days), poll=window.driver.poll)
+    app.processEvents()
+    check(all(run.fired[r.id] == args.days for r in records), f"alarms fired {dict(run.fired)}")
+    check(window.timer.label.text() == "00:00:00", f"timer page shows {window.timer.label.text()}")
+    window.show_page(0)
+    expected = time.strftime("%I:%M:%S %p", time.localtime(run.clock.time()))
+    check(window.clock.time_label.text() == expected, f"clock shows {window.clock.time_label.text()}, expected {expected}")
+    window.hide()
+    run.close()
+    return f"window fired {sum(run.fired.values())} alarms and its countdown through Driver.poll"
+
+
+SCENARIOS = {
+    "load": scenario_load,
+    "boundaries": scenario_boundaries,
+    "dst": scenario_dst,
+    "rules": scenario_rules,
+    "sqlite": scenario_sqlite,
+    "timers": scenario_timers,
+    "dispatch": scenario_dispatch,
+    "catchup": scenario_catchup,
+    "stopwatch": scenario_stopwatch,
+    "transfer": scenario_transfer,
+    "qt": scenario_qt,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Virtual-time alarm and timer simulation")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--alarms", type=int, default=100000, help="alarms in the load scenario")
+    parser.add_argument("--rules", type=int, default=20000, help="alarms in the rules scenario")
+    parser.add_argument("--timers", type=int, default=10000, help="countdowns in the timers scenario")
+    parser.add_argument("--laps", type=int, default=100000, help="laps in the stopwatch scenario")
+    parser.add_argument("--days", type=int, default=3, help="virtual days per scenario")
+    parser.add_argument("--jitter", type=float, default=0.05, help="largest simulated wakeup delay, seconds")
+    parser.add_argument("--tz", default="UTC", help="local time zone for the non-DST scenarios")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+
+    failed = 0
+    for name in args.scenarios or SCENARIOS:
+        start = time.perf_counter()
+        try:
+            result = SCENARIOS[name](args)
+        except AssertionError as error:
+            failed += 1
+            print(f"FAIL {name}: {error}")
+        else:
+            print(f"ok   {name} ({time.perf_counter() - start:.2f}s): {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+# A stopwatch on time.perf_counter_ns(). Elapsed time and laps are whole
+# nanoseconds, and laps are kept in an array of 8-byte integers, so 100k
+# laps take under 1MB instead of a list of objects.
+import array, csv, time
+
+from storage import atomic_file
+
+# CSV columns of an export: lap number, lap time and total time, formatted
+# and in nanoseconds.
+FIELDS = ("lap", "split", "total", "split_ns", "total_ns")
+
+
+def format_ns(ns):
+    # "01:02:03.456" for a duration in nanoseconds, cut to milliseconds.
+    ms = ns // 1000000
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{minutes // 60:02}:{minutes % 60:02}:{seconds:02}.{ms:03}"
+
+
+class Stopwatch:
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.started = None # Clock reading when last started, None while stopped.
+        self.banked = 0 # Nanoseconds run before that.
+        self.laps = array.array("q") # Total elapsed at each lap.
+
+    def running(self):
+        return self.started is not None
+
+    def elapsed(self):
+        if self.started is None:
+            return self.banked
+        return self.banked + self.clock() - self.started
+
+    def start(self):
+        if self.started is None:
+            self.started = self.clock()
+
+    def stop(self):
+        if self.started is not None:
+            self.banked += self.clock() - self.started
+            self.started = None
+
+    def reset(self):
+        self.started = None
+        self.banked = 0
+        self.laps = array.array("q")
+
+    def lap(self):
+        # Record a lap at the current elapsed time and return it.
+        total = self.elapsed()
+        self.laps.append(total)
+        return total
+
+    def split(self, i):
+        # Length of lap 'i', counting from 0.
+        return self.laps[i] - (self.laps[i - 1] if i else 0)
+
+    def rows(self):
+        # The laps as CSV rows, made one at a time.
+        previous = 0
+        for number, total in enumerate(self.laps, 1):
+            yield number, format_ns(total - previous), format_ns(total), total - previous, total
+            previous = total
+
+    def export(self, path):
+        # Write the laps to 'path' as CSV, a row at a time.
+        with atomic_file(path, newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(self.rows())
@@ -0,0 +1,129 @@
+# Persistence for the clock app's configuration.
+import contextlib, json, os, threading, time
+import assets
+from scheduler import ENABLED, to_24h
+from metrics import Metrics
+
+# Version of the config layout written by this code.
+CONFIG_VERSION = 3
+
+
+def migrate(configs):
+    # Bring a config loaded from disk up to CONFIG_VERSION, in place. Its
+    # alarms are left as they are, for the loader to pass one at a time
+    # through upgrade_alarm() with the version they were saved at.
+    version = configs.get("Version", 1)
+    if version < 3 and configs.get("Sound"):
+        # Version 2 kept even the bundled sound as an absolute path, into
+        # wherever the app was installed when the config was first written.
+        sound = configs["Sound"]
+        moved = (not os.path.exists(sound) and os.path.basename(sound) == assets.DEFAULT_SOUND
+                 and os.path.basename(os.path.dirname(sound)) == "data")
+        configs["Sound"] = assets.DEFAULT_SOUND if moved else assets.sound_name(sound)
+    configs["Version"] = CONFIG_VERSION
+    return configs
+
+
+def upgrade_alarm(entry, version):
+    # An alarm entry from a config saved at 'version', in the current form.
+    if version < 2:
+        # Version 1 kept alarms as [["HH", "MM"], "AM"/"PM"]; version 2 keeps
+        # [minute of day, flags].
+        alarm_time, meridiem = entry
+        return [to_24h(alarm_time[0], meridiem) * 60 + int(alarm_time[1]), ENABLED]
+    return entry
+
+
+def encode(value):
+    # json.dumps fallback for objects that know their config form, like AlarmRecord.
+    return value.to_config()
+
+
+@contextlib.contextmanager
+def atomic_file(path, **options):
+    # Open a temporary file next to 'path' for writing (with open()'s
+    # 'options') and swap it in, flushed to disk, when the block ends, so a
+    # crash mid-write leaves the previous file intact. If the block or the
+    # swap fails, the temporary file is removed.
+    temp = path + ".tmp"
+    try:
+        with open(temp, "w", **options) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+
+
+def write_atomic(path, text):
+    with atomic_file(path) as f:
+        f.write(text)
+
+
+def snapshot(configs):
+    # Copy the config deep enough that the GUI thread can keep changing it
+    # while the copy is being written out. Collections such as the alarm
+    # store become plain lists.
+    plain = (str, int, float, dict, type(None))
+    return {key: value if isinstance(value, plain) else list(value) for key, value in dict(configs).items()}
+
+
+class ConfigWriter:
+    # Writes the config on a background thread. save() only marks the config
+    # dirty; changes arriving within 'delay' seconds of each other are written
+    # together once things go quiet, or after 'max_delay' at the latest.
+    # How long each write takes goes into 'metrics' as "persist".
+    def __init__(self, path, delay=0.3, max_delay=3, metrics=None):
+        self.path = path
+        self.metrics = Metrics() if metrics is None else metrics
+        self.delay = delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closed = False
+        self.writes = 0
+        self.thread = threading.Thread(target=self.run, name="config-writer", daemon=True)
+        self.thread.start()
+
+    def save(self, configs):
+        with self.condition:
+            self.pending = configs
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                # Keep waiting while changes keep coming in, unless closing.
+                latest = time.monotonic() + self.max_delay
+                while not self.closed and self.condition.wait(self.delay) and time.monotonic() < latest:
+                    pass
+                configs, self.pending = self.pending, None
+                closed = self.closed
+            if configs is not None:
+                try:
+                    self.write(configs)
+                except OSError:
+                    # Try again with the next batch rather than losing the change.
+                    with self.condition:
+                        if self.pending is None:
+                            self.pending = configs
+            if closed:
+                return
+
+    def write(self, configs):
+        start = time.perf_counter()
+        write_atomic(self.path, json.dumps(snapshot(configs), indent=2, default=encode))
+        self.writes += 1
+        self.metrics.since("persist", start)
+
+    def close(self):
+        # Write anything still pending and stop the thread. Call on quit.
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
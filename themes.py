@@ -0,0 +1,152 @@
+# Colour themes for the clock app's window. A theme is compiled once into a
+# QPalette and shared from then on. Switching themes only swaps the
+# application palette: widgets repaint with the new colours, but no CSS is
+# parsed and nothing is re-polished. There is deliberately no window-wide
+# stylesheet: Qt pins the palette of every widget a stylesheet applies to,
+# so fonts are set per widget class instead, and the rounded buttons are
+# drawn by ThemeStyle.
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QColor, QFont, QPainter, QPalette
+from PyQt5.QtWidgets import QApplication, QLabel, QProxyStyle, QStyle, QStyleFactory, QStyleOptionButton
+
+# Colours a theme defines. User themes in configs["Themes"] may set any of
+# them and take the rest from their "base" theme (dark by default).
+COLORS = ("window", "text", "button", "button_text", "hover", "flat_hover")
+
+BUILTIN = {
+    "dark": {"window": "black", "text": "white", "button": "grey", "button_text": "black",
+             "hover": "green", "flat_hover": "#353535"},
+    "light": {"window": "white", "text": "black", "button": "grey", "button_text": "black",
+              "hover": "green", "flat_hover": "#353535"},
+}
+
+# Font size in pixels by widget class; the family is shared. Labels in
+# dialogs are a little smaller.
+FONT_FAMILY = "Consolas"
+FONT_SIZES = {"QWidget": None, "QPushButton": 18, "QLabel": 20, "QLineEdit": 15, "QListView": 15,
+              "QCheckBox": 15, "QDateTimeEdit": 15, "QComboBox": 15}
+DIALOG_LABEL_SIZE = 18
+
+
+class Theme:
+    # A compiled theme: its colours and the palette built from them.
+    __slots__ = ("name", "colors", "palette")
+
+    def __init__(self, name, colors):
+        self.name = name
+        self.colors = {key: QColor(value) for key, value in colors.items()}
+        bad = [key for key, color in self.colors.items() if not color.isValid()]
+        if bad:
+            raise ValueError(f"theme {name!r} has invalid colours: {', '.join(bad)}")
+        window, text, button, button_text, hover = (self.colors[key] for key in COLORS[:5])
+        palette = QPalette(button, window)
+        for role, color in ((QPalette.WindowText, text), (QPalette.Text, text), (QPalette.Base, window),
+                            (QPalette.AlternateBase, window), (QPalette.ButtonText, button_text),
+                            (QPalette.Highlight, hover), (QPalette.HighlightedText, text),
+                            (QPalette.ToolTipBase, window), (QPalette.ToolTipText, text)):
+            palette.setColor(role, color)
+        # Disabled text halfway to the background.
+        dim = QColor((text.red() + window.red()) // 2, (text.green() + window.green()) // 2,
+                     (text.blue() + window.blue()) // 2)
+        for role in (QPalette.WindowText, QPalette.Text, QPalette.ButtonText):
+            palette.setColor(QPalette.Disabled, role, dim)
+        palette.setColor(QPalette.PlaceholderText, dim)
+        self.palette = palette
+
+
+def theme_names(user=None):
+    user = user if isinstance(user, dict) else {}
+    return list(BUILTIN) + [name for name in user if name not in BUILTIN]
+
+
+# Compiled themes by (name, colours), so each is only built once.
+themes = {}
+
+
+def compile_theme(name, user=None):
+    # Return the shared Theme called 'name', looking in 'user' (the
+    # configs["Themes"] dict) and then the built-in themes. Raises
+    # ValueError if it doesn't exist or is malformed, e.g. hand-edited into
+    # something other than an object of colour names.
+    if user is not None and not isinstance(user, dict):
+        raise ValueError("Themes should be an object of themes by name")
+    if not isinstance(name, str):
+        raise ValueError(f"unknown theme {name!r}")
+    definition = (user or {}).get(name) or BUILTIN.get(name)
+    if definition is None:
+        raise ValueError(f"unknown theme {name!r}")
+    if not isinstance(definition, dict):
+        raise ValueError(f"theme {name!r} should be an object of colours, not {definition!r}")
+    base = definition.get("base", "dark")
+    if not isinstance(base, str) or base not in BUILTIN:
+        raise ValueError(f"theme {name!r} has unknown base {base!r}")
+    colors = {key: definition.get(key, BUILTIN[base][key]) for key in COLORS}
+    bad = [key for key, value in colors.items() if not isinstance(value, str)]
+    if bad:
+        raise ValueError(f"theme {name!r} has invalid colours: {', '.join(bad)}")
+    key = (name, tuple(colors.values()))
+    theme = themes.get(key)
+    if theme is None:
+        theme = themes[key] = Theme(name, colors)
+    return theme
+
+
+def install_fonts():
+    # Set the app's fonts once, per widget class.
+    for class_name, size in FONT_SIZES.items():
+        font = QFont(FONT_FAMILY)
+        if size is not None:
+            font.setPixelSize(size)
+        QApplication.setFont(font, None if class_name == "QWidget" else class_name)
+
+
+def dialog_fonts(dialog):
+    for label in dialog.findChildren(QLabel):
+        font = label.font()
+        font.setPixelSize(DIALOG_LABEL_SIZE)
+        label.setFont(font)
+
+
+def heading(label):
+    # Make 'label' bold, as the settings dialog's section titles.
+    font = label.font()
+    font.setBold(True)
+    label.setFont(font)
+
+
+class ThemeStyle(QProxyStyle):
+    # Fusion, which takes all its colours from the palette, with the app's
+    # rounded buttons: grey, green while hovered, and flat ones (the
+    # settings button) only shaded while hovered. apply() switches themes.
+    def __init__(self):
+        super().__init__(QStyleFactory.create("Fusion"))
+        self.theme = None
+
+    def apply(self, theme):
+        self.theme = theme
+        QApplication.setPalette(theme.palette)
+
+    def drawControl(self, element, option, painter, widget=None):
+        if element == QStyle.CE_PushButtonBevel and self.theme is not None:
+            hovered = option.state & QStyle.State_MouseOver
+            if option.features & QStyleOptionButton.Flat:
+                color = self.theme.colors["flat_hover"] if hovered else None
+            elif hovered or option.state & QStyle.State_Sunken:
+                color = self.theme.colors["hover"]
+            else:
+                color = option.palette.color(QPalette.Button)
+            if color is not None:
+                painter.save()
+                painter.setRenderHint(QPainter.Antialiasing)
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(color)
+                painter.drawRoundedRect(option.rect, 10, 10)
+                painter.restore()
+            return
+        super().drawControl(element, option, painter, widget)
+
+    def sizeFromContents(self, contents, option, size, widget=None):
+        if contents == QStyle.CT_PushButton:
+            # 5px of padding around at least 40x20 of content.
+            return QSize(max(size.width(), 40) + 10, max(size.height(), 20) + 10)
+        return super().sizeFromContents(contents, option, size, widget)
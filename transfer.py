@@ -0,0 +1,288 @@
+# Bulk import and export of alarms as CSV or iCalendar (.ics) files.
+# Both directions stream a line at a time: read() yields AlarmRecords as it
+# parses, and export() writes them out as it iterates, so a large file is
+# never held in memory as text or rows.
+import csv, datetime, functools, os, re
+from zoneinfo import ZoneInfo
+
+from scheduler import DAY_NAMES, ENABLED, EVERY_DAY, AlarmRecord, alarm_minute, compile_rule
+from storage import atomic_file
+
+# CSV columns. Only "time" is required; the rest are the rule fields of
+# scheduler.Rule, with times and days written as in the alarm list.
+FIELDS = ("time", "enabled", "days", "every", "until", "from", "to", "on")
+
+# iCalendar weekday codes, Monday first like DAY_NAMES.
+ICS_DAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+TIME = re.compile(r"\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s*$")
+
+# Provisioning files repeat the same few times, days and dates on every
+# line, so their parsed values are cached.
+cached = functools.lru_cache(maxsize=4096)
+
+
+def format_time(minute):
+    hour, minute = divmod(minute, 60)
+    return f"{hour % 12 or 12:02}:{minute:02} {'PM' if hour >= 12 else 'AM'}"
+
+
+@cached
+def parse_time(text):
+    # Minute of the day for "07:30 AM", "7:30pm" or 24-hour "19:30".
+    match = TIME.match(text)
+    if match is None:
+        raise ValueError(f"{text!r} is not a time like 07:30 AM")
+    hour, minute, meridiem = int(match[1]), int(match[2]), match[3]
+    if meridiem is not None:
+        return alarm_minute(hour, minute, meridiem.upper())
+    if hour > 23:
+        raise ValueError("Hours is greater than 23")
+    return alarm_minute(hour % 12, minute, "PM" if hour >= 12 else "AM")
+
+
+def format_days(days):
+    if days == EVERY_DAY:
+        return ""
+    return " ".join(name for bit, name in enumerate(DAY_NAMES) if days >> bit & 1)
+
+
+@cached
+def parse_days(text):
+    # Day mask for names like "Mon Wed Fri", ranges like "Mon-Fri", or
+    # nothing for every day.
+    lower = [name.lower() for name in DAY_NAMES]
+    days = 0
+    for part in text.replace(",", " ").lower().split():
+        first, _, last = part.partition("-")
+        try:
+            start = lower.index(first[:3])
+            end = lower.index(last[:3]) if last else start
+        except ValueError:
+            raise ValueError(f"unknown day {part!r}") from None
+        for day in range(start, start + (end - start) % 7 + 1):
+            days |= 1 << day % 7
+    return days or EVERY_DAY
+
+
+@cached
+def parse_date(text):
+    return datetime.date.fromisoformat(text.strip()).isoformat()
+
+
+def parse_enabled(text):
+    text = text.strip().lower()
+    if text in ("", "yes", "true", "on", "1"):
+        return ENABLED
+    if text in ("no", "false", "off", "0"):
+        return 0
+    raise ValueError(f"enabled should be yes or no, not {text!r}")
+
+
+def from_fields(alarm_id, fields):
+    # Build a record from a CSV row's non-empty fields.
+    minute = parse_time(fields["time"])
+    spec = {}
+    if fields.get("days"):
+        spec["days"] = parse_days(fields["days"])
+    if fields.get("every"):
+        spec["every"] = int(fields["every"])
+        if fields.get("until"):
+            spec["until"] = parse_time(fields["until"])
+    for key in ("from", "to", "on"):
+        if fields.get(key):
+            spec[key] = parse_date(fields[key])
+    return AlarmRecord(alarm_id, minute, parse_enabled(fields.get("enabled", "")), compile_rule(minute, spec))
+
+
+def to_fields(record):
+    spec = record.rule.spec
+    return [format_time(record.minute), "yes" if record.flags & ENABLED else "no",
+            format_days(record.rule.days), spec.get("every", ""),
+            format_time(spec["until"]) if "until" in spec else "",
+            spec.get("from", ""), spec.get("to", ""), spec.get("on", "")]
+
+
+def read_csv(lines, ids):
+    reader = csv.DictReader(lines)
+    try:
+        yield from read_rows(reader, ids)
+    except csv.Error as error:
+        # Malformed CSV, e.g. a field over csv.field_size_limit(). The
+        # line being read is one past the last one finished.
+        raise ValueError(f"line {reader.line_num + 1}: {error}") from None
+
+
+def read_rows(reader, ids):
+    columns = [name.strip().lower() for name in reader.fieldnames or ()]
+    if "time" not in columns:
+        raise ValueError("line 1: a \"time\" column is required")
+    unknown = set(columns) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"line 1: unknown columns: {', '.join(sorted(unknown))}")
+    reader.fieldnames = columns
+    for row in reader:
+        try:
+            if None in row:
+                raise ValueError("more fields than columns")
+            yield from_fields(next(ids), {key: value.strip() for key, value in row.items() if value})
+        except (KeyError, ValueError) as error:
+            raise ValueError(f"line {reader.line_num}: {error}") from None
+
+
+def write_csv(f, records):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    for record in records:
+        writer.writerow(to_fields(record))
+
+
+def unfold(lines):
+    # Join iCalendar continuation lines, yielding (line number, line).
+    number, current = 0, None
+    for count, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        number, current = count, line
+    if current is not None:
+        yield number, current
+
+
+def parse_stamp(value, params):
+    # Local datetime of an iCalendar DATE-TIME: floating, UTC or with a TZID.
+    if params.get("VALUE", "").upper() == "DATE" or len(value) < 15:
+        raise ValueError("an alarm needs a time of day, not just a date")
+    at = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        at = at.replace(tzinfo=datetime.timezone.utc)
+    elif "TZID" in params:
+        at = at.replace(tzinfo=ZoneInfo(params["TZID"]))
+    else:
+        return at
+    return at.astimezone().replace(tzinfo=None)
+
+
+def from_event(alarm_id, event):
+    # Build a record from a VEVENT's properties: DTSTART for the time (and
+    # start date), RRULE for the days and end date, and X-CLOCK-EVERY and
+    # X-CLOCK-UNTIL for repeats within a day, which RRULE can't express
+    # simply. An event without RRULE rings once, on its DTSTART date.
+    if "DTSTART" not in event:
+        raise ValueError("event has no DTSTART")
+    start = parse_stamp(*event["DTSTART"])
+    minute = start.hour * 60 + start.minute
+    spec = {}
+    if "RRULE" in event:
+        parts = dict(part.split("=", 1) for part in event["RRULE"][0].upper().split(";") if "=" in part)
+        freq = parts.pop("FREQ", None)
+        if freq not in ("DAILY", "WEEKLY"):
+            raise ValueError(f"only daily and weekly events are supported, not {freq}")
+        if parts.pop("INTERVAL", "1") != "1":
+            raise ValueError("events repeating every few days or weeks are not supported")
+        days = parts.pop("BYDAY", None)
+        if days is not None:
+            try:
+                spec["days"] = sum(1 << ICS_DAYS.index(day[-2:]) for day in set(days.split(",")))
+            except ValueError:
+                raise ValueError(f"unknown BYDAY {days}") from None
+        elif freq == "WEEKLY":
+            spec["days"] = 1 << start.weekday()
+        if "UNTIL" in parts:
+            until = parts.pop("UNTIL")
+            spec["to"] = datetime.datetime.strptime(until[:8], "%Y%m%d").date().isoformat()
+        parts.pop("WKST", None)
+        if parts:
+            raise ValueError(f"unsupported RRULE parts: {', '.join(sorted(parts))}")
+        # A start in the past makes no difference from now on.
+        if start.date() > datetime.date.today():
+            spec["from"] = start.date().isoformat()
+    else:
+        spec["on"] = start.date().isoformat()
+    if "X-CLOCK-EVERY" in event:
+        spec["every"] = int(event["X-CLOCK-EVERY"][0])
+        if "X-CLOCK-UNTIL" in event:
+            spec["until"] = parse_time(event["X-CLOCK-UNTIL"][0])
+    flags = 0 if event.get("STATUS", ("",))[0].upper() == "CANCELLED" else ENABLED
+    return AlarmRecord(alarm_id, minute, flags, compile_rule(minute, spec))
+
+
+def read_ics(lines, ids):
+    # Every VEVENT becomes an alarm; other components are skipped.
+    event, first = None, 0
+    for number, line in unfold(lines):
+        name, _, value = line.partition(":")
+        name, *params = name.split(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event, first = {}, number
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            try:
+                yield from_event(next(ids), event)
+            except (KeyError, ValueError) as error:
+                raise ValueError(f"line {first}: {error}") from None
+            event = None
+        elif event is not None:
+            # Parameter names are case-insensitive, but values such as a
+            # TZID are not; quotes around a value are dropped.
+            pairs = (param.split("=", 1) for param in params if "=" in param)
+            event[name] = (value, {key.upper(): text.strip('"') for key, text in pairs})
+
+
+def write_ics(f, records):
+    # Alarms as daily or weekly events starting today, or on their first
+    # date. Lines end in CRLF as RFC 5545 asks.
+    today = datetime.date.today()
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//CCU Software//Clock//EN\r\n")
+    for record in records:
+        rule, spec = record.rule, record.rule.spec
+        day = datetime.date.fromordinal(rule.first) if rule.first is not None else today
+        hour, minute = divmod(record.minute, 60)
+        lines = ["BEGIN:VEVENT", f"UID:alarm-{record.id}-{stamp}@clock", f"DTSTAMP:{stamp}",
+                 f"DTSTART:{day:%Y%m%d}T{hour:02}{minute:02}00", f"SUMMARY:Alarm {record.label()}"]
+        if not rule.once:
+            rrule = "FREQ=DAILY"
+            if rule.days != EVERY_DAY:
+                rrule = "FREQ=WEEKLY;BYDAY=" + ",".join(code for bit, code in enumerate(ICS_DAYS) if rule.days >> bit & 1)
+            if rule.last is not None:
+                rrule += f";UNTIL={datetime.date.fromordinal(rule.last):%Y%m%d}T235959"
+            lines.append("RRULE:" + rrule)
+        if "every" in spec:
+            lines.append(f"X-CLOCK-EVERY:{spec['every']}")
+            if "until" in spec:
+                lines.append(f"X-CLOCK-UNTIL:{format_time(spec['until'])}")
+        if not record.flags & ENABLED:
+            lines.append("STATUS:CANCELLED")
+        lines.append("END:VEVENT")
+        f.write("\r\n".join(lines) + "\r\n")
+    f.write("END:VCALENDAR\r\n")
+
+
+FORMATS = {".csv": (read_csv, write_csv), ".ics": (read_ics, write_ics)}
+
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"{os.path.basename(path)} is not a .csv or .ics file")
+    return FORMATS[extension]
+
+
+def read(path, ids):
+    # Yield an AlarmRecord for each alarm in the CSV or .ics file at 'path',
+    # numbered from the iterator 'ids'. Raises ValueError naming the line of
+    # the first invalid alarm.
+    reader = file_format(path)[0]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from reader(f, ids)
+
+
+def export(path, records):
+    # Write 'records' to 'path' as CSV or .ics, going by its extension.
+    writer = file_format(path)[1]
+    with atomic_file(path, newline="", encoding="utf-8") as f:
+        writer(f, records)
@@ -0,0 +1,69 @@
+# Notices when the engine's loop has not been running as planned: stalls,
+# where a wakeup comes late by the monotonic clock, and jumps between the
+# wall clock and time.monotonic(), where the machine was suspended (the
+# monotonic clock stops while it sleeps) or the clock was set. Drivers sleep
+# on the monotonic clock, so neither case would otherwise show up until the
+# next planned wakeup.
+import time
+
+from metrics import Metrics
+
+# A wakeup this many seconds late counts as a stall.
+STALL = 1.0
+
+# The wall clock moving this many seconds more or less than the monotonic
+# clock between two wakeups counts as a jump.
+JUMP = 2.0
+
+# Longest a driver sleeps while anything is pending, so a resume or a
+# clock change is noticed within this many seconds.
+PERIOD = 60
+
+
+class Watchdog:
+    # The engine calls expect() with each delay it hands a driver and
+    # check() as it wakes. Gaps go into 'metrics', in milliseconds, as
+    # "stall" and "clock jump".
+    def __init__(self, now=time.time, monotonic=time.monotonic, metrics=None):
+        self.now = now
+        self.monotonic = monotonic
+        self.metrics = Metrics() if metrics is None else metrics
+        self.last = None # (wall, monotonic) time of the last check
+        self.expected = None # monotonic time of the next planned wakeup
+        self.stalls = 0
+        self.jumps = 0
+        self.last_gap = None # (kind, seconds, wall time it was noticed)
+
+    def expect(self, delay):
+        self.expected = None if delay is None else self.monotonic() + delay
+
+    def check(self):
+        # Return the gaps found since the last check as (kind, seconds)
+        # pairs: "stall" for a late wakeup, "forward" for the wall clock
+        # getting ahead (a suspend, or the clock set forward) and "back" for
+        # the clock set back.
+        wall, mono = self.now(), self.monotonic()
+        gaps = []
+        if self.expected is not None and mono - self.expected > STALL:
+            self.stalls += 1
+            gaps.append(("stall", mono - self.expected))
+            self.metrics.record("stall", (mono - self.expected) * 1000)
+        if self.last is not None:
+            skew = (wall - self.last[0]) - (mono - self.last[1])
+            if abs(skew) > JUMP:
+                self.jumps += 1
+                gaps.append(("forward" if skew > 0 else "back", abs(skew)))
+                self.metrics.record("clock jump", abs(skew) * 1000)
+        if gaps:
+            self.last_gap = (*gaps[-1], wall)
+        self.last = (wall, mono)
+        self.expected = None
+        return gaps
+
+    def stats(self):
+        stats = {"stalls": self.stalls, "clock_jumps": self.jumps}
+        if self.last_gap is not None:
+            kind, seconds, at = self.last_gap
+            stats["last_gap"] = {"kind": kind, "seconds": round(seconds, 3),
+                                 "at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(at))}
+        return stats
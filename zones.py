@@ -0,0 +1,98 @@
+# Local time in many time zones at once, for the world clock page. Each
+# zone's UTC offset changes are worked out ahead of time, a year at a time,
+# and kept, so telling the time in a zone is an integer add of its current
+# offset until the next change comes up.
+import bisect, datetime, functools
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DAY = 86400
+
+
+def at(zone, t):
+    # (UTC offset in seconds, abbreviation) of 'zone' at timestamp 't'.
+    local = datetime.datetime.fromtimestamp(t, zone)
+    return int(local.utcoffset().total_seconds()), local.tzname()
+
+
+@functools.lru_cache(maxsize=None)
+def transitions(key, year):
+    # The offset changes of zone 'key' during UTC year 'year', as a tuple of
+    # their timestamps and a tuple of (offset, abbreviation) from each one
+    # on. The first entry is the start of the year. Changes are found by
+    # checking the zone once a day and bisecting to the second, so two
+    # changes less than a day apart are missed; no zone has those.
+    zone = ZoneInfo(key)
+    start = int(datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    end = int(datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    times, offsets = [start], [at(zone, start)]
+    for t in range(start + DAY, end + 1, DAY):
+        current = at(zone, t)
+        if current != offsets[-1]:
+            low, high = t - DAY, t
+            while high - low > 1:
+                middle = (low + high) // 2
+                if at(zone, middle) == offsets[-1]:
+                    low = middle
+                else:
+                    high = middle
+            times.append(high)
+            offsets.append(at(zone, high))
+    return tuple(times), tuple(offsets)
+
+
+def zone_label(key):
+    # "America/New_York" -> "New York".
+    return key.rsplit("/", 1)[-1].replace("_", " ")
+
+
+class ZoneClock:
+    # The time in one zone. local() only looks the offset up again once the
+    # timestamp leaves the stretch it was found for.
+    __slots__ = ("key", "label", "offset", "abbreviation", "since", "until")
+
+    def __init__(self, key):
+        # Raises ValueError if there is no zone called 'key'.
+        try:
+            ZoneInfo(key)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown time zone {key!r}") from None
+        self.key = key
+        self.label = zone_label(key)
+        self.offset = 0
+        self.abbreviation = ""
+        self.since = self.until = 0
+
+    def local(self, now):
+        # Seconds since the epoch on this zone's wall clock at integer
+        # UTC timestamp 'now'.
+        if not self.since <= now < self.until:
+            self.seek(now)
+        return now + self.offset
+
+    def seek(self, now):
+        year = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).year
+        times, offsets = transitions(self.key, year)
+        i = bisect.bisect_right(times, now) - 1
+        self.offset, self.abbreviation = offsets[i]
+        self.since = times[i]
+        if i + 1 < len(times):
+            self.until = times[i + 1]
+        else:
+            self.until = int(datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+
+def clocks(keys):
+    # ZoneClocks for the zone names in 'keys', and the names that aren't zones.
+    found, unknown = [], []
+    for key in keys:
+        try:
+            found.append(ZoneClock(key))
+        except ValueError:
+            unknown.append(key)
+    return found, unknown
+
+
+def format_local(local):
+    # "07:30:05 PM" for a local timestamp, like the Clock page.
+    hour, rest = divmod(local % DAY, 3600)
+    return f"{hour % 12 or 12:02}:{rest // 60:02}:{rest % 60:02} {'PM' if hour >= 12 else 'AM'}"